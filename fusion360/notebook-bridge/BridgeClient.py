@@ -0,0 +1,228 @@
+"""
+HTTP client the notebook bridge uses to talk to the backend server.
+Connections are kept alive and pooled per host, so the bridge reuses one
+socket to localhost:3000 instead of opening a new one for every poll.
+"""
+
+import http.client
+import json
+import random
+import threading
+import time
+import typing
+import urllib.error
+import urllib.parse
+from email.message import Message
+
+from typing import Optional
+
+# Response class and request function are adapted from Jonathan Bowman's
+# Post on dev.to (https://dev.to/bowmanjd/http-calls-in-python-without-requests-or-other-external-dependencies-5aj1)
+class Response(typing.NamedTuple):
+    body: str
+    headers: Message
+    status: int
+    error_count: int = 0
+
+    def json(self) -> typing.Any:
+        try:
+            output = json.loads(self.body)
+        except json.JSONDecodeError:
+            output = ""
+        return output
+
+
+def isStaleConnection(error: Exception) -> bool:
+    """Whether error is the server having closed an idle connection."""
+    return isinstance(error, (http.client.RemoteDisconnected, ConnectionResetError,
+                              ConnectionAbortedError, BrokenPipeError))
+
+
+class ConnectionPool:
+    """Idle keep-alive connections, keyed by (scheme, host, port)."""
+
+    def __init__(self, maxIdlePerHost: int = 4):
+        self.maxIdlePerHost = maxIdlePerHost
+        self.idle: typing.Dict[tuple, typing.List[http.client.HTTPConnection]] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key: tuple, connectTimeout: Optional[float]) -> http.client.HTTPConnection:
+        with self.lock:
+            idle = self.idle.get(key)
+            conn = idle.pop() if idle else None
+        scheme, host, port = key
+        if conn is None:
+            if scheme == 'https':
+                return http.client.HTTPSConnection(host, port, timeout=connectTimeout)
+            return http.client.HTTPConnection(host, port, timeout=connectTimeout)
+        conn.timeout = connectTimeout
+        return conn
+
+    def release(self, key: tuple, conn: http.client.HTTPConnection):
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.maxIdlePerHost:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures to reach the server. After each failure the
+    next attempt is pushed back by an exponentially growing, jittered delay;
+    after failureThreshold failures in a row the breaker opens and requests
+    are skipped until the delay elapses, when one probe is let through.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failureThreshold: int = 3, baseDelay: float = 1.0, maxDelay: float = 60.0):
+        self.failureThreshold = failureThreshold
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.retryAt = 0.0
+        self.lock = threading.Lock()
+
+    def allowRequest(self) -> bool:
+        with self.lock:
+            if time.monotonic() < self.retryAt:
+                return False
+            if self.state == CircuitBreaker.OPEN:
+                self.state = CircuitBreaker.HALF_OPEN
+            return True
+
+    def recordSuccess(self):
+        with self.lock:
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+            self.retryAt = 0.0
+
+    def recordFailure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.failureThreshold:
+                self.state = CircuitBreaker.OPEN
+            delay = min(self.maxDelay, self.baseDelay * 2 ** (self.failures - 1))
+            self.retryAt = time.monotonic() + delay / 2 + random.uniform(0, delay / 2)
+
+    def secondsUntilRetry(self) -> float:
+        with self.lock:
+            return max(0.0, self.retryAt - time.monotonic())
+
+
+pool = ConnectionPool()
+
+# Defaults used when a caller does not pass its own timeouts.
+CONNECT_TIMEOUT = 2.0
+READ_TIMEOUT = 10.0
+
+def request(
+    url: str,
+    data: typing.Union[dict, bytes] = {},
+    params: dict = {},
+    headers: dict = {},
+    method: str = "GET",
+    data_as_json: bool = True,
+    error_count: int = 0,
+    timeout: Optional[float] = READ_TIMEOUT,
+    connect_timeout: Optional[float] = CONNECT_TIMEOUT,
+    breaker: Optional[CircuitBreaker] = None,
+) -> Optional[Response]:
+    """
+    Returns None if the server could not be reached, or if breaker is given
+    and is holding requests back. timeout bounds each read from the socket.
+    data given as bytes is sent as-is, as application/octet-stream unless
+    headers say otherwise.
+    """
+    if not url.casefold().startswith("http"):
+        raise urllib.error.URLError("Incorrect and possibly insecure protocol in url")
+    method = method.upper()
+    request_data = None
+    headers = headers or {}
+    data = data or {}
+    params = params or {}
+    headers = {"Accept": "application/json", **headers}
+
+    if method == "GET" and not isinstance(data, bytes):
+        params = {**params, **data}
+        data = {}
+
+    if params:
+        url += "?" + urllib.parse.urlencode(params, doseq=True, safe="/")
+
+    if isinstance(data, bytes):
+        request_data = data
+        headers.setdefault("Content-Type", "application/octet-stream")
+    elif data:
+        if data_as_json:
+            request_data = json.dumps(data).encode()
+            headers["Content-Type"] = "application/json; charset=UTF-8"
+        else:
+            request_data = urllib.parse.urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+    parts = urllib.parse.urlsplit(url)
+    key = (parts.scheme.lower(), parts.hostname, parts.port)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    # A pooled connection may have been closed by the server while idle, in
+    # which case we find out on first use and retry once on a fresh one.
+    # Only a reset before any of the response arrived means that; after a
+    # timeout or a partial response the server may have acted on the
+    # request, so it is not sent again.
+    if breaker and not breaker.allowRequest():
+        return None
+    for attempt in range(2):
+        conn = pool.acquire(key, connect_timeout)
+        reused = conn.sock is not None
+        responded = False
+        try:
+            if not reused:
+                conn.connect()
+            conn.sock.settimeout(timeout)
+            conn.request(method, path, body=request_data, headers=headers)
+            httpresponse = conn.getresponse()
+            responded = True
+            body = httpresponse.read()
+        except (http.client.HTTPException, OSError) as error:
+            conn.close()
+            if reused and attempt == 0 and not responded and isStaleConnection(error):
+                continue
+            if breaker:
+                breaker.recordFailure()
+            return None
+        break
+    if breaker:
+        breaker.recordSuccess()
+
+    if httpresponse.will_close:
+        conn.close()
+    else:
+        pool.release(key, conn)
+
+    if httpresponse.status >= 400:
+        return Response(
+            body=str(httpresponse.reason),
+            headers=httpresponse.headers,
+            status=httpresponse.status,
+            error_count=error_count + 1,
+        )
+    return Response(
+        headers=httpresponse.headers,
+        status=httpresponse.status,
+        body=body.decode(httpresponse.headers.get_content_charset("utf-8")),
+    )
@@ -1,9 +1,20 @@
 import adsk.core, adsk.fusion, traceback
+import json
+import math
 from adsk.fusion import Design, Occurrence, Component, BRepBody
 from adsk.core import UserInterface, ValueInput
+from .EntityIndex import entityIndex
+from .LayoutEngine import Part, Placement, packParts
+from .StockContext import (
+    Bounds, OUTER_SKETCH, OUTER_EXTRUDE, TAB_SKETCH, TAB_EXTRUDE, DOWEL_PLANE, DOWEL_SKETCH, DOWEL_HOLES,
+)
+from . import config
 
-offset = 1.8
-tabLength = 0.5
+CM_PER_INCH = 2.54
+
+# Attribute on the dowel hole feature listing the entity tokens of the
+# sketch points the holes sit on, in dowelPoints order.
+DOWEL_POINTS_ATTRIBUTE = ('Tandem', 'dowelPoints')
 
 # define common tools
 app = adsk.core.Application.get()
@@ -12,138 +23,184 @@ design = adsk.fusion.Design.cast(app.activeProduct)
 activeSelection = adsk.fusion.Design.cast(design)
 
 
-def createOuter():
-    try:
-        # define common tools
-        app = adsk.core.Application.get()
-        ui = app.userInterface
-        design = adsk.fusion.Design.cast(app.activeProduct)
-        activeSelection = adsk.fusion.Design.cast(design)
-
-        # Get the root component of the active design.
-        zDistance = design.userParameters.itemByName('artifactHeight')
-        # body:adsk.fusion.Occurrence = recursivelyFindbRepBodies(activeSelection.activeOccurrence, 'artifact')
-        # body.boundingBox
-        body = recursivelyFindbRepBodies(activeSelection.rootComponent, "artifact")
-        minP = body.boundingBox.minPoint
-        maxP = body.boundingBox.maxPoint
-        minP.set(minP.x - tabLength, minP.y - tabLength, minP.z)
-        maxP.set(maxP.x + tabLength, maxP.y + tabLength, maxP.z)
-        
-        setUserParamter(design, "artifactHeight", maxP.z - minP.z, 'inch')
-            
-        zDistance = design.userParameters.itemByName('artifactHeight').value
-
-        # sketches = rootComp.sketches
-        xyPlane = activeSelection.rootComponent.xYConstructionPlane
-        sketch = activeSelection.rootComponent.sketches.add(xyPlane)
-        lines = sketch.sketchCurves.sketchLines
-        
-        linesListInner = lines.addTwoPointRectangle(adsk.core.Point3D.create(minP.x, minP.y, 0), adsk.core.Point3D.create(maxP.x, maxP.y, 0))
-        linesListOuter = lines.addTwoPointRectangle(
-            adsk.core.Point3D.create(minP.x-offset, minP.y-offset, 0), adsk.core.Point3D.create((maxP.x+offset), (maxP.y+offset), 0))  
-        
+def drawOuter(context, sketch, openings=None):
+    """ The opening around each padded artifact, filleted, inside a
+    rectangle jigOffset larger than all of them. """
+    bounds = context.bounds
+    offset = context.value('jigOffset')
+    lines = sketch.sketchCurves.sketchLines
+    for opening in openings or [bounds]:
+        linesListInner = lines.addTwoPointRectangle(adsk.core.Point3D.create(opening.minX, opening.minY, 0), adsk.core.Point3D.create(opening.maxX, opening.maxY, 0))
         filletLinesList(linesListInner, sketch)
+    lines.addTwoPointRectangle(
+        adsk.core.Point3D.create(bounds.minX - offset, bounds.minY - offset, 0), adsk.core.Point3D.create(bounds.maxX + offset, bounds.maxY + offset, 0))
 
-        # Define that the extent input.
-        extrudes = activeSelection.rootComponent.features.extrudeFeatures
-        prof = sketch.profiles.item(0)
-        
-        zDistanceValueInput = adsk.core.ValueInput.createByReal(zDistance)
-        
-        extInput = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-        extInput.setDistanceExtent(False, zDistanceValueInput)
 
-        # Create the extrusion.
-        ext = extrudes.add(extInput)
-        ext.bodies.item(0).name = "outer"
-        
-        # Get the end face of the extrusion
-        endFace = ext.endFaces.item(0)
-        startFace = ext.startFaces.item(0)
+def outerProfile(sketch):
+    """ The profile between the outer rectangle and the openings, which
+    is the one with a loop for every opening. """
+    return max(sketch.profiles, key=lambda profile: profile.profileLoops.count)
 
-    
-        return startFace, endFace
-    except:
-        if ui:
-            ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
-
-
-def createTab():
-    mainbody = recursivelyFindbRepBodies(activeSelection.rootComponent, "artifact")
-    minP = mainbody.boundingBox.minPoint
-    maxP = mainbody.boundingBox.maxPoint
-    minP.set(minP.x - tabLength, minP.y - tabLength, minP.z)
-    maxP.set(maxP.x + tabLength, maxP.y + tabLength, maxP.z)
-    
-    
+
+def tabSize(bounds):
+    """ Width of the tabs on the x and y sides, their height and bottom. """
     # tabX = min(maxP.x/20, 1)
     # tabY = min(maxP.y/20, 1)
     # tabZ = maxP.z/12 * 7
-    tabZ = (maxP.z - minP.z) / 16 * 2
-    tabX = min((maxP.x - minP.x)/8, tabZ*5)
-    tabY = min((maxP.y - minP.y)/8, tabZ*5)
+    tabZ = bounds.height / 16 * 2
+    tabX = min(bounds.width/8, tabZ*5)
+    tabY = min(bounds.depth/8, tabZ*5)
     tabZ = max(tabZ, tabY/10, tabX/10)
-    midX = (minP.x + maxP.x)/2
-    midY = (minP.y + maxP.y)/2
-    midZ = (minP.z + maxP.z)/2
-
-    # # createTabNegativeYZ(tabY, tabZ, mainbody)
-    def createTabYZ(tabY:float, tabZ:float, mainbody:BRepBody, startFrom:float):
-        planes = activeSelection.rootComponent.constructionPlanes
-        yzPlane = activeSelection.rootComponent.yZConstructionPlane
-        #create a new sketch
-        planeInput = planes.createInput()
-        planeInput.setByOffset(yzPlane, ValueInput.createByReal(startFrom))
-        offsetPlane = planes.add(planeInput)
-        offsetSketch = activeSelection.rootComponent.sketches.add(offsetPlane)
-        lines = offsetSketch.sketchCurves.sketchLines
-        #locate the center of profile
-        yPos = midY
-        zPos = midZ
-        lines.addTwoPointRectangle(adsk.core.Point3D.create(-(zPos - tabZ/2), yPos - tabY/2, 0), adsk.core.Point3D.create(-(zPos + tabZ/2), yPos + tabY/2, 0))
-        # set up extrusion
-        extrudes = activeSelection.rootComponent.features.extrudeFeatures
-        prof = offsetSketch.profiles.item(offsetSketch.profiles.count - 1)
-        if startFrom == maxP.x:
-            extrudeResult = extrudes.addSimple(prof, ValueInput.createByReal(-(maxP.x - minP.x)/10), adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-        else:
-            extrudeResult = extrudes.addSimple(prof, ValueInput.createByReal((maxP.x - minP.x)/10), adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-        extrudeBody = extrudeResult.bodies.item(0)
-        extrudeBody.name = "tab"
-
-    def createTabXZ(tabX:float, tabZ:float, mainbody:BRepBody, startFrom:float):
-        planes = activeSelection.rootComponent.constructionPlanes
-        xzPlane = activeSelection.rootComponent.xZConstructionPlane
-        #create a new sketch
-        planeInput = planes.createInput()
-        planeInput.setByOffset(xzPlane, ValueInput.createByReal(startFrom))
-        offsetPlane = planes.add(planeInput)
-        offsetSketch = activeSelection.rootComponent.sketches.add(offsetPlane)
-        lines = offsetSketch.sketchCurves.sketchLines
-        #locate the center of profile
-        xPos = midX
-        zPos = midZ
-        lines.addTwoPointRectangle(adsk.core.Point3D.create((xPos - tabX/2), -(zPos - tabZ/2), 0), adsk.core.Point3D.create((xPos + tabX/2), -(zPos + tabZ/2), 0))
-        # # set up extrusion
-        extrudes = activeSelection.rootComponent.features.extrudeFeatures
-        prof = offsetSketch.profiles.item(offsetSketch.profiles.count - 1)
-        if startFrom == maxP.y:
-            extrudeResult = extrudes.addSimple(prof, ValueInput.createByReal(-(maxP.y - minP.y)/10), adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
+    return tabX, tabY, tabZ, bounds.midZ - tabZ/2
+
+
+def drawTabs(context, sketch, sides, tabsPerSide):
+    """ One rectangle per tab. Returns the bottom and height of the tabs. """
+    bounds = context.bounds
+    tabX, tabY, tabZ, bottom = tabSize(bounds)
+    # how far each tab reaches in from its side
+    depthX = bounds.width/10
+    depthY = bounds.depth/10
+
+    lines = sketch.sketchCurves.sketchLines
+
+    def spread(low: float, high: float, width: float):
+        # keep tabs on the same side from touching each other
+        width = min(width, (high - low) / (2 * tabsPerSide))
+        return width, [low + (high - low) * (i + 1) / (tabsPerSide + 1) for i in range(tabsPerSide)]
+
+    for side in sides:
+        if side in ('+x', '-x'):
+            width, centers = spread(bounds.minY, bounds.maxY, tabY)
+            x0, x1 = (bounds.maxX - depthX, bounds.maxX) if side == '+x' else (bounds.minX, bounds.minX + depthX)
+            for y in centers:
+                lines.addTwoPointRectangle(adsk.core.Point3D.create(x0, y - width/2, 0), adsk.core.Point3D.create(x1, y + width/2, 0))
         else:
-            extrudeResult = extrudes.addSimple(prof, ValueInput.createByReal((maxP.y - minP.y)/10), adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-        extrudeBody = extrudeResult.bodies.item(0)
-        extrudeBody.name = "tab"
+            width, centers = spread(bounds.minX, bounds.maxX, tabX)
+            y0, y1 = (bounds.maxY - depthY, bounds.maxY) if side == '+y' else (bounds.minY, bounds.minY + depthY)
+            for x in centers:
+                lines.addTwoPointRectangle(adsk.core.Point3D.create(x - width/2, y0, 0), adsk.core.Point3D.create(x + width/2, y1, 0))
+    return bottom, tabZ
+
+
+def dowelPoints(context):
+    """ Where the four dowel holes go: halfway into the stock around the
+    opening, centred on each side. """
+    bounds = context.bounds
+    offset = context.value('jigOffset')
+    return [
+        adsk.core.Point3D.create(bounds.midX, bounds.minY - offset/2, 0),
+        adsk.core.Point3D.create(bounds.midX, bounds.maxY + offset/2, 0),
+        adsk.core.Point3D.create(bounds.minX - offset/2, bounds.midY, 0),
+        adsk.core.Point3D.create(bounds.maxX + offset/2, bounds.midY, 0),
+    ]
+
+
+def allProfiles(sketch):
+    profiles = adsk.core.ObjectCollection.create()
+    for profile in sketch.profiles:
+        profiles.add(profile)
+    return profiles
+
+
+def clearSketch(sketch):
+    curves = sketch.sketchCurves
+    for i in reversed(range(curves.count)):
+        curves.item(i).deleteMe()
+
 
-    createTabYZ(tabY, tabZ, mainbody, maxP.x)
-    createTabYZ(tabY, tabZ, mainbody, minP.x)
-    createTabXZ(tabX, tabZ, mainbody, minP.y)
-    createTabXZ(tabX, tabZ, mainbody, maxP.y)
+def createJigParameters(design: Design, context):
+    """ Add the jig's user parameters at their defaults, so they can be edited. """
+    for name in ('jigOffset', 'tabPadding'):
+        if design.userParameters.itemByName(name) is None:
+            design.userParameters.add(name, ValueInput.createByString(context.expression(name)), 'cm', '')
 
-def combineOuter():
+
+def createOuter(context, openings=None):
+    ''' Extrude the outer around the openings. Errors propagate, so the
+    caller's DesignTransaction rolls the jig back. '''
+    # define common tools
+    app = adsk.core.Application.get()
+    design = adsk.fusion.Design.cast(app.activeProduct)
+    activeSelection = adsk.fusion.Design.cast(design)
+
+    createJigParameters(design, context)
+    setUserParamter(design, "artifactHeight", context.bounds.height, 'inch')
+
+    # sketches = rootComp.sketches
+    xyPlane = activeSelection.rootComponent.xYConstructionPlane
+    sketch = activeSelection.rootComponent.sketches.add(xyPlane)
+    sketch.name = OUTER_SKETCH
+    drawOuter(context, sketch, openings)
+
+    # Define that the extent input.
+    extrudes = activeSelection.rootComponent.features.extrudeFeatures
+    prof = outerProfile(sketch)
+    
+    # The height follows artifactHeight.
+    zDistanceValueInput = adsk.core.ValueInput.createByString('artifactHeight')
+    
+    extInput = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
+    extInput.setDistanceExtent(False, zDistanceValueInput)
+
+    # Create the extrusion.
+    ext = extrudes.add(extInput)
+    ext.name = OUTER_EXTRUDE
+    ext.bodies.item(0).name = "outer"
+    
+    # Get the end face of the extrusion
+    endFace = ext.endFaces.item(0)
+    startFace = ext.startFaces.item(0)
+
+    
+    return startFace, endFace
+
+
+def createTab(context, sides=None, tabsPerSide=None, openings=None):
+    ''' Add retention tabs around the artifact in one sketch and one extrude.
+    sides picks which of '+x', '-x', '+y' and '-y' get tabs, each with
+    tabsPerSide tabs spread evenly along it. With openings, every opening
+    gets tabs; openings whose tabs span different heights get a sketch and
+    extrude each. Returns the tab bodies. '''
+    sides = config.TAB_SIDES if sides is None else sides
+    tabsPerSide = config.TABS_PER_SIDE if tabsPerSide is None else tabsPerSide
+
+    # Tabs spanning the same heights are rectangles in one sketch on the
+    # XY plane, extruded together from the tab bottom.
+    byHeights = {}
+    for opening in openings or [context.bounds]:
+        tabZ, bottom = tabSize(opening)[2:]
+        byHeights.setdefault((round(bottom, 4), round(tabZ, 4)), []).append(opening)
+
+    extrudes = activeSelection.rootComponent.features.extrudeFeatures
+    tabs = []
+    for group in byHeights.values():
+        sketch = activeSelection.rootComponent.sketches.add(activeSelection.rootComponent.xYConstructionPlane)
+        sketch.name = TAB_SKETCH
+        for opening in group:
+            bottom, tabZ = drawTabs(context._replace(bounds=opening), sketch, sides, tabsPerSide)
+        profiles = allProfiles(sketch)
+        if profiles.count == 0:
+            continue
+        extInput = extrudes.createInput(profiles, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
+        extInput.startExtent = adsk.fusion.OffsetStartDefinition.create(ValueInput.createByReal(bottom))
+        extInput.setDistanceExtent(False, ValueInput.createByReal(tabZ))
+        ext = extrudes.add(extInput)
+        ext.name = TAB_EXTRUDE
+        for body in ext.bodies:
+            body.name = "tab"
+            tabs.append(body)
+    return tabs
+
+def combineOuter(tabs=None):
     combineFeatures = design.activeComponent.features.combineFeatures
     targetBody = recursivelyFindbRepBodies(activeSelection.rootComponent, "artifact")
-    toolBodies = FindTabs(activeSelection.rootComponent)
+    if tabs is None:
+        toolBodies = FindTabs(activeSelection.rootComponent)
+    else:
+        toolBodies = adsk.core.ObjectCollection.create()
+        for tab in tabs:
+            toolBodies.add(tab)
     combineFeatureInput = combineFeatures.createInput(targetBody, toolBodies)
     combineFeatureInput.operation = 0
     combineFeatureInput.isKeepToolBodies = False
@@ -156,53 +213,199 @@ def combineOuter():
 
 
 
-def holeDrill(holeDrillingFace):
-    try:
-        # set up parameters
-        design = adsk.fusion.Design.cast(app.activeProduct)
-        dowelDiam = design.userParameters.itemByName('dowelDiam')
-        zDistance = design.userParameters.itemByName('artifactHeight')
-        body = recursivelyFindbRepBodies(activeSelection.rootComponent, 'artifact')
-        minP = body.boundingBox.minPoint
-        maxP = body.boundingBox.maxPoint
-        minP.set(minP.x - tabLength, minP.y - tabLength, minP.z)
-        maxP.set(maxP.x + tabLength, maxP.y + tabLength, maxP.z)
+def holeDrill(context, holeDrillingFace):
+    ''' Drill the dowel holes through the outer. Errors propagate, so the
+    caller's DesignTransaction rolls the jig back. '''
+    # Create a construction plane by offsetting the end face
+    planes = activeSelection.rootComponent.constructionPlanes
+    planeInput = planes.createInput()
+    offsetVal = adsk.core.ValueInput.createByString('artifactHeight')
+    xyPlane = activeSelection.rootComponent.xYConstructionPlane
+    planeInput.setByOffset(xyPlane, offsetVal)
+    offsetPlane = planes.add(planeInput)
+    offsetPlane.name = DOWEL_PLANE
+
+    # Create a sketch on the new construction plane and add four sketch points on it
+    offsetSketch = activeSelection.rootComponent.sketches.add(offsetPlane)
+    offsetSketch.name = DOWEL_SKETCH
+    offsetSketchPoints = offsetSketch.sketchPoints
+
+    # Add the four sketch points into a collection
+    ptColl = adsk.core.ObjectCollection.create()
+    sketchPoints = [offsetSketchPoints.add(point) for point in dowelPoints(context)]
+    for sketchPoint in sketchPoints:
+        ptColl.add(sketchPoint)
+
+     # Create a hole input
+    holes = activeSelection.rootComponent.features.holeFeatures
+    holeInput = holes.createSimpleInput(adsk.core.ValueInput.createByString('dowelDiam'))
+    holeInput.setPositionBySketchPoints(ptColl)
+    holeInput.setDistanceExtent(ValueInput.createByString('artifactHeight'))
     
-        # Create a construction plane by offsetting the end face
-        planes = activeSelection.rootComponent.constructionPlanes
-        planeInput = planes.createInput()
-        offsetVal = adsk.core.ValueInput.createByReal(zDistance.value)
-        xyPlane = activeSelection.rootComponent.xYConstructionPlane
-        planeInput.setByOffset(xyPlane, offsetVal)
-        offsetPlane = planes.add(planeInput)
-
-        # Create a sketch on the new construction plane and add four sketch points on it
-        offsetSketch = activeSelection.rootComponent.sketches.add(offsetPlane)
-        offsetSketchPoints = offsetSketch.sketchPoints
-
-        sPt0 = offsetSketchPoints.add(adsk.core.Point3D.create((maxP.x+minP.x)/2, minP.y-offset/2, 0))
-        sPt1 = offsetSketchPoints.add(adsk.core.Point3D.create((maxP.x+minP.x)/2, maxP.y+offset/2, 0))
-        sPt2 = offsetSketchPoints.add(adsk.core.Point3D.create(minP.x-offset/2, (maxP.y+minP.y)/2, 0))
-        sPt3 = offsetSketchPoints.add(adsk.core.Point3D.create(maxP.x+offset/2, (maxP.y+minP.y)/2, 0))
-
-        # Add the four sketch points into a collection
-        ptColl = adsk.core.ObjectCollection.create()
-        ptColl.add(sPt0)
-        ptColl.add(sPt1)
-        ptColl.add(sPt2)
-        ptColl.add(sPt3)
-
-         # Create a hole input
-        holes = activeSelection.rootComponent.features.holeFeatures
-        holeInput = holes.createSimpleInput(adsk.core.ValueInput.createByString(dowelDiam.expression))
-        holeInput.setPositionBySketchPoints(ptColl)
-        holeInput.setDistanceExtent(ValueInput.createByString(zDistance.expression))
-        
-        hole = holes.add(holeInput)
-        return hole.faces
-    except:
-        if ui:
-            ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+    hole = holes.add(holeInput)
+    hole.name = DOWEL_HOLES
+    hole.attributes.add(*DOWEL_POINTS_ATTRIBUTE, json.dumps([point.entityToken for point in sketchPoints]))
+    return hole.faces
+
+
+def dowelSketchPoints(holes, sketch) -> list:
+    ''' The sketch points the dowel holes sit on, in dowelPoints order '''
+    attribute = holes.attributes.itemByName(*DOWEL_POINTS_ATTRIBUTE)
+    if attribute is not None:
+        points = []
+        for token in json.loads(attribute.value):
+            found = design.findEntityByToken(token)
+            points.append(found[0] if found else None)
+        if None not in points:
+            return points
+    # Holes drilled before the tokens were kept: the points in the order
+    # they were added, after the sketch's origin point.
+    return [sketch.sketchPoints.item(i) for i in range(1, sketch.sketchPoints.count)
+            if not sketch.sketchPoints.item(i).isReference]
+
+
+def updateOuter(context, sides=None, tabsPerSide=None):
+    ''' Fit the existing outer, tabs and dowel holes to the artifact and
+    jig parameters in context, keeping the features. The heights follow
+    artifactHeight; the sketches are redrawn and the features repointed at
+    them. Returns the outer's bottom and top faces, the hole faces and
+    the tab bodies.
+
+    Edits already made stay if a later one fails; the design transaction
+    only deletes features it added. The fingerprint is not stored then,
+    so running create_outer again retries the whole update. '''
+    sides = config.TAB_SIDES if sides is None else sides
+    tabsPerSide = config.TABS_PER_SIDE if tabsPerSide is None else tabsPerSide
+    rootComponent = activeSelection.rootComponent
+    extrudes = rootComponent.features.extrudeFeatures
+    sketches = rootComponent.sketches
+    timeline = design.timeline
+
+    setUserParamter(design, "artifactHeight", context.bounds.height, 'inch')
+
+    outer = extrudes.itemByName(OUTER_EXTRUDE)
+    holes = rootComponent.features.holeFeatures.itemByName(DOWEL_HOLES)
+    if outer is None or holes is None:
+        raise RuntimeError('The jig was built before its features were named; delete it and run create_outer again')
+
+    try:
+        # A feature's profiles can only be changed with the timeline rolled
+        # back to just before it.
+        outer.timelineObject.rollTo(True)
+        sketch = sketches.itemByName(OUTER_SKETCH)
+        clearSketch(sketch)
+        drawOuter(context, sketch)
+        outer.profile = outerProfile(sketch)
+
+        tabs = []
+        tabExtrude = extrudes.itemByName(TAB_EXTRUDE)
+        if tabExtrude is not None:
+            tabExtrude.timelineObject.rollTo(True)
+            sketch = sketches.itemByName(TAB_SKETCH)
+            clearSketch(sketch)
+            bottom, tabZ = drawTabs(context, sketch, sides, tabsPerSide)
+            tabExtrude.profile = allProfiles(sketch)
+            tabExtrude.startExtent.offset.value = bottom
+            tabExtrude.extentOne.distance.value = tabZ
+
+        holes.timelineObject.rollTo(True)
+        # The holes stay on the same sketch points, moved to their new places.
+        points = dowelSketchPoints(holes, sketches.itemByName(DOWEL_SKETCH))
+        for point, target in zip(points, dowelPoints(context)):
+            geometry = point.geometry
+            point.move(adsk.core.Vector3D.create(target.x - geometry.x, target.y - geometry.y, 0))
+    finally:
+        timeline.moveToEnd()
+
+    if tabExtrude is not None:
+        tabs = list(tabExtrude.bodies)
+    return outer.startFaces.item(0), outer.endFaces.item(0), holes.faces, tabs
+
+
+def moveToPlacement(entity, placement: Placement, padding: float) -> Bounds:
+    ''' Move a body or occurrence so that its bounding box, padded by
+    padding, lands on placement. Returns the padded box where it lands. '''
+    minP = entity.boundingBox.minPoint
+    maxP = entity.boundingBox.maxPoint
+    transform = adsk.core.Matrix3D.create()
+    if placement.rotated:
+        # A quarter turn about z takes (x, y) to (-y, x).
+        transform.setToRotation(math.pi/2, adsk.core.Vector3D.create(0, 0, 1), adsk.core.Point3D.create(0, 0, 0))
+        dx = placement.x + maxP.y + padding
+        dy = placement.y - (minP.x - padding)
+    else:
+        dx = placement.x - (minP.x - padding)
+        dy = placement.y - (minP.y - padding)
+    transform.translation = adsk.core.Vector3D.create(dx, dy, 0)
+
+    if entity.objectType == Occurrence.classType():
+        occurrenceTransform = entity.transform2
+        occurrenceTransform.transformBy(transform)
+        entity.transform2 = occurrenceTransform
+        if design.designType == adsk.fusion.DesignTypes.ParametricDesignType:
+            design.snapshots.add()
+    else:
+        # A body can only be moved by a feature of the component it is in,
+        # in that component's coordinates. Bodies found through an
+        # occurrence are proxies, with their boxes in root coordinates.
+        occurrence = entity.assemblyContext
+        if occurrence is not None:
+            toRoot = occurrence.transform2
+            toComponent = toRoot.copy()
+            toComponent.invert()
+            local = toRoot.copy()
+            local.transformBy(transform)
+            local.transformBy(toComponent)
+            transform = local
+            entity = entity.nativeObject
+        entities = adsk.core.ObjectCollection.create()
+        entities.add(entity)
+        moveFeatures = entity.parentComponent.features.moveFeatures
+        moveFeatures.add(moveFeatures.createInput(entities, transform))
+    return Bounds(placement.x, placement.y, minP.z, placement.maxX, placement.maxY, maxP.z)
+
+
+def nestBodies(context, names):
+    ''' Lay the named bodies out in the mainWorkpiece_x by mainWorkpiece_y
+    sheet and move them there. Returns a context whose bounds hold every
+    opening, and the opening of each body. '''
+    for name in ('mainWorkpiece_x', 'mainWorkpiece_y'):
+        if name not in context.parameters:
+            raise RuntimeError('Nesting needs the user parameter {}'.format(name))
+    entities = {}
+    for name in names:
+        entity = recursivelyFindbRepBodies(activeSelection.rootComponent, name)
+        if entity is None:
+            raise RuntimeError('No body named {}'.format(name))
+        entities[name] = entity
+
+    padding = context.value('tabPadding')
+    parts = []
+    for name, entity in entities.items():
+        box = entity.boundingBox
+        parts.append(Part(name, box.maxPoint.x - box.minPoint.x + 2 * padding, box.maxPoint.y - box.minPoint.y + 2 * padding))
+    # The border of the outer, which holds the dowels, stays on the sheet.
+    layout = packParts(
+        parts,
+        context.value('mainWorkpiece_x'),
+        context.value('mainWorkpiece_y'),
+        spacing=config.NEST_SPACING_INCHES * CM_PER_INCH,
+        margin=context.value('jigOffset'),
+        rotate=config.NEST_ROTATE,
+    )
+    if layout.unplaced:
+        raise RuntimeError('{} do not fit in the workpiece'.format(', '.join(layout.unplaced)))
+
+    openings = [moveToPlacement(entities[placement.name], placement, padding) for placement in layout.placements]
+    bounds = Bounds(
+        min(opening.minX for opening in openings),
+        min(opening.minY for opening in openings),
+        min(opening.minZ for opening in openings),
+        max(opening.maxX for opening in openings),
+        max(opening.maxY for opening in openings),
+        max(opening.maxZ for opening in openings),
+    )
+    return context._replace(bounds=bounds), openings
 
 
 def filletLinesList(linesList, sketch):
@@ -217,27 +420,12 @@ def filletLinesList(linesList, sketch):
 
 
 def recursivelyFindbRepBodies(rootComponent: Component, name: str):
-    for occurence in rootComponent.allOccurrences:
-        if(occurence.name == name):
-            return occurence
-        for bBody in occurence.bRepBodies:
-            if(bBody.name == name):
-                return bBody
-    for bBody in rootComponent.bRepBodies:
-        if(bBody.name == name):
-            return bBody
+    return entityIndex.find(rootComponent, name)
 
 def FindTabs(rootComponent: Component):
     tabCollection = adsk.core.ObjectCollection.create()
-    for occurrence in rootComponent.allOccurrences:
-        if "tab" in occurrence.name:
-            tabCollection.add(occurrence)
-        for bBody in occurrence.bRepBodies:
-            if "tab" in bBody.name:
-                tabCollection.add(bBody)
-    for bBody in rootComponent.bRepBodies:
-        if "tab" in bBody.name:
-            tabCollection.add(bBody)
+    for tab in entityIndex.findPrefix(rootComponent, "tab"):
+        tabCollection.add(tab)
     return tabCollection
         
 
@@ -0,0 +1,83 @@
+"""
+Builds a group of design features as one unit.
+
+Inside a DesignTransaction, Fusion defers computing the design, so adding
+a feature does not recompute the whole timeline; the design is computed
+once when the transaction commits. While computing is deferred, a new
+feature's bodies, faces and a sketch's profiles are not there to read, so
+a step that reads them is marked computed and runs with computing turned
+back on, which also computes what earlier steps deferred. If the build
+fails, every timeline object it added is deleted again. Edits to features
+that already existed are not undone. The time spent on each step and on
+the final compute is logged.
+
+    with DesignTransaction('create_outer') as transaction:
+        with transaction.step('layout'):
+            ...
+        with transaction.step('createOuter', computed=True):
+            ...
+"""
+
+import adsk.core, adsk.fusion
+import contextlib
+import time
+import typing
+
+from .lib import fusion360utils as futil
+
+
+class DesignTransaction:
+
+    def __init__(self, name: str, design: typing.Optional[adsk.fusion.Design] = None):
+        self.name = name
+        self.design = design or adsk.fusion.Design.cast(adsk.core.Application.get().activeProduct)
+        self.timings: typing.List[typing.Tuple[str, float]] = []
+
+    def __enter__(self) -> 'DesignTransaction':
+        timeline = self.design.timeline
+        self.startMarker = timeline.markerPosition
+        self.startCount = timeline.count
+        self.wasDeferred = self.design.isComputeDeferred
+        self.started = time.perf_counter()
+        self.design.isComputeDeferred = True
+        return self
+
+    @contextlib.contextmanager
+    def step(self, label: str, computed: bool = False):
+        """A timed step. A computed step runs with computing on, so it can
+        read the results of the features it adds."""
+        started = time.perf_counter()
+        if computed:
+            self.design.isComputeDeferred = False
+        try:
+            yield
+        finally:
+            if computed:
+                self.design.isComputeDeferred = True
+            self.timings.append((label, time.perf_counter() - started))
+
+    def __exit__(self, excType, exc, tb) -> bool:
+        if excType is not None:
+            self.rollBack()
+            self.design.isComputeDeferred = self.wasDeferred
+            self.log('rolled back after {}'.format(excType.__name__))
+            return False
+        # Turning deferral off computes everything added in one pass.
+        started = time.perf_counter()
+        self.design.isComputeDeferred = self.wasDeferred
+        self.timings.append(('compute', time.perf_counter() - started))
+        self.log('committed')
+        return False
+
+    def rollBack(self):
+        # Features are inserted at the marker, so what this transaction
+        # added sits right after where the marker was. Delete it last first.
+        timeline = self.design.timeline
+        added = timeline.count - self.startCount
+        for index in reversed(range(self.startMarker, self.startMarker + added)):
+            timeline.item(index).entity.deleteMe()
+
+    def log(self, outcome: str):
+        steps = ', '.join('{} {:.2f}s'.format(label, seconds) for label, seconds in self.timings)
+        futil.log('{} {} in {:.2f}s ({})'.format(
+            self.name, outcome, time.perf_counter() - self.started, steps))
@@ -0,0 +1,133 @@
+"""
+Name index over the occurrences and bodies of the active design.
+
+Looking an entity up by name used to walk allOccurrences and every
+bRepBodies collection through the Fusion API on each call. The index is
+built once per root and reused until the design changes: a Fusion command
+finishes, another document is activated, or the timeline grows or its
+marker moves (which also covers features the bridge adds itself).
+"""
+
+import adsk.core, adsk.fusion
+import bisect
+from typing import Optional
+
+
+class EntityIndex:
+
+    def __init__(self):
+        self.app = adsk.core.Application.get()
+        # (root type, root entity token) -> (sorted names, name -> entities in walk order)
+        self.indexes = {}
+        self.stamp = None
+        self.handlers = []
+
+    def connect(self):
+        """Invalidate the index whenever the user changes the design."""
+        commandTerminated = _InvalidateOnCommand(self)
+        self.app.userInterface.commandTerminated.add(commandTerminated)
+        documentActivated = _InvalidateOnDocument(self)
+        self.app.documentActivated.add(documentActivated)
+        self.handlers = [commandTerminated, documentActivated]
+
+    def disconnect(self):
+        if len(self.handlers) == 2:
+            self.app.userInterface.commandTerminated.remove(self.handlers[0])
+            self.app.documentActivated.remove(self.handlers[1])
+        self.handlers = []
+        self.invalidate()
+
+    def invalidate(self):
+        self.indexes = {}
+        self.stamp = None
+
+    def find(self, root, name: str):
+        """The first occurrence or body called name under root, or None."""
+        entities = self.lookup(root).get(name)
+        if entities and not entities[0].isValid:
+            self.invalidate()
+            entities = self.lookup(root).get(name)
+        return entities[0] if entities else None
+
+    def findPrefix(self, root, prefix: str) -> list:
+        """Every occurrence and body under root whose name starts with prefix."""
+        names, byName = self.index(root)
+        found = []
+        for i in range(bisect.bisect_left(names, prefix), len(names)):
+            if not names[i].startswith(prefix):
+                break
+            found.extend(byName[names[i]])
+        return [entity for entity in found if entity.isValid]
+
+    def lookup(self, root) -> dict:
+        return self.index(root)[1]
+
+    def index(self, root):
+        stamp = self.designStamp()
+        if stamp is None or stamp != self.stamp:
+            self.invalidate()
+            self.stamp = stamp
+        # Roots of the same type, such as two occurrences, each get their own.
+        key = (root.objectType, root.entityToken)
+        if key not in self.indexes:
+            byName = {}
+            if root.objectType == adsk.fusion.Occurrence.classType():
+                self.addOccurrence(byName, root)
+            else:
+                self.addComponent(byName, root)
+            self.indexes[key] = (sorted(byName), byName)
+        return self.indexes[key]
+
+    def addComponent(self, byName: dict, rootComponent: adsk.fusion.Component):
+        for occurrence in rootComponent.allOccurrences:
+            byName.setdefault(occurrence.name, []).append(occurrence)
+            for bBody in occurrence.bRepBodies:
+                byName.setdefault(bBody.name, []).append(bBody)
+        for bBody in rootComponent.bRepBodies:
+            byName.setdefault(bBody.name, []).append(bBody)
+
+    def addOccurrence(self, byName: dict, occurrence: adsk.fusion.Occurrence):
+        byName.setdefault(occurrence.name, []).append(occurrence)
+        bRepBodies = occurrence.bRepBodies
+        if bRepBodies:
+            for bBody in bRepBodies:
+                byName.setdefault(bBody.name, []).append(bBody)
+        childOccurrences = occurrence.childOccurrences
+        if childOccurrences:
+            for child in childOccurrences:
+                self.addOccurrence(byName, child)
+
+    def designStamp(self) -> Optional[tuple]:
+        doc = self.app.activeDocument
+        if doc is None:
+            return None
+        design = adsk.fusion.Design.cast(doc.products.itemByProductType('DesignProductType'))
+        if design is None:
+            return None
+        if design.designType != adsk.fusion.DesignTypes.ParametricDesignType:
+            # Direct modelling designs have no timeline to stamp, so we rely
+            # on the change events alone.
+            return (doc.creationId,)
+        timeline = design.timeline
+        return (doc.creationId, timeline.count, timeline.markerPosition)
+
+
+class _InvalidateOnCommand(adsk.core.ApplicationCommandEventHandler):
+    def __init__(self, entityIndex: EntityIndex):
+        super().__init__()
+        self.entityIndex = entityIndex
+
+    def notify(self, args):
+        self.entityIndex.invalidate()
+
+
+class _InvalidateOnDocument(adsk.core.DocumentEventHandler):
+    def __init__(self, entityIndex: EntityIndex):
+        super().__init__()
+        self.entityIndex = entityIndex
+
+    def notify(self, args):
+        self.entityIndex.invalidate()
+
+
+entityIndex = EntityIndex()
@@ -0,0 +1,120 @@
+"""
+Spindle speeds and feeds for each operation, derived from the tool
+catalogue and a material profile instead of fixed expressions.
+
+For every tool and operation pair:
+
+- the chip load and surface speed come from the tool's preset for the
+  material, falling back to the material profile scaled by diameter,
+- the spindle speed follows from the surface speed and diameter, within
+  the spindle's range,
+- the feed is spindle speed x flutes x chip load, raised to make up for
+  chip thinning at light radial engagement and capped at the machine's
+  maximum feed.
+
+Pairs are computed together as columns, one list per quantity. It does not
+use the Fusion API.
+"""
+
+import math
+import typing
+from typing import Optional
+
+from . import config
+from .ToolCatalogue import CatalogueTool, CataloguePreset
+
+
+class MaterialProfile(typing.NamedTuple):
+    name: str
+    presetPrefix: str            # tool presets for this material start with it
+    surfaceSpeed: float          # ft/min
+    chipLoadPerDiameter: float   # in per tooth, per inch of tool diameter
+    minChipLoad: float           # in per tooth
+    maxChipLoad: float           # in per tooth
+
+
+class OperationProfile(typing.NamedTuple):
+    radialEngagement: float   # fraction of the tool diameter
+    feedFactor: float         # e.g. slower for finishing passes
+
+
+class Cut(typing.NamedTuple):
+    spindleSpeed: float   # rpm
+    surfaceSpeed: float   # ft/min
+    feedCutting: float    # in/min
+
+
+MATERIALS = {
+    'foam': MaterialProfile('foam', 'foam', 1000, 0.052, 0.004, 0.02),
+    'wood': MaterialProfile('wood', 'wood', 500, 0.052, 0.002, 0.015),
+}
+
+OPERATIONS = {
+    'Bore1': OperationProfile(1.0, 1.0),
+    'Face1': OperationProfile(0.65, 1.0),
+    'Bore2': OperationProfile(1.0, 1.0),
+    'Pocket': OperationProfile(0.8, 1.0),
+    'Scallop': OperationProfile(0.1, 0.65),
+    'Adaptive2': OperationProfile(0.8, 1.0),
+}
+
+
+def materialPreset(tool: CatalogueTool, material: MaterialProfile) -> Optional[CataloguePreset]:
+    """The tool's most aggressive preset for the material."""
+    presets = [preset for preset in tool.presets
+               if preset.name.lower().startswith(material.presetPrefix) and preset.feedPerTooth > 0]
+    return max(presets, key=lambda preset: preset.feedPerTooth, default=None)
+
+
+def chipThinning(radialEngagement: float) -> float:
+    """Feed multiplier keeping the chip load at light radial engagement."""
+    if radialEngagement >= 0.5:
+        return 1.0
+    thickness = 2 * math.sqrt(radialEngagement - radialEngagement * radialEngagement)
+    return min(1 / thickness, config.MAX_CHIP_THINNING) if thickness > 0 else config.MAX_CHIP_THINNING
+
+
+def calculateCuts(
+    tools: typing.Sequence[CatalogueTool],
+    operations: typing.Sequence[OperationProfile],
+    materials: typing.Sequence[MaterialProfile],
+) -> typing.List[Cut]:
+    """The cut for each (tool, operation, material) row."""
+    presets = [materialPreset(tool, material) for tool, material in zip(tools, materials)]
+    diameters = [tool.diameter for tool in tools]
+    surfaceSpeeds = [
+        preset.surfaceSpeed if preset and preset.surfaceSpeed > 0 else material.surfaceSpeed
+        for preset, material in zip(presets, materials)
+    ]
+    chipLoads = [
+        preset.feedPerTooth if preset else
+        min(max(material.chipLoadPerDiameter * diameter, material.minChipLoad), material.maxChipLoad)
+        for preset, material, diameter in zip(presets, materials, diameters)
+    ]
+    # ft/min to rpm: v * 12 / (pi * d)
+    spindleSpeeds = [
+        min(max(speed * 12 / (math.pi * diameter), config.SPINDLE_MIN_RPM), config.SPINDLE_MAX_RPM)
+        for speed, diameter in zip(surfaceSpeeds, diameters)
+    ]
+    # Ball end mills engage along their curve, so thinning is left out.
+    thinning = [
+        1.0 if 'ball' in tool.type else chipThinning(operation.radialEngagement)
+        for tool, operation in zip(tools, operations)
+    ]
+    feeds = [
+        min(rpm * max(tool.fluteCount, 1) * chipLoad * factor * operation.feedFactor,
+            config.MAX_FEED_INCHES_PER_MINUTE)
+        for rpm, tool, chipLoad, factor, operation in zip(spindleSpeeds, tools, chipLoads, thinning, operations)
+    ]
+    return [
+        Cut(rpm, rpm * math.pi * diameter / 12, feed)
+        for rpm, diameter, feed in zip(spindleSpeeds, diameters, feeds)
+    ]
+
+
+def cutExpressions(cut: Cut) -> dict:
+    return {
+        'tool_spindleSpeed': '{:.1f} rpm'.format(cut.spindleSpeed),
+        'tool_surfaceSpeed': '{:.1f} ft/min'.format(cut.surfaceSpeed),
+        'tool_feedCutting': '{:.3f} in/min'.format(cut.feedCutting),
+    }
@@ -0,0 +1,119 @@
+"""
+Packs several parts into one sheet of stock so a single jig holds them all.
+
+Each part is the padded bounding box of a body, width along x and depth
+along y. Parts are placed on shelves, tallest first: a part goes on the
+first shelf with room for it, or starts a new shelf above the last one.
+Parts may be turned a quarter turn to lie with their long side along x.
+Neighbouring parts are kept spacing apart, leaving a wall of stock between
+their openings, and every part stays margin inside the sheet's edges,
+leaving room for the outer's border and its dowel holes.
+
+Lengths are in whatever unit the caller uses throughout. It does not use
+the Fusion API.
+"""
+
+import typing
+
+
+class Part(typing.NamedTuple):
+    name: str
+    width: float
+    depth: float
+
+
+class Placement(typing.NamedTuple):
+    name: str
+    # lower left corner of the part in the sheet
+    x: float
+    y: float
+    # size as placed, after any turn
+    width: float
+    depth: float
+    # turned a quarter turn counterclockwise
+    rotated: bool
+
+    @property
+    def maxX(self) -> float:
+        return self.x + self.width
+
+    @property
+    def maxY(self) -> float:
+        return self.y + self.depth
+
+
+class Layout(typing.NamedTuple):
+    placements: typing.Tuple[Placement, ...]
+    # names of the parts that did not fit
+    unplaced: typing.Tuple[str, ...]
+    sheetWidth: float
+    sheetDepth: float
+
+    def extent(self) -> typing.Optional[typing.Tuple[float, float, float, float]]:
+        """minX, minY, maxX and maxY around every placed part."""
+        if not self.placements:
+            return None
+        return (
+            min(placement.x for placement in self.placements),
+            min(placement.y for placement in self.placements),
+            max(placement.maxX for placement in self.placements),
+            max(placement.maxY for placement in self.placements),
+        )
+
+    @property
+    def utilization(self) -> float:
+        """Fraction of the sheet the placed parts cover."""
+        area = self.sheetWidth * self.sheetDepth
+        if area <= 0:
+            return 0.0
+        return sum(placement.width * placement.depth for placement in self.placements) / area
+
+
+class _Shelf:
+    def __init__(self, y: float, depth: float, x: float):
+        self.y = y
+        self.depth = depth
+        # where the next part on the shelf starts
+        self.x = x
+
+
+def orient(part: Part, rotate: bool, maxWidth: float) -> typing.Tuple[float, float, bool]:
+    """The part's width, depth and whether it is turned, long side along x
+    when that fits."""
+    if rotate and part.depth > part.width and part.depth <= maxWidth:
+        return part.depth, part.width, True
+    return part.width, part.depth, False
+
+
+def packParts(
+    parts: typing.Iterable[Part],
+    sheetWidth: float,
+    sheetDepth: float,
+    spacing: float = 0.0,
+    margin: float = 0.0,
+    rotate: bool = True,
+) -> Layout:
+    """Place as many parts as fit. Parts that do not fit are listed in the
+    layout's unplaced and left out."""
+    left, bottom = margin, margin
+    right, top = sheetWidth - margin, sheetDepth - margin
+    oriented = [(part,) + orient(part, rotate, right - left) for part in parts]
+    # Tallest first keeps each shelf's height close to its parts'.
+    oriented.sort(key=lambda item: (item[2], item[1]), reverse=True)
+
+    shelves: typing.List[_Shelf] = []
+    placements = []
+    unplaced = []
+    for part, width, depth, rotated in oriented:
+        shelf = next((shelf for shelf in shelves
+                      if depth <= shelf.depth and shelf.x + width <= right), None)
+        if shelf is None:
+            y = shelves[-1].y + shelves[-1].depth + spacing if shelves else bottom
+            if y + depth > top or left + width > right:
+                unplaced.append(part.name)
+                continue
+            shelf = _Shelf(y, depth, left)
+            shelves.append(shelf)
+        placements.append(Placement(part.name, shelf.x, shelf.y, width, depth, rotated))
+        shelf.x += width + spacing
+    return Layout(tuple(placements), tuple(unplaced), sheetWidth, sheetDepth)
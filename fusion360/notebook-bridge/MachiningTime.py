@@ -0,0 +1,101 @@
+"""
+Machining time of generated setups, estimated two independent ways:
+
+- fusionMachiningTime asks Fusion's CAM engine, per setup and per
+  operation. It must run on the main thread.
+- sbpMachiningTime replays the posted SBP program with the mill's
+  acceleration limits, which the CAM estimate ignores. It does not use
+  the Fusion API, so the bridge runs it off the main thread.
+
+All times are in seconds and distances in inches.
+"""
+
+import adsk.core, adsk.cam
+import math
+import typing
+
+from . import config
+from .SbpReader import Move, moveLength, readLines, readProgram, toolNumber
+
+CM_PER_INCH = 2.54
+
+
+def operationTime(cam: adsk.cam.CAM, operation) -> dict:
+    """Fusion's estimate for an operation, setup or collection of them."""
+    machiningTime = cam.getMachiningTime(
+        operation,
+        config.FEED_SCALE_PERCENT,
+        config.RAPID_FEED_INCHES_PER_MINUTE * CM_PER_INCH,
+        config.TOOL_CHANGE_SECONDS,
+    )
+    return {
+        'seconds': machiningTime.machiningTime,
+        'feedSeconds': machiningTime.totalFeedTime,
+        'rapidSeconds': machiningTime.totalRapidTime,
+        'feedDistance': machiningTime.feedDistance / CM_PER_INCH,
+        'rapidDistance': machiningTime.rapidDistance / CM_PER_INCH,
+        'toolChanges': machiningTime.toolChangeCount,
+    }
+
+
+def fusionMachiningTime(cam: adsk.cam.CAM, setup: adsk.cam.Setup) -> dict:
+    """The setup's total and each of its operations with a toolpath."""
+    report = operationTime(cam, setup)
+    report['operations'] = {
+        operation.name: operationTime(cam, operation)
+        for operation in setup.allOperations
+        if operation.hasToolpath
+    }
+    return report
+
+
+def rampSeconds(distance: float, speed: float, acceleration: float) -> float:
+    """Time to travel distance from rest to rest, accelerating to speed."""
+    if distance <= 0 or speed <= 0:
+        return 0.0
+    if acceleration <= 0:
+        return distance / speed
+    # Too short to reach speed: accelerate halfway, decelerate the rest.
+    if distance < speed * speed / acceleration:
+        return 2 * math.sqrt(distance / acceleration)
+    return distance / speed + speed / acceleration
+
+
+def acceleratedSeconds(move: Move) -> float:
+    horizontal, vertical = moveLength(move)
+    xySpeed, zSpeed = move.speed
+    return max(
+        rampSeconds(horizontal, xySpeed, config.ACCELERATION_XY),
+        rampSeconds(vertical, zSpeed, config.ACCELERATION_Z),
+    )
+
+
+def sbpMachiningTime(programPath: str) -> dict:
+    """Replay the program a move at a time, with every move starting and
+    ending at rest, which makes this an upper bound."""
+    feedSeconds = 0.0
+    rapidSeconds = 0.0
+    toolChanges = 0
+    tools: typing.Dict[str, float] = {}
+    tool = 'unknown'
+    for item in readProgram(readLines(programPath)):
+        if not isinstance(item, Move):
+            number = toolNumber(item)
+            if number is not None:
+                tool = str(number)
+                toolChanges += 1
+            continue
+        seconds = acceleratedSeconds(item)
+        tools[tool] = tools.get(tool, 0.0) + seconds
+        if item.rapid:
+            rapidSeconds += seconds
+        else:
+            feedSeconds += seconds
+    toolChangeSeconds = max(toolChanges - 1, 0) * config.TOOL_CHANGE_SECONDS
+    return {
+        'seconds': feedSeconds + rapidSeconds + toolChangeSeconds,
+        'feedSeconds': feedSeconds,
+        'rapidSeconds': rapidSeconds,
+        'toolChanges': toolChanges,
+        'tools': tools,
+    }
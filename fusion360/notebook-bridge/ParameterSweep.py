@@ -0,0 +1,286 @@
+"""
+Sweeps the stepdown, stepover, tolerance and feed of the face, pocket,
+scallop and adaptive operations for the shortest machining time.
+
+Each candidate on a small grid, bounded by the tool's geometry and the
+feeds in the tool library, is applied to the operation, generated and
+timed. The fastest candidate that meets the tolerance and scallop targets
+is kept and recorded, keyed by the operation, its tool and the size of the
+part, so SetupMaker starts similar parts from the recorded values. A sweep
+generates at most SWEEP_CANDIDATE_BUDGET candidates within
+SWEEP_TIME_BUDGET_SECONDS, over all its operations, and gives up on an
+operation at the first candidate that fails to generate.
+"""
+
+import adsk.core, adsk.cam
+import hashlib
+import itertools
+import json
+import math
+import os
+import threading
+import time
+import typing
+from typing import Optional
+
+from . import config
+from .EntityIndex import entityIndex
+from .MachiningTime import operationTime
+from .ToolCatalogue import ToolCatalogue
+
+recordsPath = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sweepRecords.json')
+
+CM_PER_INCH = 2.54
+
+
+class ToolLimits(typing.NamedTuple):
+    diameter: float      # in
+    fluteLength: float   # in
+    ballEnd: bool
+    maxFeed: Optional[float]   # in/min, from the library presets
+
+
+# For each operation, the parameters swept and the fractions of the tool
+# limit they are swept over. 'feed' is a fraction of the library's fastest
+# preset; 'tolerance' of the tolerance target.
+SWEEPS = {
+    'Face1': {
+        'maximumStepdown': ('fluteLength', (0.25, 0.5, 0.75)),
+        'stepover': ('diameter', (0.5, 0.65, 0.8)),
+        'tool_feedCutting': ('feed', (0.6, 0.8, 1.0)),
+    },
+    'Pocket': {
+        'maximumStepdown': ('fluteLength', (0.25, 0.5, 0.75)),
+        'optimalLoad': ('diameter', (0.2, 0.35, 0.5)),
+        'tolerance': ('tolerance', (0.5, 1.0)),
+        'tool_feedCutting': ('feed', (0.6, 0.8, 1.0)),
+    },
+    'Scallop': {
+        'stepover': ('diameter', (0.05, 0.1, 0.15, 0.2)),
+        'tolerance': ('tolerance', (0.5, 1.0)),
+        'tool_feedCutting': ('feed', (0.6, 0.8, 1.0)),
+    },
+    'Adaptive2': {
+        'maximumStepdown': ('fluteLength', (0.25, 0.5, 0.75)),
+        'optimalLoad': ('diameter', (0.2, 0.35, 0.5)),
+        'tolerance': ('tolerance', (0.5, 1.0)),
+        'tool_feedCutting': ('feed', (0.6, 0.8, 1.0)),
+    },
+}
+
+
+def scallopHeight(stepover: float, radius: float) -> float:
+    """Height of the ridge a ball of radius leaves between passes."""
+    if stepover >= 2 * radius:
+        return radius
+    return radius - math.sqrt(radius * radius - stepover * stepover / 4)
+
+
+def candidateGrid(operationName: str, limits: ToolLimits) -> typing.List[dict]:
+    """Expressions for every candidate that meets the targets, at most
+    SWEEP_MAX_CANDIDATES of them spread evenly over the grid."""
+    axes = []
+    for parameter, (limit, fractions) in SWEEPS.get(operationName, {}).items():
+        if limit == 'feed':
+            if not limits.maxFeed:
+                continue
+            values = ['{:.4g} in/min'.format(limits.maxFeed * f) for f in fractions]
+        elif limit == 'tolerance':
+            values = ['{:.4g} in'.format(config.SWEEP_TOLERANCE_TARGET_INCHES * f) for f in fractions]
+        else:
+            size = getattr(limits, limit)
+            values = ['{:.4g} in'.format(size * f) for f in fractions]
+        axes.append([(parameter, value) for value in values])
+
+    grid = []
+    for combination in itertools.product(*axes):
+        candidate = dict(combination)
+        if 'stepover' in candidate and limits.ballEnd:
+            stepover = float(candidate['stepover'].split()[0])
+            if scallopHeight(stepover, limits.diameter / 2) > config.SWEEP_SCALLOP_TARGET_INCHES:
+                continue
+        grid.append(candidate)
+    if len(grid) > config.SWEEP_MAX_CANDIDATES:
+        step = len(grid) / config.SWEEP_MAX_CANDIDATES
+        grid = [grid[int(i * step)] for i in range(config.SWEEP_MAX_CANDIDATES)]
+    return grid
+
+
+def partSignature(part) -> typing.List[float]:
+    """The part's size, rounded so that similar parts share records."""
+    if part is None:
+        return []
+    box = part.boundingBox
+    step = config.SWEEP_SIMILARITY_INCHES
+    return [round((high - low) / CM_PER_INCH / step) * step
+            for low, high in zip(box.minPoint.asArray(), box.maxPoint.asArray())]
+
+
+def toolDescription(tool: adsk.cam.Tool) -> str:
+    return tool.parameters.itemByName('tool_description').expression
+
+
+class SweepRecords:
+    """The chosen expressions per operation, tool and part size, saved as JSON."""
+
+    def __init__(self, path: str = recordsPath):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.records = json.load(f)
+        except (OSError, ValueError):
+            self.records = {}
+
+    @staticmethod
+    def key(operationName: str, toolDescription: str, signature: list) -> str:
+        return json.dumps([operationName, toolDescription, signature])
+
+    def get(self, operationName: str, toolDescription: str, signature: list) -> Optional[dict]:
+        record = self.records.get(self.key(operationName, toolDescription, signature))
+        return dict(record['expressions']) if record else None
+
+    def put(self, operationName: str, toolDescription: str, signature: list, expressions: dict, seconds: float):
+        with self.lock:
+            self.records[self.key(operationName, toolDescription, signature)] = {
+                'expressions': expressions,
+                'seconds': seconds,
+                'sweptAt': time.time(),
+            }
+            tmpPath = self.path + '.tmp'
+            try:
+                with open(tmpPath, 'w', encoding='utf-8') as f:
+                    json.dump(self.records, f, indent=1)
+                os.replace(tmpPath, self.path)
+            except OSError:
+                pass
+
+
+sweepRecords = SweepRecords()
+
+
+def sweptFingerprint(base: str, sweeps: dict, signature: list) -> str:
+    """base combined with the values recorded for each swept operation,
+    given as operation name to tool."""
+    recorded = [[name, sweepRecords.get(name, toolDescription(tool), signature)]
+                for name, tool in sorted(sweeps.items()) if name in SWEEPS]
+    return hashlib.sha1(json.dumps([base, recorded], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def toolLimits(tool: adsk.cam.Tool, catalogue: Optional[ToolCatalogue]) -> ToolLimits:
+    parameters = tool.parameters
+    # Lengths are in Fusion's internal centimeters.
+    diameter = parameters.itemByName('tool_diameter').value.value / CM_PER_INCH
+    fluteLength = parameters.itemByName('tool_fluteLength').value.value / CM_PER_INCH
+    maxFeed = None
+    description = toolDescription(tool)
+    entry = catalogue.first(description=description.strip("'")) if catalogue else None
+    if entry and entry.presets:
+        maxFeed = max(preset.cuttingFeed for preset in entry.presets) or None
+    return ToolLimits(diameter, fluteLength, 'ball' in parameters.itemByName('tool_type').expression, maxFeed)
+
+
+class SweepBudget:
+    """How many more candidates a sweep may generate, and until when."""
+
+    def __init__(self, candidates: int, seconds: float):
+        self.candidates = candidates
+        self.deadline = time.monotonic() + seconds
+
+    def take(self) -> bool:
+        """Spend one candidate, or False if the budget is used up."""
+        if self.candidates <= 0 or time.monotonic() >= self.deadline:
+            return False
+        self.candidates -= 1
+        return True
+
+
+def parameterValues(parameters, names) -> typing.List[float]:
+    return [parameters.itemByName(name).value.value for name in names]
+
+
+def sameValues(a: typing.List[float], b: typing.List[float]) -> bool:
+    return all(math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-9) for x, y in zip(a, b))
+
+
+def applyCandidate(parameters, expressions: dict):
+    for name, expression in expressions.items():
+        parameters.itemByName(name).expression = expression
+
+
+def generateAndTime(cam: adsk.cam.CAM, operation) -> Optional[float]:
+    future = cam.generateToolpath(operation)
+    while not future.isGenerationCompleted:
+        adsk.doEvents()
+        time.sleep(0.05)
+    if not operation.hasToolpath or not operation.isToolpathValid:
+        return None
+    return operationTime(cam, operation)['seconds']
+
+
+def sweepOperation(cam: adsk.cam.CAM, operation, catalogue: Optional[ToolCatalogue], signature: list, budget: SweepBudget) -> Optional[dict]:
+    """Leave the operation on its fastest candidate and record it. Returns
+    the chosen expressions, or None if no candidate beat the current ones."""
+    parameters = operation.parameters
+    grid = candidateGrid(operation.name, toolLimits(operation.tool, catalogue))
+    # Timing the current settings counts as a candidate.
+    if not grid or not budget.take():
+        return None
+    names = list(grid[0])
+    current = {name: parameters.itemByName(name).expression for name in names}
+    currentValues = parameterValues(parameters, names)
+    best, bestValues = current, currentValues
+    bestSeconds = generateAndTime(cam, operation)
+    # The values the operation's parameters are on, and those its toolpath
+    # was last generated from.
+    appliedValues = generatedValues = currentValues
+    for candidate in grid:
+        applyCandidate(parameters, candidate)
+        appliedValues = parameterValues(parameters, names)
+        if sameValues(appliedValues, currentValues):
+            # Already timed as the current settings.
+            continue
+        if not budget.take():
+            break
+        seconds = generateAndTime(cam, operation)
+        generatedValues = appliedValues
+        if seconds is None:
+            # Stop at the first candidate Fusion cannot generate rather
+            # than spend the budget on others likely to fail the same way.
+            break
+        if bestSeconds is None or seconds < bestSeconds:
+            best, bestValues, bestSeconds = candidate, appliedValues, seconds
+
+    if not sameValues(bestValues, appliedValues):
+        applyCandidate(parameters, best)
+    if not sameValues(bestValues, generatedValues):
+        generateAndTime(cam, operation)
+    if sameValues(bestValues, currentValues):
+        return None
+    sweepRecords.put(operation.name, toolDescription(operation.tool), signature, best, bestSeconds)
+    return best
+
+
+def sweepSetups(setupNames: list) -> dict:
+    """Sweep every sweepable operation of the named setups. Returns the
+    chosen expressions by operation name. Call from the main thread."""
+    app = adsk.core.Application.get()
+    cam = adsk.cam.CAM.cast(app.activeDocument.products.itemByProductType('CAMProductType'))
+    if cam is None:
+        return {}
+    try:
+        catalogue = ToolCatalogue.load()
+    except (OSError, ValueError):
+        catalogue = None
+    signature = partSignature(entityIndex.find(cam.designRootOccurrence, 'artifact'))
+    budget = SweepBudget(config.SWEEP_CANDIDATE_BUDGET, config.SWEEP_TIME_BUDGET_SECONDS)
+    chosen = {}
+    for setup in cam.setups:
+        if setup.name not in setupNames:
+            continue
+        for operation in setup.allOperations:
+            if operation.name in SWEEPS:
+                expressions = sweepOperation(cam, operation, catalogue, signature, budget)
+                if expressions:
+                    chosen[operation.name] = expressions
+    return chosen
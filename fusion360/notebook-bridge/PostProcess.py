@@ -3,10 +3,40 @@
 
 import adsk.core, adsk.fusion, adsk.cam, traceback
 import os
+from . import config
+from .SbpOptimizer import optimizeProgram
+from .SbpStore import SbpStore, programKey
+from .ToolpathFile import SUFFIX as toolpathSuffix, toolpathPath, writeToolpath
 
 outputFolder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 
-def exportSBPWithSetupNamed(setup_name):
+# Post processor and properties every program is posted with.
+postConfigName = 'shopbot.cps'
+postProperties = {
+    # disable sequence numbers
+    'showSequenceNumbers': False,
+}
+
+# Posted programs by the fingerprint of their inputs.
+sbpStore = SbpStore(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sbpStore'),
+    config.SBP_STORE_MAX_MB * 1024 * 1024,
+    companionSuffixes=(toolpathSuffix,),
+)
+
+
+def largestToolRadius(operations) -> float:
+    ''' Radius of the largest tool the operations use, in inches '''
+    # Lengths are in Fusion's internal centimeters.
+    return max((operation.tool.parameters.itemByName('tool_diameter').value.value / 2 / 2.54
+                for operation in operations if operation.tool), default=0.0)
+
+
+def exportSBPForSetups(setup_names):
+    ''' Post all operations of each named setup, one program per setup.
+    Returns (setup name, program path) for each program that was posted. '''
+    posted = []
+    ui = None
     try:
         app = adsk.core.Application.get()
         ui  = app.userInterface
@@ -15,28 +45,79 @@ def exportSBPWithSetupNamed(setup_name):
         product = products.itemByProductType("CAMProductType")
         camWS = ui.workspaces.itemById('CAMEnvironment')
         camWS.activate()
-        
+
         if product == None:
             ui.messageBox('There are no CAM operations in the active document.  This script requires the active document to contain at least one CAM operation.',
                             'No CAM Operations Exist',
                             adsk.core.MessageBoxButtonTypes.OKButtonType,
                             adsk.core.MessageBoxIconTypes.CriticalIconType)
-            return
+            return posted
 
         cam = adsk.cam.CAM.cast(product)
-        setups = cam.setups
-        setup = getSetup(setup_name, setups)
-        operations = setup.allOperations
-        operation = operations.item(0)
-        
-        if operation.hasToolpath == True:
-            cam.postProcess(operation, configurePostpost(setup_name, cam))
-        else:
-            ui.messageBox('Operation has no toolpath to post')
-            return
+        setupsByName = {setup.name: setup for setup in cam.setups}
+        for setup_name in setup_names:
+            setup = setupsByName.get(setup_name)
+            if setup is None:
+                ui.messageBox('There is no setup named {}'.format(setup_name))
+                continue
+            # An unchanged setup on unchanged geometry posts to the same
+            # program, so serve that from the store. Invalid toolpaths are
+            # about to change, so they are neither served nor stored.
+            cacheable = all(operation.isToolpathValid for operation in setup.allOperations)
+            key = programKey(geometryFingerprint(setup), operationsFingerprint(setup),
+                             postConfigName, postProperties, config.OPTIMIZE_SBP)
+            storedPath = sbpStore.get(key) if cacheable else None
+            if storedPath:
+                if not os.path.exists(toolpathPath(storedPath)):
+                    writeToolpath(storedPath)
+                posted.append((setup_name, storedPath))
+                continue
+            if not all(operation.hasToolpath for operation in setup.allOperations):
+                ui.messageBox('Setup {} has operations without a toolpath to post'.format(setup_name))
+                continue
+            cam.postProcess(setup, configurePostpost(setup_name, cam))
+            if config.OPTIMIZE_SBP:
+                optimizeProgram(programPath(setup_name), largestToolRadius(setup.allOperations))
+            if cacheable:
+                storedPath = sbpStore.put(key, programPath(setup_name))
+            else:
+                storedPath = programPath(setup_name)
+            writeToolpath(storedPath)
+            posted.append((setup_name, storedPath))
     except:
         if ui:
             ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+    return posted
+
+
+def programPath(programName):
+    return os.path.join(outputFolder, programName + '.sbp')
+
+
+def geometryFingerprint(setup):
+    ''' Describe the bodies a setup machines, precisely enough to notice edits '''
+    models = []
+    for model in setup.models:
+        box = model.boundingBox
+        properties = model.getPhysicalProperties(adsk.fusion.CalculationAccuracy.LowCalculationAccuracy)
+        models.append([
+            model.name,
+            [round(v, 6) for v in box.minPoint.asArray() + box.maxPoint.asArray()],
+            round(properties.volume, 6),
+            round(properties.area, 6),
+        ])
+    return models
+
+
+def operationsFingerprint(setup):
+    ''' Describe what a setup posts: its parameter expressions and, for each
+    operation, its parameter expressions and toolpath state '''
+    def expressions(parameters):
+        return sorted([parameter.name, parameter.expression] for parameter in parameters)
+    return [expressions(setup.parameters)] + [
+        [operation.name, expressions(operation.parameters), operation.hasToolpath, operation.isToolpathValid]
+        for operation in setup.allOperations
+    ]
 
 
 def getSetup(setup_name, setups):
@@ -50,15 +131,14 @@ def configurePostpost(postName, camRef):
     programName = postName
     global outputFolder
     units = adsk.cam.PostOutputUnitOptions.InchesOutput
-    postConfig = os.path.join(camRef.genericPostFolder, 'shopbot.cps') 
+    postConfig = os.path.join(camRef.genericPostFolder, postConfigName) 
     postInput = adsk.cam.PostProcessInput.create(programName, postConfig, outputFolder, units)
     
     # create the post properties
-    postProperties = adsk.core.NamedValues.create()
-    # create the disable sequence number property
-    disableSequenceNumbers = adsk.core.ValueInput.createByBoolean(False)
-    postProperties.add("showSequenceNumbers", disableSequenceNumbers)
+    namedValues = adsk.core.NamedValues.create()
+    for name, value in postProperties.items():
+        namedValues.add(name, adsk.core.ValueInput.createByBoolean(value))
     # add the post properties to the post process input
-    postInput.postProperties = postProperties
+    postInput.postProperties = namedValues
     return postInput
     
\ No newline at end of file
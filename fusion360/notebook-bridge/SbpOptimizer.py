@@ -0,0 +1,322 @@
+"""
+Optimizes posted SBP programs before they are sent to the mill.
+
+The shopbot post emits every move Fusion generated, including moves that
+go nowhere, retracts immediately followed by another retract, and long
+runs of collinear feed segments. On foam jobs much of the machine time is
+spent in the air, so this pass:
+
+- drops moves that end where they start,
+- collapses consecutive vertical jogs and consecutive jogs at the safe height,
+- merges collinear linear feed moves,
+- reorders islands cut at the same depth to shorten the rapids between them.
+  An island is only moved ahead of islands whose area, widened by the tool
+  radius, it does not overlap, so every pass still removes the same
+  material as posted.
+
+Only moves between two non-move lines (speed changes, tool changes,
+comments, ...) are rearranged, so the program's structure is preserved.
+It does not use the Fusion API.
+"""
+
+import math
+import os
+import typing
+from typing import Optional
+
+from .SbpReader import (
+    LINEAR_COMMANDS, AXES, TOLERANCE, Move, Point,
+    commandOf, known, moveSeconds, readLines, readProgram, samePoint,
+)
+
+
+class OptimizeReport(typing.NamedTuple):
+    originalSeconds: float
+    optimizedSeconds: float
+    droppedMoves: int
+    reorderedIslands: int
+
+    @property
+    def savedSeconds(self) -> float:
+        return self.originalSeconds - self.optimizedSeconds
+
+
+def formatNumber(value: float) -> str:
+    text = '{:.6f}'.format(value).rstrip('0').rstrip('.')
+    return '0' if text in ('', '-0') else text
+
+
+def linearText(move: Move, position: Point) -> str:
+    """The move's own line if it still lands on its end from position,
+    otherwise an equivalent move naming every axis."""
+    command = commandOf(move.text)
+    if command in LINEAR_COMMANDS:
+        named = LINEAR_COMMANDS[command]
+        if all(axis in named or samePoint((position[k],) * 3, (move.end[k],) * 3)
+               for k, axis in enumerate(AXES)):
+            return move.text
+    if move.arc or not known(move.end):
+        return move.text
+    return '{},{}'.format('J3' if move.rapid else 'M3', ','.join(formatNumber(v) for v in move.end))
+
+
+def isVertical(move: Move) -> bool:
+    return known(move.start) and known(move.end) and \
+        samePoint(move.start[:2] + (0,), move.end[:2] + (0,))
+
+
+def onSegment(point: Point, a: Point, b: Point) -> bool:
+    """Whether point lies within TOLERANCE of the segment from a to b."""
+    ab = [q - p for p, q in zip(a, b)]
+    ap = [q - p for p, q in zip(a, point)]
+    lengthSquared = sum(d * d for d in ab)
+    if lengthSquared <= TOLERANCE * TOLERANCE:
+        return False
+    t = sum(p * q for p, q in zip(ab, ap)) / lengthSquared
+    if t < 0 or t > 1:
+        return False
+    return math.dist(point, [p + t * d for p, d in zip(a, ab)]) <= TOLERANCE
+
+
+def dropEmptyMoves(moves: typing.List[Move]) -> typing.List[Move]:
+    return [move for move in moves if move.arc or not samePoint(move.start, move.end)]
+
+
+def collapseRapids(moves: typing.List[Move], safeZ: Optional[float]) -> typing.List[Move]:
+    """Merge vertical jogs that follow each other, and horizontal jogs at
+    the safe height that follow each other."""
+    collapsed = []
+    for move in moves:
+        previous = collapsed[-1] if collapsed else None
+        if previous and previous.rapid and move.rapid and known(previous.start) and known(move.end):
+            bothVertical = isVertical(previous) and isVertical(move)
+            bothSafe = safeZ is not None and all(
+                abs(z - safeZ) <= TOLERANCE for z in (previous.start[2], previous.end[2], move.end[2]))
+            if bothVertical or bothSafe:
+                collapsed[-1] = move._replace(start=previous.start)
+                continue
+        collapsed.append(move)
+    return dropEmptyMoves(collapsed)
+
+
+def mergeCollinear(moves: typing.List[Move]) -> typing.List[Move]:
+    merged = []
+    skipped = []
+    for move in moves:
+        previous = merged[-1] if merged else None
+        if previous and not previous.rapid and not move.rapid and not previous.arc and not move.arc \
+                and previous.speed == move.speed and known(previous.start) and known(move.end):
+            candidates = skipped + [previous.end]
+            if all(onSegment(point, previous.start, move.end) for point in candidates):
+                merged[-1] = move._replace(start=previous.start)
+                skipped = candidates
+                continue
+        merged.append(move)
+        skipped = []
+    return merged
+
+
+def splitIslands(moves: typing.List[Move]):
+    """Split moves into alternating runs of rapids and feed moves."""
+    runs = []
+    for move in moves:
+        if runs and runs[-1][0] == move.rapid:
+            runs[-1][1].append(move)
+        else:
+            runs.append((move.rapid, [move]))
+    return runs
+
+
+def link(start: Point, end: Point, safeZ: float, jogSpeed) -> typing.List[Move]:
+    """Retract to the safe height, jog over end, and descend onto it."""
+    links = []
+    position = start
+    for target in ((position[0], position[1], safeZ), (end[0], end[1], safeZ), end):
+        if not samePoint(position, target):
+            if samePoint(position[:2] + (0,), target[:2] + (0,)):
+                text = 'JZ,{}'.format(formatNumber(target[2]))
+            else:
+                text = 'J2,{},{}'.format(formatNumber(target[0]), formatNumber(target[1]))
+            links.append(Move(True, position, target, jogSpeed, text))
+            position = target
+    return links
+
+
+def islandBox(island: typing.List[Move], toolRadius: float) -> typing.Tuple[float, float, float, float]:
+    """The XY area an island's tool sweeps: minX, minY, maxX and maxY of
+    its moves, taking whole circles for arcs, widened by toolRadius."""
+    xs = []
+    ys = []
+    for move in island:
+        for point in (move.start, move.end):
+            if known(point):
+                xs.append(point[0])
+                ys.append(point[1])
+        if move.arc and known(move.end):
+            radius = math.dist(move.arc[:2], move.end[:2])
+            xs += [move.arc[0] - radius, move.arc[0] + radius]
+            ys += [move.arc[1] - radius, move.arc[1] + radius]
+    return min(xs) - toolRadius, min(ys) - toolRadius, max(xs) + toolRadius, max(ys) + toolRadius
+
+
+def overlaps(a, b) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def linkSeconds(start: Point, end: Point, safeZ: float, jogSpeed) -> float:
+    return sum(moveSeconds(move) for move in link(start, end, safeZ, jogSpeed))
+
+
+def reorderIslands(moves: typing.List[Move], safeZ: Optional[float], toolRadius: float = 0.0) -> typing.Tuple[typing.List[Move], int]:
+    """Visit islands at the same depth in nearest-neighbour order.
+
+    Only islands whose rapids retract to the safe height and descend
+    vertically are reordered, so the new links move the same way the
+    post's do. Islands whose areas, widened by toolRadius, overlap are
+    kept in their posted order."""
+    runs = splitIslands(moves)
+    if safeZ is None or len(runs) < 5:
+        return moves, 0
+
+    def plainRapids(run):
+        return all(known(move.start) and known(move.end) and (
+            isVertical(move) or abs(move.start[2] - safeZ) <= TOLERANCE and abs(move.end[2] - safeZ) <= TOLERANCE)
+            for move in run)
+
+    def depth(island):
+        return min(move.end[2] for move in island)
+
+    # Islands with a plain rapid run on both sides, grouped by depth.
+    groups = []
+    for index in range(1, len(runs) - 1):
+        rapid, run = runs[index]
+        if rapid or not all(known(move.end) for move in run):
+            continue
+        if not plainRapids(runs[index - 1][1]) or not plainRapids(runs[index + 1][1]):
+            continue
+        if groups and groups[-1][-1] == index - 2 and abs(depth(runs[index - 2][1]) - depth(run)) <= TOLERANCE:
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+
+    reordered = 0
+    replacements = {}
+    lastReplaced = -1
+    for group in groups:
+        # A group sharing its leading rapids with the group before it
+        # starts from wherever that group now ends, so leave it as is.
+        if len(group) < 2 or group[0] - 1 <= lastReplaced:
+            continue
+        islands = [runs[index][1] for index in group]
+        boxes = [islandBox(island, toolRadius) for island in islands]
+        # The islands each island has to follow.
+        after = [{j for j in range(i) if overlaps(boxes[i], boxes[j])} for i in range(len(islands))]
+        jogSpeed = runs[group[0] - 1][1][0].speed
+        start = runs[group[0] - 1][1][0].start
+        finish = runs[group[-1] + 1][1][-1].end
+        order = []
+        position = start
+        remaining = list(range(len(islands)))
+        while remaining:
+            ready = [i for i in remaining if not after[i].intersection(remaining)]
+            nearest = min(ready, key=lambda i: linkSeconds(position, islands[i][0].start, safeZ, jogSpeed))
+            remaining.remove(nearest)
+            order.append(nearest)
+            position = islands[nearest][-1].end
+
+        def cost(sequence):
+            total = 0.0
+            position = start
+            for i in sequence:
+                total += linkSeconds(position, islands[i][0].start, safeZ, jogSpeed)
+                position = islands[i][-1].end
+            return total + linkSeconds(position, finish, safeZ, jogSpeed)
+
+        original = list(range(len(islands)))
+        if order == original or cost(order) >= cost(original) - TOLERANCE:
+            continue
+        rebuilt = []
+        position = start
+        for i in order:
+            rebuilt += link(position, islands[i][0].start, safeZ, jogSpeed)
+            rebuilt += islands[i]
+            position = islands[i][-1].end
+        rebuilt += link(position, finish, safeZ, jogSpeed)
+        replacements[group[0] - 1] = (group[-1] + 1, rebuilt)
+        lastReplaced = group[-1] + 1
+        reordered += sum(1 for new, old in zip(order, original) if new != old)
+
+    if not replacements:
+        return moves, 0
+    result = []
+    index = 0
+    while index < len(runs):
+        if index in replacements:
+            last, rebuilt = replacements[index]
+            result += rebuilt
+            index = last + 1
+        else:
+            result += runs[index][1]
+            index += 1
+    return result, reordered
+
+
+def optimizeBlock(moves: typing.List[Move], toolRadius: float = 0.0) -> typing.Tuple[typing.List[Move], int]:
+    rapidHeights = [move.end[2] for move in moves if move.rapid and move.end[2] is not None]
+    safeZ = max(rapidHeights) if rapidHeights else None
+    moves = dropEmptyMoves(moves)
+    moves = collapseRapids(moves, safeZ)
+    moves = mergeCollinear(moves)
+    return reorderIslands(moves, safeZ, toolRadius)
+
+
+def optimizeLines(lines: typing.Iterable[str], write: typing.Callable[[str], None], toolRadius: float = 0.0) -> OptimizeReport:
+    """Optimize a program read a line at a time, passing each output line
+    to write. Only one block of moves is held in memory at a time.
+    toolRadius is the largest radius of the program's tools, in program units."""
+    block: typing.List[Move] = []
+    originalSeconds = 0.0
+    optimizedSeconds = 0.0
+    originalMoves = 0
+    optimizedMoves = 0
+    reorderedIslands = 0
+
+    def flush():
+        nonlocal optimizedSeconds, optimizedMoves, reorderedIslands
+        if not block:
+            return
+        optimized, reordered = optimizeBlock(block, toolRadius)
+        reorderedIslands += reordered
+        emitted = block[0].start
+        for move in optimized:
+            write(linearText(move, emitted))
+            emitted = move.end
+            optimizedSeconds += moveSeconds(move)
+        optimizedMoves += len(optimized)
+        block.clear()
+
+    for item in readProgram(lines):
+        if isinstance(item, Move):
+            block.append(item)
+            originalSeconds += moveSeconds(item)
+            originalMoves += 1
+            continue
+        flush()
+        write(item)
+    flush()
+    return OptimizeReport(originalSeconds, optimizedSeconds, originalMoves - optimizedMoves, reorderedIslands)
+
+
+def optimizeProgram(path: str, toolRadius: float = 0.0) -> OptimizeReport:
+    """Optimize the program at path in place, noting the estimated time
+    saved in a comment at its end."""
+    with open(path, 'r', newline='') as f:
+        firstLine = f.readline()
+    newline = '\r\n' if firstLine.endswith('\r\n') else '\n'
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'w', newline='') as f:
+        report = optimizeLines(readLines(path), lambda line: f.write(line + newline), toolRadius)
+        f.write("'Optimized: {:.1f} of {:.1f} seconds of estimated machine time saved{}".format(
+            report.savedSeconds, report.originalSeconds, newline))
+    os.replace(tmpPath, path)
+    return report
@@ -0,0 +1,286 @@
+"""
+Streaming reader for the SBP programs the shopbot post writes.
+
+Programs are read a line at a time, so even multi-million line scallop
+programs are parsed in constant memory. readProgram turns lines into moves
+with their absolute start and end points, summarizeProgram computes the
+program's statistics in one pass, and MoveArray keeps the moves themselves
+in flat arrays for code that needs all of them. It does not use the Fusion
+API.
+"""
+
+import array
+import math
+import typing
+from typing import Optional
+
+# Speeds in program units per second, as set by MS and JS. Used until the
+# program sets its own.
+DEFAULT_MOVE_SPEED = (0.5, 0.5)
+DEFAULT_JOG_SPEED = (3.0, 1.0)
+
+# Distance below which points are considered the same, in program units.
+TOLERANCE = 1e-4
+
+AXES = 'xyz'
+# Linear move commands and the axes they set.
+LINEAR_COMMANDS = {
+    'J2': 'xy', 'J3': 'xyz', 'JX': 'x', 'JY': 'y', 'JZ': 'z',
+    'M2': 'xy', 'M3': 'xyz', 'MX': 'x', 'MY': 'y', 'MZ': 'z',
+}
+
+# Move kinds as stored in a MoveArray.
+RAPID = 0
+FEED = 1
+ARC = 2
+
+Point = typing.Tuple[Optional[float], Optional[float], Optional[float]]
+
+
+class Move(typing.NamedTuple):
+    rapid: bool
+    start: Point
+    end: Point
+    speed: typing.Tuple[float, float]
+    text: str
+    # (center x, center y, clockwise) for CG arcs
+    arc: Optional[tuple] = None
+
+    @property
+    def kind(self) -> int:
+        return RAPID if self.rapid else ARC if self.arc else FEED
+
+
+def parseNumber(text: str) -> Optional[float]:
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def commandOf(line: str) -> str:
+    return line.split(',', 1)[0].strip().upper()
+
+
+def parseMove(line: str, position: Point, moveSpeed, jogSpeed) -> Optional[Move]:
+    """The move a line makes from position, or None if it is not a move."""
+    fields = line.split(',')
+    command = fields[0].strip().upper()
+    if command in LINEAR_COMMANDS:
+        end = list(position)
+        for axis, field in zip(LINEAR_COMMANDS[command], fields[1:]):
+            value = parseNumber(field)
+            if value is not None:
+                end[AXES.index(axis)] = value
+        rapid = command[0] == 'J'
+        return Move(rapid, position, tuple(end), jogSpeed if rapid else moveSpeed, line)
+    if command == 'CG':
+        # CG, diameter, x, y, i, j, type, direction, plunge, repetitions, ...
+        args = [parseNumber(field) for field in fields[1:]]
+        args += [None] * (8 - len(args))
+        x, y, i, j = args[1:5]
+        if None in (x, y, i, j, position[0], position[1]) or any(arg for arg in args[8:]):
+            # Spirals and repeated arcs end at a depth we do not track.
+            return Move(False, position, (None, None, None), moveSpeed, line)
+        # Direction 1 cuts clockwise, -1 counterclockwise.
+        center = (position[0] + i, position[1] + j, args[6] != -1)
+        return Move(False, position, (x, y, position[2]), moveSpeed, line, center)
+    return None
+
+
+def parseSpeeds(line: str, speed):
+    fields = line.split(',')
+    values = [parseNumber(field) for field in fields[1:3]]
+    return tuple(value if value is not None else old for value, old in zip(values + [None] * 2, speed))
+
+
+def toolNumber(line: str) -> Optional[int]:
+    """The tool a '&Tool = n' line selects, or None for any other line."""
+    name, _, value = line.partition('=')
+    if name.strip().upper() != '&TOOL':
+        return None
+    number = parseNumber(value)
+    return int(number) if number is not None else None
+
+
+def known(point: Point) -> bool:
+    return None not in point
+
+
+def samePoint(a: Point, b: Point) -> bool:
+    return known(a) and known(b) and all(abs(p - q) <= TOLERANCE for p, q in zip(a, b))
+
+
+def moveLength(move: Move) -> typing.Tuple[float, float]:
+    """Horizontal and vertical distance travelled by a move."""
+    if not known(move.start) or not known(move.end):
+        return 0.0, 0.0
+    dz = abs(move.end[2] - move.start[2])
+    if move.arc:
+        cx, cy, clockwise = move.arc
+        radius = math.hypot(move.start[0] - cx, move.start[1] - cy)
+        a0 = math.atan2(move.start[1] - cy, move.start[0] - cx)
+        a1 = math.atan2(move.end[1] - cy, move.end[0] - cx)
+        sweep = (a0 - a1) if clockwise else (a1 - a0)
+        sweep %= 2 * math.pi
+        if sweep <= TOLERANCE:
+            sweep = 2 * math.pi
+        return radius * sweep, dz
+    return math.hypot(move.end[0] - move.start[0], move.end[1] - move.start[1]), dz
+
+
+def moveSeconds(move: Move) -> float:
+    horizontal, vertical = moveLength(move)
+    xySpeed, zSpeed = move.speed
+    seconds = 0.0
+    if horizontal and xySpeed > 0:
+        seconds = horizontal / xySpeed
+    if vertical and zSpeed > 0:
+        seconds = max(seconds, vertical / zSpeed)
+    return seconds
+
+
+def readLines(path: str) -> typing.Iterator[str]:
+    """The lines of a program file without their line endings."""
+    with open(path, 'r', newline='') as f:
+        for line in f:
+            yield line.rstrip('\r\n')
+
+
+def readProgram(lines: typing.Iterable[str]) -> typing.Iterator[typing.Union[Move, str]]:
+    """Each line as a Move, or as the line itself if it does not move the
+    tool. MS and JS lines set the speed of the moves after them."""
+    position: Point = (None, None, None)
+    moveSpeed = DEFAULT_MOVE_SPEED
+    jogSpeed = DEFAULT_JOG_SPEED
+    for line in lines:
+        move = parseMove(line, position, moveSpeed, jogSpeed)
+        if move is not None:
+            position = move.end
+            yield move
+            continue
+        command = commandOf(line)
+        if command == 'MS':
+            moveSpeed = parseSpeeds(line, moveSpeed)
+        elif command == 'JS':
+            jogSpeed = parseSpeeds(line, jogSpeed)
+        yield line
+
+
+class MoveArray:
+    """Moves as parallel flat arrays: kind, end point and horizontal speed.
+    Unknown coordinates are stored as NaN."""
+
+    def __init__(self):
+        self.kinds = array.array('b')
+        self.xs = array.array('d')
+        self.ys = array.array('d')
+        self.zs = array.array('d')
+        self.feeds = array.array('d')
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def append(self, move: Move):
+        self.kinds.append(move.kind)
+        for values, value in zip((self.xs, self.ys, self.zs), move.end):
+            values.append(math.nan if value is None else value)
+        self.feeds.append(move.speed[0])
+
+    def __getitem__(self, index: int) -> typing.Tuple[int, float, float, float, float]:
+        return self.kinds[index], self.xs[index], self.ys[index], self.zs[index], self.feeds[index]
+
+
+class ProgramStats:
+    """Statistics of a program, accumulated a move at a time."""
+
+    def __init__(self):
+        self.lines = 0
+        self.moves = 0
+        self.minimum = [math.inf] * 3
+        self.maximum = [-math.inf] * 3
+        self.cutLength = 0.0
+        self.rapidLength = 0.0
+        self.cutSeconds = 0.0
+        self.rapidSeconds = 0.0
+        # tool number -> estimated seconds, None before the first tool change
+        self.toolSeconds: typing.Dict[Optional[int], float] = {}
+        self.minFeed = math.inf
+        self.maxFeed = 0.0
+        # sum of feed times length, for the length weighted mean feed
+        self.feedLength = 0.0
+        self.unknownMoves = 0
+        self.tool: Optional[int] = None
+
+    def addLine(self, line: str):
+        self.lines += 1
+        tool = toolNumber(line)
+        if tool is not None:
+            self.tool = tool
+
+    def addMove(self, move: Move):
+        self.lines += 1
+        self.moves += 1
+        if not known(move.end):
+            self.unknownMoves += 1
+            return
+        for axis, value in enumerate(move.end):
+            self.minimum[axis] = min(self.minimum[axis], value)
+            self.maximum[axis] = max(self.maximum[axis], value)
+        horizontal, vertical = moveLength(move)
+        length = math.hypot(horizontal, vertical)
+        seconds = moveSeconds(move)
+        self.toolSeconds[self.tool] = self.toolSeconds.get(self.tool, 0.0) + seconds
+        if move.rapid:
+            self.rapidLength += length
+            self.rapidSeconds += seconds
+            return
+        self.cutLength += length
+        self.cutSeconds += seconds
+        if length:
+            feed = move.speed[0]
+            self.minFeed = min(self.minFeed, feed)
+            self.maxFeed = max(self.maxFeed, feed)
+            self.feedLength += feed * length
+
+    def summary(self) -> dict:
+        hasBounds = self.minimum[0] <= self.maximum[0]
+        return {
+            'lines': self.lines,
+            'moves': self.moves,
+            'unknownMoves': self.unknownMoves,
+            'bounds': {
+                'min': self.minimum if hasBounds else None,
+                'max': self.maximum if hasBounds else None,
+            },
+            'cutLength': self.cutLength,
+            'rapidLength': self.rapidLength,
+            'cutSeconds': self.cutSeconds,
+            'rapidSeconds': self.rapidSeconds,
+            'toolSeconds': {
+                str(tool) if tool is not None else 'unknown': seconds
+                for tool, seconds in self.toolSeconds.items()
+            },
+            'feed': {
+                'min': self.minFeed if self.cutLength else None,
+                'max': self.maxFeed if self.cutLength else None,
+                'mean': self.feedLength / self.cutLength if self.cutLength else None,
+            },
+        }
+
+
+def summarizeProgram(lines: typing.Iterable[str], moves: Optional[MoveArray] = None) -> ProgramStats:
+    """Statistics of a program in one pass, also collecting its moves into
+    moves when given."""
+    stats = ProgramStats()
+    for item in readProgram(lines):
+        if isinstance(item, Move):
+            stats.addMove(item)
+            if moves is not None:
+                moves.append(item)
+        else:
+            stats.addLine(item)
+    return stats
@@ -0,0 +1,109 @@
+"""
+Content-addressed store of posted SBP programs.
+
+Programs are kept under a key derived from everything that determines the
+post output (design geometry, setup inputs and post settings), so posting
+an unchanged setup again is a lookup instead of a post-processor run. The
+store is bounded in size and evicts the least recently used programs
+first. It does not use the Fusion API.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import threading
+import typing
+from typing import Optional
+
+
+def programKey(*parts) -> str:
+    """Key for a program from JSON-serializable descriptions of its inputs."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class SbpStore:
+
+    def __init__(self, folder: str, maxBytes: int, companionSuffixes: typing.Sequence[str] = ()):
+        self.folder = folder
+        self.maxBytes = maxBytes
+        # Files derived from a program, e.g. its binary toolpath, stored
+        # next to it and evicted with it. They do not count towards maxBytes.
+        self.companionSuffixes = companionSuffixes
+        self.lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self.entries = collections.OrderedDict()
+        self.load()
+
+    def indexPath(self) -> str:
+        return os.path.join(self.folder, 'index.json')
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.folder, key + '.sbp')
+
+    def files(self, key: str) -> typing.List[str]:
+        """The program and its companion files."""
+        return [self.path(key)] + [os.path.join(self.folder, key + suffix) for suffix in self.companionSuffixes]
+
+    def totalBytes(self) -> int:
+        return sum(self.entries.values())
+
+    def get(self, key: str) -> Optional[str]:
+        """The stored program's path, or None on a miss."""
+        with self.lock:
+            if key not in self.entries:
+                return None
+            path = self.path(key)
+            if not os.path.exists(path):
+                del self.entries[key]
+                self.save()
+                return None
+            self.entries.move_to_end(key)
+            self.save()
+            return path
+
+    def put(self, key: str, sourcePath: str) -> str:
+        """Copy a freshly posted program into the store, returning its stored path."""
+        with self.lock:
+            os.makedirs(self.folder, exist_ok=True)
+            path = self.path(key)
+            tmpPath = path + '.tmp'
+            shutil.copyfile(sourcePath, tmpPath)
+            os.replace(tmpPath, path)
+            self.entries[key] = os.path.getsize(path)
+            self.entries.move_to_end(key)
+            self.evict()
+            self.save()
+            return path
+
+    def evict(self):
+        # Always keep the newest program, even if it alone is over the limit.
+        total = self.totalBytes()
+        while total > self.maxBytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            total -= size
+            for path in self.files(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def load(self):
+        try:
+            with open(self.indexPath(), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, size in saved:
+            if os.path.exists(self.path(key)):
+                self.entries[key] = size
+
+    def save(self):
+        tmpPath = self.indexPath() + '.tmp'
+        try:
+            with open(tmpPath, 'w', encoding='utf-8') as f:
+                json.dump(list(self.entries.items()), f)
+            os.replace(tmpPath, self.indexPath())
+        except OSError:
+            pass
@@ -1,12 +1,64 @@
 # adsk_helpers.py
 
 import adsk.core, adsk.fusion, adsk.cam, traceback
+import hashlib
+import json
 from typing import Union
+from .EntityIndex import entityIndex
+from .ToolCache import loadShopbotTools
+from .ParameterSweep import SWEEPS, partSignature, sweepRecords, sweptFingerprint, toolDescription
+from .FeedsAndSpeeds import MATERIALS, OPERATIONS, calculateCuts, cutExpressions
+from .ToolCatalogue import ToolCatalogue
+from . import config
+from .StockContext import StockContext, captureStockContext, storedArtifacts
+from .lib import fusion360utils as futil
+
+# Attribute group and name under which each setup stores the fingerprint of
+# the inputs it was built from.
+FINGERPRINT_GROUP = 'Tandem'
+FINGERPRINT_NAME = 'fingerprint'
+# The fingerprint of a setup's inputs before any swept values are applied,
+# from which a sweep derives the setup's new fingerprint.
+BASE_FINGERPRINT_NAME = 'baseFingerprint'
+
+# User parameters that size the stock of setups whose stock box follows
+# their models, so a change to any of them changes those setups' fingerprints.
+WORKPIECE_PARAMETERS = ('mainWorkpiece_x', 'mainWorkpiece_y', 'mainWorkpiece_z', 'jigOffset', 'tabPadding')
+
+# Speeds and feeds used for operations whose tool is not in the catalogue.
+# Bore1 has none; it falls back to its tool's Wood preset.
+BASELINE_SPEEDS = {
+    'Face1': {
+        'tool_spindleSpeed': "3055.775 rpm",
+        'tool_surfaceSpeed': "1000 ft/min",
+        'tool_feedCutting': "122.2 in/min",
+    },
+    'Bore2': {
+        'tool_spindleSpeed': "15278.9 rpm",
+        'tool_surfaceSpeed': "1000 ft/min",
+        'tool_feedCutting': "397.251 in/min",
+    },
+    'Pocket': {
+        'tool_spindleSpeed': "15278.9 rpm",
+        'tool_surfaceSpeed': "1000 ft/min",
+        'tool_feedCutting': "397.251 in/min",
+    },
+    'Scallop': {
+        'tool_spindleSpeed': "16000 rpm",
+        'tool_surfaceSpeed': "1047.2 ft/min",
+        'tool_feedCutting': "250 in/min",
+    },
+    'Adaptive2': {
+        'tool_spindleSpeed': "15278.9 rpm",
+        'tool_surfaceSpeed': "1000 ft/min",
+        'tool_feedCutting': "397.251 in/min",
+    },
+}
 
 
 class SetupMaker:
 
-    def __init__(self):
+    def __init__(self, batchGeneration: bool = False, context: StockContext = None):
         self.app = adsk.core.Application.get()
         self.ui = self.app.userInterface
         # use existing document, load 2D Strategies model from the Fusion CAM Samples folder
@@ -14,6 +66,8 @@ class SetupMaker:
         designWS = self.ui.workspaces.itemById('FusionSolidEnvironment')
         designWS.activate()
         self.design = adsk.fusion.Design.cast(self.app.activeProduct)
+        # the design as of this command; every setup reads its numbers from it
+        self.context = context or captureStockContext(self.design)
 
         # switch to manufacturing space
         camWS = self.ui.workspaces.itemById('CAMEnvironment')
@@ -23,471 +77,468 @@ class SetupMaker:
         self.products = doc.products
 
         #################### Find tools in sample tool library ####################
-        # get the tool libraries from the library manager
-        camManager = adsk.cam.CAMManager.get()
-        libraryManager = camManager.libraryManager
-        toolLibraries = libraryManager.toolLibraries
-        # we can use a library URl directly if we know its address (here we use Fusion's Metric sample library)
-
-        fusion360Folder = toolLibraries.urlByLocation(
-            adsk.cam.LibraryLocations.LocalLibraryLocation)
-        fusion360Libs = getLibrariesURLs(toolLibraries, fusion360Folder)
-
-        for str_url in fusion360Libs:
-            if 'shopbot' in str_url:
-                url = adsk.core.URL.create(str_url)
-                break
-
-        # load tool library
-        toolLibrary = toolLibraries.toolLibraryAtURL(url)
         # create some variables for the milling tools which will be used in the operations
-        self.faceTool = None
-        self.adaptiveTool = None
-        self.boreTool = None
-        self.bore2Tool = None
-
-        
-
-        # searching the face mill and the bull nose using a loop for the roughing operations
-        for tool in toolLibrary:
-            # read the tool type
-            toolType = tool.parameters.itemByName('tool_type').value.value
-
-            if toolType == "flat end mill" and tool.parameters.itemByName('tool_description').expression == "'1/4\" Flat Endmill'":
-                self.boreTool = tool
-            elif toolType == "face mill":
-                self.faceTool = tool
-            elif toolType == "ball end mill" and tool.parameters.itemByName('tool_description').expression == "'1/4\" 4\"-long ball end'":
-                self.bore2Tool = tool
-
-            # exit when the 2 tools are found
-            if self.boreTool and self.faceTool and self.bore2Tool:
-                break
-    
+        tools = loadShopbotTools()
+        self.faceTool = tools.get('faceTool')
+        self.adaptiveTool = tools.get('adaptiveTool')
+        self.boreTool = tools.get('boreTool')
+        self.bore2Tool = tools.get('bore2Tool')
+
+        # In batch mode, operations are only generated by generateAll().
+        self.batchGeneration = batchGeneration
+        self.pendingOperations = []
+        # Size of the artifact, for looking up swept parameters.
+        self.signature = None
+        self.speeds = self.calculateSpeeds()
+
+    def generate(self, cam: adsk.cam.CAM, *operations):
+        if not operations:
+            return
+        if self.batchGeneration:
+            self.pendingOperations.extend(operations)
+        elif len(operations) == 1:
+            cam.generateToolpath(operations[0])
+        else:
+            collection = adsk.core.ObjectCollection.create()
+            for operation in operations:
+                collection.add(operation)
+            cam.generateToolpath(collection)
+
+    def generateAll(self):
+        ''' Submit every operation queued in batch mode as one generation, returning its future '''
+        if not self.pendingOperations:
+            return None
+        cam: adsk.cam.CAM = adsk.cam.CAM.cast(self.products.itemByProductType("CAMProductType"))
+        collection = adsk.core.ObjectCollection.create()
+        for operation in self.pendingOperations:
+            collection.add(operation)
+        self.pendingOperations = []
+        return cam.generateToolpath(collection)
+
+    def calculateSpeeds(self) -> dict:
+        ''' Spindle speed and feed expressions for every operation, by operation
+        name. Operations whose tool is not in the catalogue keep BASELINE_SPEEDS. '''
+        toolsByOperation = {
+            'Bore1': self.boreTool,
+            'Face1': self.faceTool,
+            'Bore2': self.bore2Tool,
+            'Pocket': self.boreTool,
+            'Scallop': self.bore2Tool,
+            'Adaptive2': self.bore2Tool,
+        }
+        try:
+            catalogue = ToolCatalogue.load()
+        except (OSError, ValueError) as error:
+            futil.log('No tool catalogue ({}), using the baseline speeds and feeds'.format(error))
+            return dict(BASELINE_SPEEDS)
+        names, tools = [], []
+        for name, tool in toolsByOperation.items():
+            entry = catalogue.first(description=toolDescription(tool).strip("'")) if tool else None
+            if entry:
+                names.append(name)
+                tools.append(entry)
+            else:
+                futil.log('{} tool is not in the catalogue, using the baseline speeds and feeds'.format(name))
+        materials = [MATERIALS[config.JIG_MATERIAL if name == 'Bore1' else config.MATERIAL] for name in names]
+        cuts = calculateCuts(tools, [OPERATIONS[name] for name in names], materials)
+        return dict(BASELINE_SPEEDS, **{name: cutExpressions(cut) for name, cut in zip(names, cuts)})
+
+    def swept(self, operationName: str, tool: adsk.cam.Tool, expressions: dict) -> dict:
+        ''' The expressions, with the values a parameter sweep chose for similar parts '''
+        if tool is None:
+            return expressions
+        recorded = sweepRecords.get(operationName, toolDescription(tool), self.partSignature())
+        return dict(expressions, **recorded) if recorded else expressions
+
+    def partSignature(self) -> list:
+        if self.signature is None:
+            cam: adsk.cam.CAM = adsk.cam.CAM.cast(self.products.itemByProductType("CAMProductType"))
+            self.signature = partSignature(recursivelyFindbRepBodies(cam.designRootOccurrence, "artifact"))
+        return self.signature
+
+    def setupFingerprint(self, base: str, sweeps: dict) -> str:
+        ''' A setup's fingerprint: its base inputs and the values parameter sweeps recorded for its operations, by operation name to tool '''
+        return sweptFingerprint(base, sweeps, self.partSignature())
+
+    def userExpression(self, name: str) -> str:
+        return self.context.expression(name)
+
+    def workpieceExpressions(self) -> dict:
+        ''' The workpiece and jig parameters that exist, by name '''
+        return {name: self.context.expression(name) for name in WORKPIECE_PARAMETERS if name in self.context.parameters}
+
+    def syncSetup(self, cam: adsk.cam.CAM, name: str, fingerprint: str, base: str, setupParameters: dict, operations: dict) -> bool:
+        '''
+        Bring an existing setup in line with its inputs. An unchanged setup is
+        reused as-is; a changed one is updated in place and only its own
+        operations are regenerated. Returns False if the setup doesn't exist.
+        operations maps an operation name to (tool, function applying its parameters).
+        '''
+        setup = getSetup(name, cam.setups)
+        if setup is None:
+            return False
+        if getFingerprint(setup) == fingerprint:
+            return True
+        applyExpressions(setup.parameters, setupParameters)
+        changed = []
+        for operation in setup.operations:
+            if operation.name not in operations:
+                continue
+            tool, configure = operations[operation.name]
+            operation.tool = tool
+            configure(operation.parameters)
+            changed.append(operation)
+        setFingerprint(setup, fingerprint, base)
+        self.generate(cam, *changed)
+        return True
+
     def create_alignmentJig(self, holeFaces = None):
-        
+
         try:
             cam: adsk.cam.CAM = adsk.cam.CAM.cast(self.products.itemByProductType("CAMProductType"))
             setups = cam.setups
-            setup = getSetup('alignmentJig', setups)
-            jigWorkpiece_x = self.design.userParameters.itemByName("jigWorkpiece_x").expression
-            jigWorkpiece_y = self.design.userParameters.itemByName("jigWorkpiece_y").expression
-            jigWorkpiece_z = self.design.userParameters.itemByName("jigWorkpiece_z").expression
-            if(setup == None):
-                setupInput = setups.createInput(adsk.cam.OperationTypes.MillingOperation)
-                # create a list for the models to add to the setup Input
-                models = []
-                part = recursivelyFindbRepBodies(cam.designRootOccurrence, "outer")
-                # add the part to the model list
-                models.append(part)
-                # pass the model list to the setup input
-                setupInput.models = models
-                # change some setup properties
-                setupInput.name = 'alignmentJig'
-                setupInput.stockMode = adsk.cam.SetupStockModes.FixedBoxStock
-                param = setupInput.parameters
-                # set offset mode
-                
-                param.itemByName('job_stockFixedX').expression = jigWorkpiece_x
-                param.itemByName('job_stockFixedXMode').expression = "'center'"
-
-                param.itemByName('job_stockFixedY').expression = jigWorkpiece_y
-                param.itemByName('job_stockFixedYMode').expression = "'center'"
-
-                param.itemByName('job_stockFixedZ').expression = jigWorkpiece_z
-                param.itemByName('job_stockFixedZMode').expression = "'bottom'"
-
-                param.itemByName('job_stockFixedZOffset').expression = '0 in'
-
-                param.itemByName('job_stockFixedRoundingValue').expression = '0 in'
-
-                setup = setups.add(setupInput)
-
-                #################### bore operation ####################
-
-                # input = setup.operations.createInput('bore')
-                # input.tool = self.boreTool
-                # input.displayName = 'Face1'
-                # for i in range(self.faceTool.presets.count):
-                #     if str(self.boreTool.presets.item(i).name) == "omsrud_face":
-                #         input.toolPreset = self.boreTool.presets.item(i)
-
-                # input.parameters.itemByName('tool_coolant').expression = "'disabled'"
-                # input.parameters.itemByName('tool_spindleSpeed').expression = "3055.775 rpm"
-                # input.parameters.itemByName('tool_surfaceSpeed').expression = "1000 ft/min"
-                # input.parameters.itemByName('tool_feedCutting').expression = "122.2 in/min"
-                # input.parameters.itemByName('bottomHeight_mode').expression = "'from surface top'"
-                input = setup.operations.createInput('bore')
-                input.tool = self.boreTool
-                input.displayName = 'Bore1'
-
-                
+            stock = {
+                'job_stockFixedX': self.userExpression("jigWorkpiece_x"),
+                'job_stockFixedXMode': "'center'",
+                'job_stockFixedY': self.userExpression("jigWorkpiece_y"),
+                'job_stockFixedYMode': "'center'",
+                'job_stockFixedZ': self.userExpression("jigWorkpiece_z"),
+                'job_stockFixedZMode': "'bottom'",
+                'job_stockFixedZOffset': '0 in',
+                'job_stockFixedRoundingValue': '0 in',
+            }
+            bore = {
+                'tool_coolant': "'disabled'",
+                **self.speeds.get('Bore1', {}),
+            }
+
+            def configureBore(parameters):
+                applyExpressions(parameters, bore)
+                selectFaces(parameters, 'circularFaces', holeFaces)
+
+            base = makeFingerprint(stock, bore, self.boreTool, geometrySignature(holeFaces))
+            fingerprint = self.setupFingerprint(base, {})
+            if self.syncSetup(cam, 'alignmentJig', fingerprint, base, stock, {'Bore1': (self.boreTool, configureBore)}):
+                return
+
+            setupInput = setups.createInput(adsk.cam.OperationTypes.MillingOperation)
+            # create a list for the models to add to the setup Input
+            models = []
+            part = recursivelyFindbRepBodies(cam.designRootOccurrence, "outer")
+            # add the part to the model list
+            models.append(part)
+            # pass the model list to the setup input
+            setupInput.models = models
+            # change some setup properties
+            setupInput.name = 'alignmentJig'
+            setupInput.stockMode = adsk.cam.SetupStockModes.FixedBoxStock
+            applyExpressions(setupInput.parameters, stock)
+
+            setup = setups.add(setupInput)
+            setFingerprint(setup, fingerprint, base)
+
+            #################### bore operation ####################
+            input = setup.operations.createInput('bore')
+            input.tool = self.boreTool
+            input.displayName = 'Bore1'
+
+            if 'Bore1' not in self.speeds:
                 for i in range(self.boreTool.presets.count):
                     if str(self.boreTool.presets.item(i).name) == "Wood":
                         input.toolPreset = self.boreTool.presets.item(i)
                         break
-        
-                input.parameters.itemByName('tool_coolant').expression = "'disabled'"
-                
-                if holeFaces is not None:
-                    faces = []
-                    for i in range(holeFaces.count):
-                        faces.append(holeFaces.item(i))
-
-                    modelParam = input.parameters.itemByName('circularFaces')
-                    geomSelect: adsk.cam.GeometrySelection = modelParam.value
-                    geomSelect.value = faces
-
-                # add the operation to the setup
-                boreOp = setup.operations.add(input)
-                cam.generateToolpath(boreOp)
- 
+
+            configureBore(input.parameters)
+
+            # add the operation to the setup
+            boreOp = setup.operations.add(input)
+            self.generate(cam, boreOp)
+
         except:
             if self.ui:
                 self.ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
-            
-            
+
+
     def create_foam_surface(self):
         #################### create setup FoamSurface ####################
         try:
-            
+
             cam: adsk.cam.CAM = adsk.cam.CAM.cast(self.products.itemByProductType("CAMProductType"))
             setups = cam.setups
-            setup = getSetup('reduceThickness', setups)
-            mainWorkpiece_x = self.design.userParameters.itemByName("mainWorkpiece_x").expression
-            mainWorkpiece_y = self.design.userParameters.itemByName("mainWorkpiece_y").expression
-            mainWorkpiece_z = self.design.userParameters.itemByName("mainWorkpiece_z").expression
-            if setup == None:
-                setupInput = setups.createInput(
-                    adsk.cam.OperationTypes.MillingOperation)
-                # create a list for the models to add to the setup Input
-                models = []
-                part = recursivelyFindbRepBodies(cam.designRootOccurrence, "outer")
-                # add the part to the model list
-                models.append(part)
-                # pass the model list to the setup input
-                setupInput.models = models
-                # change some setup properties
-                setupInput.name = 'reduceThickness'
-                setup = setups.add(setupInput)
-                param = setup.parameters
-                # set offset mode
-
-                setupInput.stockMode = adsk.cam.SetupStockModes.FixedBoxStock
-                param.itemByName('job_stockMode').expression = "'fixedbox'"
-                
-                param.itemByName('job_stockFixedX').expression = mainWorkpiece_x
-                param.itemByName('job_stockFixedXMode').expression = "'center'"
-                param.itemByName('job_stockFixedY').expression = mainWorkpiece_y
-                param.itemByName('job_stockFixedYMode').expression = "'center'"
-                param.itemByName('job_stockFixedZ').expression = mainWorkpiece_z
-                param.itemByName('job_stockFixedZMode').expression = "'bottom'"
-                param.itemByName('job_stockFixedZOffset').expression = '0 in'
-                param.itemByName('job_stockFixedRoundingValue').expression = '0 in'
-                
-
-                #################### face operation ####################
-                input = setup.operations.createInput('face')
-                input.tool = self.faceTool
-                input.displayName = 'Face1'
-                for i in range(self.faceTool.presets.count):
-                    if str(self.boreTool.presets.item(i).name) == "omsrud_face":
-                        input.toolPreset = self.boreTool.presets.item(i)
-
-                input.parameters.itemByName('tool_coolant').expression = "'disabled'"
-                input.parameters.itemByName('tool_spindleSpeed').expression = "3055.775 rpm"
-                input.parameters.itemByName('tool_surfaceSpeed').expression = "1000 ft/min"
-                input.parameters.itemByName('tool_feedCutting').expression = "122.2 in/min"
-                input.parameters.itemByName('bottomHeight_mode').expression = "'from surface top'"
-                input.parameters.itemByName('doMultipleDepths').expression = "true"
-                input.parameters.itemByName('maximumStepdown').expression = "0.125 in"
-
-                # add the operation to the setup
-                faceOp = setup.operations.add(input)
-                cam.generateToolpath(faceOp)
+            stock = {
+                'job_stockMode': "'fixedbox'",
+                'job_stockFixedX': self.userExpression("mainWorkpiece_x"),
+                'job_stockFixedXMode': "'center'",
+                'job_stockFixedY': self.userExpression("mainWorkpiece_y"),
+                'job_stockFixedYMode': "'center'",
+                'job_stockFixedZ': self.userExpression("mainWorkpiece_z"),
+                'job_stockFixedZMode': "'bottom'",
+                'job_stockFixedZOffset': '0 in',
+                'job_stockFixedRoundingValue': '0 in',
+            }
+            face = {
+                'tool_coolant': "'disabled'",
+                **self.speeds.get('Face1', {}),
+                'bottomHeight_mode': "'from surface top'",
+                'doMultipleDepths': "true",
+                'maximumStepdown': "0.125 in",
+            }
+
+            base = makeFingerprint(stock, face, self.faceTool)
+            fingerprint = self.setupFingerprint(base, {'Face1': self.faceTool})
+            face = self.swept('Face1', self.faceTool, face)
+
+            def configureFace(parameters):
+                applyExpressions(parameters, face)
+
+            if self.syncSetup(cam, 'reduceThickness', fingerprint, base, stock, {'Face1': (self.faceTool, configureFace)}):
+                return
+
+            setupInput = setups.createInput(
+                adsk.cam.OperationTypes.MillingOperation)
+            # create a list for the models to add to the setup Input
+            models = []
+            part = recursivelyFindbRepBodies(cam.designRootOccurrence, "outer")
+            # add the part to the model list
+            models.append(part)
+            # pass the model list to the setup input
+            setupInput.models = models
+            # change some setup properties
+            setupInput.name = 'reduceThickness'
+            setupInput.stockMode = adsk.cam.SetupStockModes.FixedBoxStock
+            setup = setups.add(setupInput)
+            applyExpressions(setup.parameters, stock)
+            setFingerprint(setup, fingerprint, base)
+
+            #################### face operation ####################
+            input = setup.operations.createInput('face')
+            input.tool = self.faceTool
+            input.displayName = 'Face1'
+            for i in range(self.faceTool.presets.count):
+                if str(self.faceTool.presets.item(i).name) == "omsrud_face":
+                    input.toolPreset = self.faceTool.presets.item(i)
+
+            configureFace(input.parameters)
+
+            # add the operation to the setup
+            faceOp = setup.operations.add(input)
+            self.generate(cam, faceOp)
         except:
             pass
-            
+
     def create_foam_bore(self, holeFaces=None):
-        
+
         try:
             cam: adsk.cam.CAM = adsk.cam.CAM.cast(self.products.itemByProductType("CAMProductType"))
             setups = cam.setups
-            setup = getSetup('mainHoles', setups)
-            mainWorkpiece_x = self.design.userParameters.itemByName("mainWorkpiece_x").expression
-            mainWorkpiece_y = self.design.userParameters.itemByName("mainWorkpiece_y").expression
-            mainWorkpiece_z = self.design.userParameters.itemByName("mainWorkpiece_z").expression
-            artifactHeight = self.design.userParameters.itemByName('artifactHeight').expression
-            if setup == None:
-                #################### create setup mainHoles ####################
-                setupInput = setups.createInput(
-                    adsk.cam.OperationTypes.MillingOperation)
-                # create a list for the models to add to the setup Input
-                models = []
-                part = recursivelyFindbRepBodies(cam.designRootOccurrence, "outer")
-                # add the part to the model list
-                models.append(part)
-                # pass the model list to the setup input
-                setupInput.models = models
-                # change some setup properties
-                setupInput.name = 'mainHoles'
-                setup = setups.add(setupInput)
-                param = setup.parameters
-                # set offset mode
-
-                #properllerHeight
-
-                param.itemByName('job_stockMode').expression = "'default'"
-                param.itemByName('job_stockOffsetMode').expression = "'keep'"
-
-                
-
-                #################### bore2 operation ####################
-                input = setup.operations.createInput('bore')
-                input.tool = self.bore2Tool
-                input.displayName = 'Bore2'
-
-                input.parameters.itemByName('tool_coolant').expression = "'disabled'"
-                input.parameters.itemByName('tool_spindleSpeed').expression = "15278.9 rpm"
-                input.parameters.itemByName('tool_surfaceSpeed').expression = "1000 ft/min"
-                input.parameters.itemByName('tool_feedCutting').expression = "397.251 in/min"
-
-                if holeFaces is not None:
-                    faces = []
-                    for i in range(holeFaces.count):
-                        faces.append(holeFaces.item(i))
-
-                    modelParam = input.parameters.itemByName('circularFaces')
-                    geomSelect: adsk.cam.GeometrySelection = modelParam.value
-                    geomSelect.value = faces
-
-
-                # add the operation to the setup
-                bore2Op = setup.operations.add(input)
-                cam.generateToolpath(bore2Op)
-                
+            stock = {
+                'job_stockMode': "'default'",
+                'job_stockOffsetMode': "'keep'",
+            }
+            bore2 = {
+                'tool_coolant': "'disabled'",
+                **self.speeds.get('Bore2', {}),
+            }
+
+            def configureBore2(parameters):
+                applyExpressions(parameters, bore2)
+                selectFaces(parameters, 'circularFaces', holeFaces)
+
+            # create a list for the models to add to the setup Input
+            models = []
+            part = recursivelyFindbRepBodies(cam.designRootOccurrence, "outer")
+            # add the part to the model list
+            models.append(part)
+
+            # The stock box follows the outer, so it changes with the outer
+            # and the parameters that size it.
+            base = makeFingerprint(stock, self.workpieceExpressions(), geometrySignature(models),
+                                   bore2, self.bore2Tool, geometrySignature(holeFaces))
+            fingerprint = self.setupFingerprint(base, {})
+            if self.syncSetup(cam, 'mainHoles', fingerprint, base, stock, {'Bore2': (self.bore2Tool, configureBore2)}):
+                return
+
+            #################### create setup mainHoles ####################
+            setupInput = setups.createInput(
+                adsk.cam.OperationTypes.MillingOperation)
+            # pass the model list to the setup input
+            setupInput.models = models
+            # change some setup properties
+            setupInput.name = 'mainHoles'
+            setup = setups.add(setupInput)
+            applyExpressions(setup.parameters, stock)
+            setFingerprint(setup, fingerprint, base)
+
+            #################### bore2 operation ####################
+            input = setup.operations.createInput('bore')
+            input.tool = self.bore2Tool
+            input.displayName = 'Bore2'
+
+            configureBore2(input.parameters)
+
+            # add the operation to the setup
+            bore2Op = setup.operations.add(input)
+            self.generate(cam, bore2Op)
+
         except:
             pass
-    
+
     def create_top_cut(self):
         try:
             cam: adsk.cam.CAM = adsk.cam.CAM.cast(self.products.itemByProductType("CAMProductType"))
             setups = cam.setups
-            setup = getSetup('topDown', setups)
-            mainWorkpiece_x = self.design.userParameters.itemByName("mainWorkpiece_x").expression
-            mainWorkpiece_y = self.design.userParameters.itemByName("mainWorkpiece_y").expression
-            mainWorkpiece_z = self.design.userParameters.itemByName("mainWorkpiece_z").expression
-            artifactHeight = self.design.userParameters.itemByName("artifactHeight").expression
-
-            if setup == None:
-                setupInput = setups.createInput(
-                    adsk.cam.OperationTypes.MillingOperation)
-                # create a list for the models to add to the setup Input
-                models = []
-                # find the component occurrence called top-down
-                top_down = recursivelyFindbRepBodies(cam.designRootOccurrence, "artifact")
-                if(top_down.objectType == "adsk::fusion::BRepBody"):
-                    models.append(top_down)
-                elif(top_down.objectType == "adsk::fusion::Occurrence"):
-                    for bodies in top_down.bRepBodies:
-                        models.append(bodies)
-                # pass the model list to the setup input
-                setupInput.models = models
-                # change some setup properties
-                setupInput.name = 'topDown'
-                
-                setup = setups.add(setupInput)
-                param = setup.parameters
-        
-                # set offset mode
-                param.itemByName('job_stockMode').expression = "'default'"
-                param.itemByName('job_stockOffsetMode').expression = "'keep'"
-        
-
-
-                #################### pocket operation ####################
-                input = setup.operations.createInput('pocket_clearing')
-                input.tool = self.boreTool
-                input.displayName = 'Pocket'
-
-                input.parameters.itemByName('tool_coolant').expression = "'disabled'"
-                input.parameters.itemByName('tool_spindleSpeed').expression = "15278.9 rpm"
-                input.parameters.itemByName('tool_surfaceSpeed').expression = "1000 ft/min"
-                input.parameters.itemByName('tool_feedCutting').expression = "397.251 in/min"
-                input.parameters.itemByName('clearanceHeight_offset').expression = "0.25 in"
-                input.parameters.itemByName('stockContours').expression = "true"
-                input.parameters.itemByName('tolerance').expression = "0.01in"
-                input.parameters.itemByName('useRestMachining').expression = "false"
-                input.parameters.itemByName('useStockToLeave').expression = "false"
-                input.parameters.itemByName('minimumStepdown').expression = "0.01 in"
-                input.parameters.itemByName('optimalLoad').expression = "0.2 in"
-                input.parameters.itemByName('rampType').expression = "'plunge'"
-
-                # if innerTopEdges is not None:
-                if True:
-                    cadcontours2dParam: adsk.cam.CadContours2dParameterValue = input.parameters.itemByName('stockContours').value
-                    # Get the CurveSelections object from the CAD contour. This
-                    # object manages the list of contour selections.
-                    curveSelections = cadcontours2dParam.getCurveSelections()
-
-                    # Get the edges from the loop and add them to a list.
-                    # outerEdges = [e for e in innerTopEdges]
-
-                    # Create a new chain selection.
-                    chainSel: adsk.cam.ChainSelection = curveSelections.createNewChainSelection()
-
-                    # Set some properties of the chain.
-                    chainSel.isOpen = False
-                    chainSel.isReverted = False
-
-                    # Add the geometry to the chain.
-                    chainSel.inputGeometry = []
-
-                    # Apply the curve selection back to the parameter.
-                    cadcontours2dParam.applyCurveSelections(curveSelections)
-
-                # add the operation to the setup
-                pocketOp = setup.operations.add(input)
-                # cam.generateToolpath(pocketOp)
-
-                #################### scallop operation ####################
-                input = setup.operations.createInput('scallop')
-                input.tool = self.bore2Tool
-                input.displayName = 'Scallop'
-
-                input.parameters.itemByName('tool_coolant').expression = "'disabled'"
-                input.parameters.itemByName('tool_spindleSpeed').expression = "16000 rpm"
-                input.parameters.itemByName('tool_surfaceSpeed').expression = "1047.2 ft/min"
-                input.parameters.itemByName('tool_feedCutting').expression = "250 in/min"
-
-                input.parameters.itemByName('clearanceHeight_offset').expression = "0.4 in"
-                input.parameters.itemByName('retractHeight_offset').expression = "0.2 in"
-
-                #input.parameters.itemByName('stockContours').expression = "true"
-                input.parameters.itemByName('tolerance').expression = "0.005 in"
-
-
-                input.parameters.itemByName('useRestMachining').expression = "false"
-                input.parameters.itemByName('useStockToLeave').expression = "false"
-                # input.parameters.itemByName('minimumStepdown').expression = "0.01 in"
-                # input.parameters.itemByName('optimalLoad').expression = "0.2 in"
-                # input.parameters.itemByName('rampType').expression = "'plunge'"
-
-                # add the operation to the setup
-                ScallopOp = setup.operations.add(input)
-
-                operations = adsk.core.ObjectCollection.create()
-                operations.add(AdaptiveOp)
-                operations.add(ScallopOp)
-
-                # generate the valid operations
-                cam.generateToolpath(operations)
-
-            
+            stock = {
+                'job_stockMode': "'default'",
+                'job_stockOffsetMode': "'keep'",
+            }
+            pocket = {
+                'tool_coolant': "'disabled'",
+                **self.speeds.get('Pocket', {}),
+                'clearanceHeight_offset': "0.25 in",
+                'stockContours': "true",
+                'tolerance': "0.01in",
+                'useRestMachining': "false",
+                'useStockToLeave': "false",
+                'minimumStepdown': "0.01 in",
+                'optimalLoad': "0.2 in",
+                'rampType': "'plunge'",
+            }
+            scallop = {
+                'tool_coolant': "'disabled'",
+                **self.speeds.get('Scallop', {}),
+                'clearanceHeight_offset': "0.4 in",
+                'retractHeight_offset': "0.2 in",
+                'tolerance': "0.005 in",
+                'useRestMachining': "false",
+                'useStockToLeave': "false",
+            }
+
+            # The stock box follows the artifacts, so it changes with them
+            # and the parameters that place them.
+            models = artifactModels(cam)
+            base = makeFingerprint(stock, self.workpieceExpressions(), geometrySignature(models),
+                                   pocket, self.boreTool, scallop, self.bore2Tool)
+            fingerprint = self.setupFingerprint(base, {'Pocket': self.boreTool, 'Scallop': self.bore2Tool})
+            pocket = self.swept('Pocket', self.boreTool, pocket)
+            scallop = self.swept('Scallop', self.bore2Tool, scallop)
+
+            def configurePocket(parameters):
+                applyExpressions(parameters, pocket)
+                selectChains(parameters, 'stockContours', [])
+
+            def configureScallop(parameters):
+                applyExpressions(parameters, scallop)
+
+            if self.syncSetup(cam, 'topDown', fingerprint, base, stock, {
+                'Pocket': (self.boreTool, configurePocket),
+                'Scallop': (self.bore2Tool, configureScallop),
+            }):
+                return
+
+            setupInput = setups.createInput(
+                adsk.cam.OperationTypes.MillingOperation)
+            setupInput.models = models
+            # change some setup properties
+            setupInput.name = 'topDown'
+
+            setup = setups.add(setupInput)
+            applyExpressions(setup.parameters, stock)
+            setFingerprint(setup, fingerprint, base)
+
+            #################### pocket operation ####################
+            input = setup.operations.createInput('pocket_clearing')
+            input.tool = self.boreTool
+            input.displayName = 'Pocket'
+
+            configurePocket(input.parameters)
+
+            # add the operation to the setup
+            pocketOp = setup.operations.add(input)
+
+            #################### scallop operation ####################
+            input = setup.operations.createInput('scallop')
+            input.tool = self.bore2Tool
+            input.displayName = 'Scallop'
+
+            configureScallop(input.parameters)
+
+            # add the operation to the setup
+            ScallopOp = setup.operations.add(input)
+
+            # generate the valid operations
+            self.generate(cam, pocketOp, ScallopOp)
+
         except:
-            pass
-    
-    def create_bottom_cut(self, innerBottomEdges):
-        
+            if self.ui:
+                self.ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+    def create_bottom_cut(self, openingLoops):
+
         try:
             cam: adsk.cam.CAM = adsk.cam.CAM.cast(self.products.itemByProductType("CAMProductType"))
             setups = cam.setups
-            setup = getSetup('bottomUp', setups)
-            mainWorkpiece_x = self.design.userParameters.itemByName("mainWorkpiece_x").expression
-            mainWorkpiece_y = self.design.userParameters.itemByName("mainWorkpiece_y").expression
-            mainWorkpiece_z = self.design.userParameters.itemByName("mainWorkpiece_z").expression
-            artifactHeight = self.design.userParameters.itemByName("artifactHeight").expression
-            if setup == None:
-                #################### create setup BottomCut ####################
-                setupInput = setups.createInput(
-                    adsk.cam.OperationTypes.MillingOperation)
-                # create a list for the models to add to the setup Input
-                models = []
-                
-                flipped_top_down = recursivelyFindbRepBodies(cam.designRootOccurrence, "artifact")
-                if(flipped_top_down.objectType == "adsk::fusion::BRepBody"):
-                    models.append(flipped_top_down)
-                elif(flipped_top_down.objectType == "adsk::fusion::Occurrence"):
-                    for bodies in flipped_top_down.bRepBodies:
-                        models.append(bodies)
-                    
-                # pass the model list to the setup input
-                setupInput.models = models
-                # change some setup properties
-                setupInput.name = 'bottomUp'
-                setup = setups.add(setupInput)
-                param = setup.parameters
-                    
-                # set offset mode
-                param.itemByName('job_stockMode').expression = "'default'"
-                param.itemByName('job_stockOffsetMode').expression = "'keep'"
-                param.itemByName('wcs_orientation_mode').expression = "'axesZY'"
-                param.itemByName('wcs_orientation_flipY').expression = 'true'
-                param.itemByName('wcs_orientation_flipZ').expression = 'true'
-                param.itemByName('wcs_origin_mode').expression = "'modelOrigin'"
-
-
-                #################### adaptive operation ####################
-                input = setup.operations.createInput('adaptive')
-                input.tool = self.bore2Tool
-                input.displayName = 'Adaptive2'
-
-                input.parameters.itemByName('tool_coolant').expression = "'disabled'"
-                input.parameters.itemByName('tool_spindleSpeed').expression = "15278.9 rpm"
-                input.parameters.itemByName('tool_surfaceSpeed').expression = "1000 ft/min"
-                input.parameters.itemByName('tool_feedCutting').expression = "397.251 in/min"
-                input.parameters.itemByName('clearanceHeight_offset').expression = "0.25 in"
-                input.parameters.itemByName('stockContours').expression = "true"
-                input.parameters.itemByName('tolerance').expression = "0.01 in"
-                input.parameters.itemByName('useRestMachining').expression = "false"
-                input.parameters.itemByName('useStockToLeave').expression = "false"
-                input.parameters.itemByName('minimumStepdown').expression = "0.01 in"
-                input.parameters.itemByName('optimalLoad').expression = "0.2 in"
-                input.parameters.itemByName('rampType').expression = "'plunge'"
-
-
-                if innerBottomEdges is not None:
-                    edgeList = [e for e in innerBottomEdges]
-
-                    cadcontours2dParam: adsk.cam.CadContours2dParameterValue = input.parameters.itemByName('stockContours').value
-                    # Get the CurveSelections object from the CAD contour. This
-                    # object manages the list of contour selections.
-                    curveSelections = cadcontours2dParam.getCurveSelections()
-
-                    # Get the edges from the loop and add them to a list.
-                    outerEdges = [e for e in innerBottomEdges]
-
-                    # Create a new chain selection.
-                    chainSel: adsk.cam.ChainSelection = curveSelections.createNewChainSelection()
-
-                    # Set some properties of the chain.
-                    chainSel.isOpen = False
-                    chainSel.isReverted = False
-
-                    # Add the geometry to the chain.
-                    chainSel.inputGeometry = outerEdges
-
-                    # Apply the curve selection back to the parameter.
-                    cadcontours2dParam.applyCurveSelections(curveSelections)
-
-
-                # add the operation to the setup
-                bore2Op = setup.operations.add(input)
-                cam.generateToolpath(bore2Op)
+            # Start from what the top-down pass left behind, so the flipped
+            # pass only clears the remaining material.
+            topDown = precedingSetup(cam, 'bottomUp', 'topDown') if config.CHAIN_SETUP_STOCK else None
+            stock = {
+                'job_stockMode': "'previoussetup'" if topDown else "'default'",
+                'wcs_orientation_mode': "'axesZY'",
+                'wcs_orientation_flipY': 'true',
+                'wcs_orientation_flipZ': 'true',
+                'wcs_origin_mode': "'modelOrigin'",
+            }
+            if not topDown:
+                stock['job_stockOffsetMode'] = "'keep'"
+            adaptive = {
+                'tool_coolant': "'disabled'",
+                **self.speeds.get('Adaptive2', {}),
+                'clearanceHeight_offset': "0.25 in",
+                'stockContours': "true",
+                'tolerance': "0.01 in",
+                'useRestMachining': "true" if topDown else "false",
+                'useStockToLeave': "false",
+                'minimumStepdown': "0.01 in",
+                'optimalLoad': "0.2 in",
+                'rampType': "'plunge'",
+            }
+            # The stock comes from topDown, so it changes whenever topDown does.
+            models = artifactModels(cam)
+            base = makeFingerprint(stock, self.workpieceExpressions(), geometrySignature(models),
+                                   adaptive, self.bore2Tool, [geometrySignature(loop) for loop in openingLoops],
+                                   getFingerprint(topDown) if topDown else None)
+            fingerprint = self.setupFingerprint(base, {'Adaptive2': self.bore2Tool})
+            adaptive = self.swept('Adaptive2', self.bore2Tool, adaptive)
+
+            def configureAdaptive(parameters):
+                applyExpressions(parameters, adaptive)
+                selectChains(parameters, 'stockContours', openingLoops)
+
+            if self.syncSetup(cam, 'bottomUp', fingerprint, base, stock, {'Adaptive2': (self.bore2Tool, configureAdaptive)}):
+                return
+
+            #################### create setup BottomCut ####################
+            setupInput = setups.createInput(
+                adsk.cam.OperationTypes.MillingOperation)
+            setupInput.models = models
+            # change some setup properties
+            setupInput.name = 'bottomUp'
+            setup = setups.add(setupInput)
+            applyExpressions(setup.parameters, stock)
+            setFingerprint(setup, fingerprint, base)
+
+            #################### adaptive operation ####################
+            input = setup.operations.createInput('adaptive')
+            input.tool = self.bore2Tool
+            input.displayName = 'Adaptive2'
+
+            configureAdaptive(input.parameters)
+
+            # add the operation to the setup
+            bore2Op = setup.operations.add(input)
+            self.generate(cam, bore2Op)
         except:
-            pass
-            
-    
-def getLibrariesURLs(libraries: adsk.cam.ToolLibraries, url: adsk.core.URL):
-    ''' Return the list of libraries URL in the specified library '''
-    urls: list[str] = []
-    libs = libraries.childAssetURLs(url)
-    for lib in libs:
-        urls.append(lib.toString())
-    for folder in libraries.childFolderURLs(url):
-        urls = urls + getLibrariesURLs(libraries, folder)
-    return urls
-
+            if self.ui:
+                self.ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
 
 
 def getSetup(setup_name, setups):
@@ -496,35 +547,127 @@ def getSetup(setup_name, setups):
             return setup
     return None
 
-def recursivelyFindbRepBodies(currentOccurence, name):
-    bRepBodies = currentOccurence.bRepBodies
-    childOccurrences = currentOccurence.childOccurrences
+def precedingSetup(cam: adsk.cam.CAM, name: str, previousName: str):
+    ''' The setup named previousName if it comes right before the setup named
+    name, or is the last setup while name doesn't exist yet; otherwise None.
+    A setup can only take its stock from the setup right before it. '''
+    names = [setup.name for setup in cam.setups]
+    if previousName not in names:
+        return None
+    position = names.index(name) if name in names else len(names)
+    if names.index(previousName) != position - 1:
+        return None
+    return getSetup(previousName, cam.setups)
+
+def applyExpressions(parameters: adsk.cam.CAMParameters, expressions: dict):
+    for name, expression in expressions.items():
+        parameter = parameters.itemByName(name)
+        if parameter.expression != expression:
+            parameter.expression = expression
+
+def selectFaces(parameters: adsk.cam.CAMParameters, name: str, faces):
+    if faces is None:
+        return
+    geomSelect: adsk.cam.GeometrySelection = parameters.itemByName(name).value
+    geomSelect.value = [faces.item(i) for i in range(faces.count)]
+
+def selectChains(parameters: adsk.cam.CAMParameters, name: str, chains: list):
+    ''' Select one closed chain for each list of edges in chains. '''
+    cadcontours2dParam: adsk.cam.CadContours2dParameterValue = parameters.itemByName(name).value
+    # Get the CurveSelections object from the CAD contour. This
+    # object manages the list of contour selections.
+    curveSelections = cadcontours2dParam.getCurveSelections()
+    # Replace any chain from a previous run.
+    curveSelections.clear()
+
+    for edges in chains:
+        # Create a new chain selection.
+        chainSel: adsk.cam.ChainSelection = curveSelections.createNewChainSelection()
+
+        # Set some properties of the chain.
+        chainSel.isOpen = False
+        chainSel.isReverted = False
+
+        # Add the geometry to the chain.
+        chainSel.inputGeometry = edges
+
+    # Apply the curve selection back to the parameter.
+    cadcontours2dParam.applyCurveSelections(curveSelections)
+
+def artifactModels(cam: adsk.cam.CAM) -> list:
+    ''' The bodies of every artifact the jig holds. Raises if one of them is
+    missing rather than machining a setup without it. '''
+    design = adsk.fusion.Design.cast(cam.parentDocument.products.itemByProductType('DesignProductType'))
+    models = []
+    for name in storedArtifacts(design):
+        artifact = recursivelyFindbRepBodies(cam.designRootOccurrence, name)
+        if artifact is None:
+            raise RuntimeError('No body named {} to machine; nest or create the outer again'.format(name))
+        if(artifact.objectType == "adsk::fusion::BRepBody"):
+            models.append(artifact)
+        elif(artifact.objectType == "adsk::fusion::Occurrence"):
+            for bodies in artifact.bRepBodies:
+                models.append(bodies)
+    return models
+
+def geometrySignature(entities) -> list:
+    ''' The bounding box of each body, face or edge with its volume, area
+    and loop count, or length. Entity tokens can change whenever Fusion
+    recomputes a body, so fingerprints compare the geometry instead. '''
+    if entities is None:
+        return []
+    if not isinstance(entities, list):
+        entities = [entities.item(i) for i in range(entities.count)]
+    signature = []
+    for entity in entities:
+        box = entity.boundingBox
+        measures = [round(value, 4) for point in (box.minPoint, box.maxPoint) for value in point.asArray()]
+        if entity.objectType == adsk.fusion.BRepBody.classType():
+            measures.append(round(entity.volume, 4))
+        elif entity.objectType == adsk.fusion.BRepFace.classType():
+            measures += [round(entity.area, 4), entity.loops.count]
+        else:
+            measures.append(round(entity.length, 4))
+        signature.append(measures)
+    # The same geometry can be listed in any order.
+    return sorted(signature)
+
+def makeFingerprint(*inputs) -> str:
+    ''' Hash a setup's inputs: parameter expressions, tools and geometry signatures '''
+    def encode(value):
+        if isinstance(value, adsk.cam.Tool):
+            return value.parameters.itemByName('tool_description').expression
+        return value
+    return hashlib.sha1(json.dumps([encode(value) for value in inputs], sort_keys=True).encode('utf-8')).hexdigest()
+
+def getFingerprint(setup: adsk.cam.Setup):
+    attribute = setup.attributes.itemByName(FINGERPRINT_GROUP, FINGERPRINT_NAME)
+    return attribute.value if attribute else None
+
+def setFingerprint(setup: adsk.cam.Setup, fingerprint: str, base: str):
+    setup.attributes.add(FINGERPRINT_GROUP, FINGERPRINT_NAME, fingerprint)
+    setup.attributes.add(FINGERPRINT_GROUP, BASE_FINGERPRINT_NAME, base)
+
+def refreshSweptFingerprints(setupNames: list):
+    ''' Fold the values a parameter sweep just applied and recorded into the
+    named setups' fingerprints, as SetupMaker would compute them now '''
+    app = adsk.core.Application.get()
+    cam = adsk.cam.CAM.cast(app.activeDocument.products.itemByProductType('CAMProductType'))
+    if cam is None:
+        return
+    signature = partSignature(recursivelyFindbRepBodies(cam.designRootOccurrence, "artifact"))
+    for setup in cam.setups:
+        attribute = setup.attributes.itemByName(FINGERPRINT_GROUP, BASE_FINGERPRINT_NAME)
+        if setup.name not in setupNames or attribute is None:
+            continue
+        sweeps = {operation.name: operation.tool for operation in setup.operations if operation.name in SWEEPS}
+        setFingerprint(setup, sweptFingerprint(attribute.value, sweeps, signature), attribute.value)
 
-    if currentOccurence.name == name:
-        return currentOccurence
-
-    if bRepBodies and bRepBodies.count > 0:
-        for i in range(bRepBodies.count):
-            if bRepBodies.item(i).name == name:
-                return bRepBodies.item(i)
-
-    if childOccurrences and childOccurrences.count > 0:
-        for i in range(childOccurrences.count):
-            result = recursivelyFindbRepBodies(childOccurrences.item(i), name)
-            if result is not None:
-                return result
-
-    return None
+def recursivelyFindbRepBodies(currentOccurence, name):
+    return entityIndex.find(currentOccurence, name)
 
 def recursivelyFindOccurences(currentOccurence, name):
-    childOccurrences = currentOccurence.childOccurrences
-    if currentOccurence.name == name:
-        return currentOccurence
-
-    if childOccurrences and childOccurrences.count > 0:
-        for i in range(childOccurrences.count):
-            result = recursivelyFindOccurences(childOccurrences.item(i), name)
-            if result is not None:
-                return result
-
-    return None
\ No newline at end of file
+    for entity in entityIndex.lookup(currentOccurence).get(name, []):
+        if entity.objectType == adsk.fusion.Occurrence.classType():
+            return entity
+    return None
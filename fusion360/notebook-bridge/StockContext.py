@@ -0,0 +1,227 @@
+"""
+One snapshot of everything the jig and CAM stages read from the design.
+
+Building the outer, tabs and holes and creating the setups used to look up
+the artifact, pad its bounding box and read user parameters over and over.
+A StockContext is captured in a single pass over the design instead, and
+every stage reads from it, so all of them work from the same numbers.
+Once the jig is built, the context also holds the entity tokens of the
+outer's bottom and top faces and of the dowel holes, found through the
+jig's named features, so later stages can use them after a restart.
+Lengths are in Fusion's internal centimeters.
+
+The context's fingerprint is stored on the design when the jig is built,
+so a later create_outer can tell whether the artifact or the jig's
+parameters changed and the jig needs updating. The names of the bodies the
+jig holds are stored with it, so the setups machine every one of them.
+"""
+
+import adsk.core, adsk.fusion
+import hashlib
+import json
+import types
+import typing
+
+from . import config
+from .EntityIndex import entityIndex
+
+# Names of the jig's features and sketches, so they can be found and
+# updated when the artifact changes.
+OUTER_SKETCH = 'outerSketch'
+OUTER_EXTRUDE = 'outer'
+TAB_SKETCH = 'tabSketch'
+TAB_EXTRUDE = 'tabs'
+DOWEL_PLANE = 'dowelPlane'
+DOWEL_SKETCH = 'dowelSketch'
+DOWEL_HOLES = 'dowelHoles'
+
+FINGERPRINT_GROUP = 'Tandem'
+FINGERPRINT_NAME = 'stockFingerprint'
+# Stored instead of a fingerprint for a jig holding several nested bodies,
+# which create_outer does not refit.
+NESTED_FINGERPRINT = 'nested'
+ARTIFACTS_NAME = 'artifacts'
+# The body a jig built by create_outer holds.
+DEFAULT_ARTIFACTS = ('artifact',)
+
+# The user parameters the pipeline reads.
+PARAMETER_NAMES = (
+    'artifactHeight',
+    'dowelDiam',
+    'mainWorkpiece_x',
+    'mainWorkpiece_y',
+    'mainWorkpiece_z',
+    'jigWorkpiece_x',
+    'jigWorkpiece_y',
+    'jigWorkpiece_z',
+    'jigOffset',
+    'tabPadding',
+)
+
+# Jig parameters and the expressions they start from when the design does
+# not have them yet.
+JIG_PARAMETERS = {
+    'jigOffset': config.JIG_OFFSET,
+    'tabPadding': config.TAB_PADDING,
+}
+
+
+class Bounds(typing.NamedTuple):
+    minX: float
+    minY: float
+    minZ: float
+    maxX: float
+    maxY: float
+    maxZ: float
+
+    @property
+    def midX(self) -> float:
+        return (self.minX + self.maxX) / 2
+
+    @property
+    def midY(self) -> float:
+        return (self.minY + self.maxY) / 2
+
+    @property
+    def midZ(self) -> float:
+        return (self.minZ + self.maxZ) / 2
+
+    @property
+    def width(self) -> float:
+        return self.maxX - self.minX
+
+    @property
+    def depth(self) -> float:
+        return self.maxY - self.minY
+
+    @property
+    def height(self) -> float:
+        return self.maxZ - self.minZ
+
+
+class ParameterValue(typing.NamedTuple):
+    value: float
+    expression: str
+
+
+class StockContext(typing.NamedTuple):
+    # the artifact's bounding box, padded by tabPadding in x and y
+    bounds: typing.Optional[Bounds]
+    # evaluated user parameters by name, for those that exist, and the
+    # jig parameters at their defaults if they do not
+    parameters: typing.Mapping[str, ParameterValue]
+    # the artifact's volume, in cubic centimeters
+    volume: float = 0.0
+    # entity tokens of the outer's bottom and top faces, once built
+    outerFaceTokens: typing.Tuple[str, ...] = ()
+    # entity tokens of the dowel hole faces, once drilled
+    holeFaceTokens: typing.Tuple[str, ...] = ()
+
+    def value(self, name: str) -> float:
+        return self.parameters[name].value
+
+    def expression(self, name: str) -> str:
+        return self.parameters[name].expression
+
+    def fingerprint(self) -> str:
+        """Hash of what the jig is built from: the artifact's size and
+        position, its volume and the jig parameters."""
+        inputs = [
+            [round(value, 4) for value in self.bounds] if self.bounds else None,
+            round(self.volume, 4),
+            [self.parameters[name].expression for name in JIG_PARAMETERS if name in self.parameters],
+        ]
+        return hashlib.sha1(json.dumps(inputs).encode('utf-8')).hexdigest()
+
+    def withOuter(self, bottomFace, topFace, holeFaces) -> 'StockContext':
+        return self._replace(
+            outerFaceTokens=(bottomFace.entityToken, topFace.entityToken),
+            holeFaceTokens=tuple(holeFaces.item(i).entityToken for i in range(holeFaces.count)),
+        )
+
+    def refreshed(self) -> 'StockContext':
+        """A new capture of the design, keeping the faces of the outer if
+        the design's features no longer name them."""
+        context = captureStockContext()
+        return context._replace(
+            outerFaceTokens=context.outerFaceTokens or self.outerFaceTokens,
+            holeFaceTokens=context.holeFaceTokens or self.holeFaceTokens,
+        )
+
+    def holeFaces(self, design: typing.Optional[adsk.fusion.Design] = None) -> typing.Optional[adsk.core.ObjectCollection]:
+        if not self.holeFaceTokens:
+            return None
+        design = design or adsk.fusion.Design.cast(adsk.core.Application.get().activeProduct)
+        faces = adsk.core.ObjectCollection.create()
+        for token in self.holeFaceTokens:
+            for entity in design.findEntityByToken(token):
+                faces.add(entity)
+        return faces
+
+    def outerFaces(self, design: typing.Optional[adsk.fusion.Design] = None) -> typing.Tuple[typing.Optional[adsk.fusion.BRepFace], typing.Optional[adsk.fusion.BRepFace]]:
+        """The outer's bottom and top faces, or None for each not found."""
+        if not self.outerFaceTokens:
+            return None, None
+        design = design or adsk.fusion.Design.cast(adsk.core.Application.get().activeProduct)
+        faces = []
+        for token in self.outerFaceTokens:
+            found = design.findEntityByToken(token)
+            faces.append(found[0] if found else None)
+        return tuple(faces)
+
+
+def captureStockContext(design: typing.Optional[adsk.fusion.Design] = None) -> StockContext:
+    design = design or adsk.fusion.Design.cast(adsk.core.Application.get().activeProduct)
+    parameters = {}
+    for parameter in design.userParameters:
+        if parameter.name in PARAMETER_NAMES:
+            parameters[parameter.name] = ParameterValue(parameter.value, parameter.expression)
+    for name, expression in JIG_PARAMETERS.items():
+        if name not in parameters:
+            parameters[name] = ParameterValue(design.unitsManager.evaluateExpression(expression, 'cm'), expression)
+
+    bounds = None
+    volume = 0.0
+    artifact = entityIndex.find(design.rootComponent, 'artifact')
+    if artifact is not None:
+        box = artifact.boundingBox
+        minP = box.minPoint
+        maxP = box.maxPoint
+        padding = parameters['tabPadding'].value
+        bounds = Bounds(minP.x - padding, minP.y - padding, minP.z,
+                        maxP.x + padding, maxP.y + padding, maxP.z)
+        if artifact.objectType == adsk.fusion.BRepBody.classType():
+            volume = artifact.volume
+        else:
+            volume = sum(body.volume for body in artifact.bRepBodies)
+
+    outerFaceTokens = ()
+    holeFaceTokens = ()
+    features = design.rootComponent.features
+    outer = features.extrudeFeatures.itemByName(OUTER_EXTRUDE)
+    if outer is not None and outer.startFaces.count and outer.endFaces.count:
+        outerFaceTokens = (outer.startFaces.item(0).entityToken, outer.endFaces.item(0).entityToken)
+    holes = features.holeFeatures.itemByName(DOWEL_HOLES)
+    if holes is not None:
+        holeFaceTokens = tuple(face.entityToken for face in holes.faces)
+    return StockContext(bounds, types.MappingProxyType(parameters), volume, outerFaceTokens, holeFaceTokens)
+
+
+def storedFingerprint(design: adsk.fusion.Design) -> typing.Optional[str]:
+    """The fingerprint of the context the jig was last built from."""
+    attribute = design.attributes.itemByName(FINGERPRINT_GROUP, FINGERPRINT_NAME)
+    return attribute.value if attribute else None
+
+
+def storeFingerprint(design: adsk.fusion.Design, fingerprint: str):
+    design.attributes.add(FINGERPRINT_GROUP, FINGERPRINT_NAME, fingerprint)
+
+
+def storedArtifacts(design: adsk.fusion.Design) -> typing.Tuple[str, ...]:
+    """The names of the bodies the jig was last built around."""
+    attribute = design.attributes.itemByName(FINGERPRINT_GROUP, ARTIFACTS_NAME)
+    return tuple(json.loads(attribute.value)) if attribute else DEFAULT_ARTIFACTS
+
+
+def storeArtifacts(design: adsk.fusion.Design, names: typing.Iterable[str]):
+    design.attributes.add(FINGERPRINT_GROUP, ARTIFACTS_NAME, json.dumps(list(names)))
@@ -0,0 +1,146 @@
+"""
+Resolves the CAM tools SetupMaker uses from the shopbot tool library.
+
+Scanning the library means enumerating every local library URL, loading
+the library and reading parameters off every tool, so the result is cached
+in memory for the session and on disk between sessions. The cache is keyed
+by the library's URL, a stamp of its contents and the modification time of
+the catalogue that picks the tools; it is only rebuilt when one changes.
+The library's contents are only loaded and stamped the first time tools
+are needed in a session. After that, tools come from memory unless the
+catalogue's modification time changed, so edits to the library in Fusion
+are picked up in the next session.
+"""
+
+import adsk.core, adsk.cam
+import hashlib
+import json
+import os
+from .ToolCatalogue import ToolCatalogue, libraryPath, resolveToolSpecs
+
+cachePath = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'toolCache.json')
+
+# The resolved tools of this session, as {'url', 'stamp', 'catalogueStamp', 'tools'}.
+sessionTools = None
+
+
+def catalogueStamp():
+    ''' Modification time of the catalogue's library JSON, or None if it is missing '''
+    try:
+        return os.path.getmtime(libraryPath)
+    except OSError:
+        return None
+
+
+def loadShopbotTools() -> dict:
+    ''' Return the shopbot tools by role, scanning the library only if it changed '''
+    global sessionTools
+    catalogueMtime = catalogueStamp()
+    if sessionTools and sessionTools['catalogueStamp'] == catalogueMtime:
+        return dict(sessionTools['tools'])
+
+    toolLibraries = adsk.cam.CAMManager.get().libraryManager.toolLibraries
+    record = readCache()
+    if record and record.get('catalogueStamp') == catalogueMtime:
+        toolLibrary = loadLibrary(toolLibraries, record['url'])
+        if toolLibrary is not None and libraryStamp(toolLibrary) == record['stamp']:
+            tools = {role: adsk.cam.Tool.createFromJson(toolJson)
+                     for role, toolJson in record['tools'].items()}
+            sessionTools = {'url': record['url'], 'stamp': record['stamp'],
+                            'catalogueStamp': catalogueMtime, 'tools': tools}
+            return dict(tools)
+
+    url = findShopbotLibraryURL(toolLibraries)
+    if url is None:
+        # The library was never imported into Fusion, so build the tools
+        # straight from the catalogue's copy of it.
+        catalogue = ToolCatalogue.load()
+        tools = {role: adsk.cam.Tool.createFromJson(catalogue.toolJson(tool))
+                 for role, tool in resolveToolSpecs(catalogue).items()}
+        sessionTools = {'url': None, 'stamp': catalogue.stamp, 'catalogueStamp': catalogueMtime, 'tools': tools}
+        return dict(tools)
+    toolLibrary = loadLibrary(toolLibraries, url)
+    tools = scanLibrary(toolLibrary)
+    stamp = libraryStamp(toolLibrary)
+    sessionTools = {'url': url, 'stamp': stamp, 'catalogueStamp': catalogueMtime, 'tools': tools}
+    writeCache({
+        'url': url,
+        'stamp': stamp,
+        'catalogueStamp': catalogueMtime,
+        'tools': {role: tool.toJson() for role, tool in tools.items()},
+    })
+    return dict(tools)
+
+
+def scanLibrary(toolLibrary: adsk.cam.ToolLibrary) -> dict:
+    # The catalogue picks each tool by its specification; we then only need
+    # to read the description off the library tools to find the same ones.
+    wanted = {}
+    for role, catalogueTool in resolveToolSpecs(ToolCatalogue.load()).items():
+        wanted.setdefault("'{}'".format(catalogueTool.description), []).append(role)
+    tools = {}
+    for tool in toolLibrary:
+        roles = wanted.pop(tool.parameters.itemByName('tool_description').expression, [])
+        for role in roles:
+            tools[role] = tool
+        # exit when every tool is found
+        if not wanted:
+            break
+    return tools
+
+
+def findShopbotLibraryURL(toolLibraries: adsk.cam.ToolLibraries):
+    fusion360Folder = toolLibraries.urlByLocation(
+        adsk.cam.LibraryLocations.LocalLibraryLocation)
+    for str_url in getLibrariesURLs(toolLibraries, fusion360Folder):
+        if 'shopbot' in str_url:
+            return str_url
+    return None
+
+
+def getLibrariesURLs(libraries: adsk.cam.ToolLibraries, url: adsk.core.URL):
+    ''' Return the list of libraries URL in the specified library '''
+    urls: list[str] = []
+    libs = libraries.childAssetURLs(url)
+    for lib in libs:
+        urls.append(lib.toString())
+    for folder in libraries.childFolderURLs(url):
+        urls = urls + getLibrariesURLs(libraries, folder)
+    return urls
+
+
+def loadLibrary(toolLibraries: adsk.cam.ToolLibraries, url: str):
+    try:
+        return toolLibraries.toolLibraryAtURL(adsk.core.URL.create(url))
+    except:
+        # The library was moved or deleted since we cached its URL.
+        return None
+
+
+def libraryStamp(toolLibrary: adsk.cam.ToolLibrary) -> str:
+    # The API exposes no modification time for a library, but one call to
+    # toJson is far cheaper than reading parameters off every tool, and it
+    # is made at most once per session.
+    return hashlib.sha1(toolLibrary.toJson().encode('utf-8')).hexdigest()
+
+
+def readCache():
+    try:
+        with open(cachePath, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(record, dict) or not {'url', 'stamp', 'tools'} <= record.keys():
+        return None
+    return record
+
+
+def writeCache(record: dict):
+    tmpPath = cachePath + '.tmp'
+    try:
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmpPath, cachePath)
+    except OSError:
+        # A read-only add-in folder only costs us the scan next session.
+        pass
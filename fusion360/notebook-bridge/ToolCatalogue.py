@@ -0,0 +1,196 @@
+"""
+Offline catalogue of the tools in fusion360/toolLibrary/shopbotCamTool.json.
+
+This module does not use the Fusion API, so tool selection can be done and
+tested without Fusion running. The library JSON is parsed once into compact
+records, indexed by type, diameter and description. The index is saved next
+to this file and reused for as long as the library JSON is unchanged.
+Lengths are in inches regardless of the unit a tool was saved in.
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import typing
+from typing import Optional
+
+addinFolder = os.path.dirname(os.path.realpath(__file__))
+libraryPath = os.path.join(os.path.dirname(addinFolder), 'toolLibrary', 'shopbotCamTool.json')
+indexPath = os.path.join(addinFolder, 'toolCatalogue.index.json')
+
+# Bumped whenever the layout of the saved index changes.
+INDEX_VERSION = 1
+
+MM_PER_INCH = 25.4
+
+
+class CataloguePreset(typing.NamedTuple):
+    name: str
+    spindleSpeed: float   # rpm
+    surfaceSpeed: float   # ft/min
+    feedPerTooth: float   # in
+    cuttingFeed: float    # in/min
+    plungeFeed: float     # in/min
+
+
+class CatalogueTool(typing.NamedTuple):
+    index: int
+    guid: str
+    type: str
+    description: str
+    diameter: float
+    fluteLength: float
+    fluteCount: int
+    overallLength: float
+    cornerRadius: float
+    presets: typing.Tuple[CataloguePreset, ...]
+
+    def preset(self, name: str) -> Optional[CataloguePreset]:
+        for preset in self.presets:
+            if preset.name == name:
+                return preset
+        return None
+
+
+class ToolCatalogue:
+
+    def __init__(self, tools: typing.List[CatalogueTool], toolJsons: typing.List[str], stamp: str = ''):
+        self.tools = tools
+        self.toolJsons = toolJsons
+        self.stamp = stamp
+        self.byType: typing.Dict[str, typing.List[int]] = {}
+        self.byDescription: typing.Dict[str, typing.List[int]] = {}
+        for tool in tools:
+            self.byType.setdefault(tool.type, []).append(tool.index)
+            self.byDescription.setdefault(tool.description, []).append(tool.index)
+        self.byDiameter = sorted((tool.diameter, tool.index) for tool in tools)
+
+    @classmethod
+    def load(cls, path: str = libraryPath, cachePath: Optional[str] = indexPath) -> 'ToolCatalogue':
+        """Load the catalogue, from the saved index when the library is unchanged."""
+        with open(path, 'rb') as f:
+            raw = f.read()
+        stamp = hashlib.sha1(raw).hexdigest()
+        if cachePath:
+            catalogue = cls.readIndex(cachePath, stamp)
+            if catalogue is not None:
+                return catalogue
+        catalogue = cls.fromLibraryJson(json.loads(raw.decode('utf-8')), stamp)
+        if cachePath:
+            catalogue.writeIndex(cachePath)
+        return catalogue
+
+    @classmethod
+    def fromLibraryJson(cls, library: dict, stamp: str = '') -> 'ToolCatalogue':
+        tools = []
+        toolJsons = []
+        for entry in library.get('data', []):
+            scale = 1 / MM_PER_INCH if entry.get('unit') == 'millimeters' else 1
+            geometry = entry.get('geometry', {})
+            presets = []
+            for preset in entry.get('start-values', {}).get('presets', []):
+                presets.append(CataloguePreset(
+                    name=preset.get('name', ''),
+                    spindleSpeed=float(preset.get('n', 0)),
+                    surfaceSpeed=float(preset.get('v_c', 0)),
+                    feedPerTooth=float(preset.get('f_z', 0)) * scale,
+                    cuttingFeed=float(preset.get('v_f', 0)) * scale,
+                    plungeFeed=float(preset.get('v_f_plunge', 0)) * scale,
+                ))
+            tools.append(CatalogueTool(
+                index=len(tools),
+                guid=entry.get('guid', ''),
+                type=entry.get('type', ''),
+                description=entry.get('description', ''),
+                diameter=float(geometry.get('DC', 0)) * scale,
+                fluteLength=float(geometry.get('LCF', 0)) * scale,
+                fluteCount=int(geometry.get('NOF', 0)),
+                overallLength=float(geometry.get('OAL', 0)) * scale,
+                cornerRadius=float(geometry.get('RE', 0)) * scale,
+                presets=tuple(presets),
+            ))
+            toolJsons.append(json.dumps(entry))
+        return cls(tools, toolJsons, stamp)
+
+    @classmethod
+    def readIndex(cls, cachePath: str, stamp: str) -> Optional['ToolCatalogue']:
+        try:
+            with open(cachePath, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get('version') != INDEX_VERSION or saved.get('stamp') != stamp:
+            return None
+        tools = []
+        for record in saved['tools']:
+            presets = tuple(CataloguePreset(*preset) for preset in record[-1])
+            tools.append(CatalogueTool(*record[:-1], presets))
+        return cls(tools, saved['toolJsons'], stamp)
+
+    def writeIndex(self, cachePath: str):
+        saved = {
+            'version': INDEX_VERSION,
+            'stamp': self.stamp,
+            'tools': [list(tool[:-1]) + [[list(preset) for preset in tool.presets]] for tool in self.tools],
+            'toolJsons': self.toolJsons,
+        }
+        tmpPath = cachePath + '.tmp'
+        try:
+            with open(tmpPath, 'w', encoding='utf-8') as f:
+                json.dump(saved, f)
+            os.replace(tmpPath, cachePath)
+        except OSError:
+            pass
+
+    def find(
+        self,
+        type: Optional[str] = None,
+        diameter: Optional[float] = None,
+        minFluteLength: Optional[float] = None,
+        description: Optional[str] = None,
+        tolerance: float = 1e-4,
+    ) -> typing.List[CatalogueTool]:
+        """Every tool matching all of the given criteria, in library order."""
+        candidates = None
+        if description is not None:
+            candidates = set(self.byDescription.get(description, []))
+        if type is not None:
+            ofType = set(self.byType.get(type, []))
+            candidates = ofType if candidates is None else candidates & ofType
+        if diameter is not None:
+            lo = bisect.bisect_left(self.byDiameter, (diameter - tolerance, -1))
+            hi = bisect.bisect_right(self.byDiameter, (diameter + tolerance, len(self.tools)))
+            ofDiameter = {index for _, index in self.byDiameter[lo:hi]}
+            candidates = ofDiameter if candidates is None else candidates & ofDiameter
+        if candidates is None:
+            candidates = range(len(self.tools))
+        found = [self.tools[index] for index in sorted(candidates)]
+        if minFluteLength is not None:
+            found = [tool for tool in found if tool.fluteLength >= minFluteLength - tolerance]
+        return found
+
+    def first(self, **spec) -> Optional[CatalogueTool]:
+        found = self.find(**spec)
+        return found[0] if found else None
+
+    def toolJson(self, tool: CatalogueTool) -> str:
+        """The tool's entry in the library JSON, for adsk.cam.Tool.createFromJson."""
+        return self.toolJsons[tool.index]
+
+
+# The tools SetupMaker uses, by the attribute it stores them in.
+shopbotToolSpecs = {
+    'faceTool': {'type': 'face mill'},
+    'boreTool': {'type': 'flat end mill', 'diameter': 0.25},
+    'bore2Tool': {'type': 'ball end mill', 'diameter': 0.25, 'minFluteLength': 1},
+}
+
+
+def resolveToolSpecs(catalogue: ToolCatalogue, specs: dict = shopbotToolSpecs) -> typing.Dict[str, CatalogueTool]:
+    resolved = {}
+    for role, spec in specs.items():
+        tool = catalogue.first(**spec)
+        if tool is not None:
+            resolved[role] = tool
+    return resolved
@@ -0,0 +1,144 @@
+"""
+Compact binary toolpath files written alongside posted SBP programs.
+
+A file is a 16 byte header followed by one fixed-width little-endian
+record per move, in program order:
+
+    offset  type     field
+    0       uint32   line   index of the program line the move came from
+    4       uint8    kind   RAPID, FEED or ARC from SbpReader
+    5       3 bytes  padding
+    8       float32  x      end point, NaN when the program leaves it unknown
+    12      float32  y
+    16      float32  z
+    20      float32  feed   horizontal speed in program units per second
+
+The layout matches RECORD_DTYPE, so numpy can view a mapped file without
+copying. ToolpathFile memory-maps a file for random access and slicing by
+record or program line range; numpy is only needed for asArray.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import typing
+
+from .SbpReader import Move, readLines, readProgram
+
+MAGIC = b'SBPT'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ')    # magic, version, record count
+RECORD = struct.Struct('<IB3xffff')
+RECORD_DTYPE = [
+    ('line', '<u4'), ('kind', 'u1'), ('pad', 'V3'),
+    ('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('feed', '<f4'),
+]
+
+SUFFIX = '.sbpt'
+
+NAN = float('nan')
+
+
+class Record(typing.NamedTuple):
+    line: int
+    kind: int
+    x: float
+    y: float
+    z: float
+    feed: float
+
+
+def toolpathPath(programPath: str) -> str:
+    return os.path.splitext(programPath)[0] + SUFFIX
+
+
+def writeToolpath(programPath: str, path: typing.Optional[str] = None) -> str:
+    """Write the binary toolpath of the program at programPath, streaming
+    it a move at a time. Returns the path written."""
+    path = path or toolpathPath(programPath)
+    tmpPath = path + '.tmp'
+    count = 0
+    with open(tmpPath, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0))
+        for line, item in enumerate(readProgram(readLines(programPath))):
+            if not isinstance(item, Move):
+                continue
+            x, y, z = (NAN if value is None else value for value in item.end)
+            f.write(RECORD.pack(line, item.kind, x, y, z, item.speed[0]))
+            count += 1
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, count))
+    os.replace(tmpPath, path)
+    return path
+
+
+class ToolpathFile:
+    """Read-only, memory-mapped view of a binary toolpath file."""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not a version {} toolpath file'.format(path, VERSION))
+        self.view = memoryview(self.map)[HEADER.size:HEADER.size + self.count * RECORD.size]
+
+    def close(self):
+        if getattr(self, 'view', None) is not None:
+            self.view.release()
+            self.view = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self) -> 'ToolpathFile':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> Record:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return Record(*RECORD.unpack_from(self.view, index * RECORD.size))
+
+    def records(self, start: int = 0, stop: typing.Optional[int] = None) -> memoryview:
+        """The raw bytes of records start to stop, without copying."""
+        start, stop, _ = slice(start, stop).indices(self.count)
+        return self.view[start * RECORD.size:max(start, stop) * RECORD.size]
+
+    def lineRange(self, firstLine: int, lastLine: int) -> typing.Tuple[int, int]:
+        """The records of moves on program lines firstLine to lastLine
+        inclusive, as a start and stop record index."""
+        lines = _LineColumn(self)
+        return bisect.bisect_left(lines, firstLine), bisect.bisect_right(lines, lastLine)
+
+    def chunks(self, recordsPerChunk: int) -> typing.Iterator[memoryview]:
+        """The raw records in chunks, for streaming without loading them."""
+        for start in range(0, self.count, recordsPerChunk):
+            yield self.records(start, start + recordsPerChunk)
+
+    def asArray(self, start: int = 0, stop: typing.Optional[int] = None):
+        """Records start to stop as a numpy structured array sharing the
+        mapped memory. Requires numpy."""
+        import numpy
+        return numpy.frombuffer(self.records(start, stop), dtype=numpy.dtype(RECORD_DTYPE))
+
+
+class _LineColumn:
+    """The line field of every record, as a sequence bisect can search."""
+
+    def __init__(self, toolpath: ToolpathFile):
+        self.toolpath = toolpath
+
+    def __len__(self) -> int:
+        return len(self.toolpath)
+
+    def __getitem__(self, index: int) -> int:
+        return struct.unpack_from('<I', self.toolpath.view, index * RECORD.size)[0]
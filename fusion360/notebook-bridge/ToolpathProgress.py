@@ -0,0 +1,53 @@
+"""
+Tracks toolpath generations that were submitted as one batch, so the
+bridge can report their progress without blocking Fusion's UI while the
+CAM engine works through them.
+"""
+
+import adsk.core, adsk.cam
+import threading
+import time
+
+
+class ToolpathProgress:
+
+    def __init__(self):
+        # (setup names, GenerateToolpathFuture) for every running batch
+        self.jobs = []
+        # Set while a batch is running, so the bridge knows to ask for reports.
+        self.active = threading.Event()
+
+    def track(self, future: adsk.cam.GenerateToolpathFuture, setupNames: list):
+        self.jobs.append((list(setupNames), future))
+        self.active.set()
+
+    def report(self) -> dict:
+        """Progress over every tracked batch. Call from the main thread."""
+        setups = []
+        completed = 0
+        total = 0
+        done = True
+        for setupNames, future in self.jobs:
+            setups.extend(setupNames)
+            completed += future.numberOfCompleted
+            total += future.numberOfOperations
+            done = done and future.isGenerationCompleted
+        if done:
+            self.jobs = []
+            self.active.clear()
+        return {
+            'setups': setups,
+            'completed': completed,
+            'total': total,
+            'percent': round(100 * completed / total, 1) if total else 100.0,
+            'done': done,
+        }
+
+    def waitUntilDone(self):
+        """Let Fusion keep processing events until every batch has finished."""
+        while any(not future.isGenerationCompleted for _, future in self.jobs):
+            adsk.doEvents()
+            time.sleep(0.05)
+
+
+toolpathProgress = ToolpathProgress()
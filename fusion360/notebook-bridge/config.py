@@ -18,4 +18,113 @@ ADDIN_NAME = os.path.basename(os.path.dirname(__file__))
 COMPANY_NAME = 'ACME'
 
 # Palettes
-sample_palette_id = f'{COMPANY_NAME}_{ADDIN_NAME}_palette_id'
\ No newline at end of file
+sample_palette_id = f'{COMPANY_NAME}_{ADDIN_NAME}_palette_id'
+
+# Notebook bridge
+# The backend server started with `npm run server`.
+SERVER_URL = 'http://localhost:3000'
+
+# When LONG_POLL is True the bridge holds a request open against the server
+# and picks up a command as soon as it arrives; the server answers with
+# standby after LONG_POLL_HOLD_SECONDS. Otherwise the bridge polls every
+# POLL_INTERVAL_SECONDS.
+LONG_POLL = True
+LONG_POLL_HOLD_SECONDS = 25
+POLL_INTERVAL_SECONDS = 5
+
+# A batch of commands that is still running after BUSY_REPORT_SECONDS is
+# reported to the server as busy.
+BUSY_REPORT_SECONDS = 1
+
+# A fired batch the main thread has not started on within
+# DISPATCH_TIMEOUT_SECONDS, or has not finished within
+# COMMAND_TIMEOUT_SECONDS, is given up on and fired again; commands that
+# already ran are skipped.
+DISPATCH_TIMEOUT_SECONDS = 30
+COMMAND_TIMEOUT_SECONDS = 3600
+
+# With BATCH_TOOLPATH_GENERATION, a setupCam command creates all of its
+# setups first and then generates every toolpath in one batch, reporting
+# progress to the server every PROGRESS_INTERVAL_SECONDS.
+BATCH_TOOLPATH_GENERATION = True
+PROGRESS_INTERVAL_SECONDS = 1
+
+# With OPTIMIZE_SBP, posted programs are rewritten to drop redundant moves
+# and shorten the rapids between islands before they are stored and sent.
+OPTIMIZE_SBP = True
+
+# Retention tabs holding the artifact in the outer: which sides of the
+# artifact get tabs ('+x', '-x', '+y', '-y') and how many per side.
+TAB_SIDES = ('+x', '-x', '+y', '-y')
+TABS_PER_SIDE = 1
+
+# Defaults for the jig's user parameters, created with the outer: jigOffset
+# is the stock left around the outer's opening and tabPadding the gap
+# between the artifact and the opening, which the tabs span. Edit the user
+# parameters afterwards and rerun create_outer to update the jig in place.
+JIG_OFFSET = '1.8 cm'
+TAB_PADDING = '0.5 cm'
+
+# A nestArtifacts command lays several bodies out in one mainWorkpiece_x by
+# mainWorkpiece_y sheet and builds a single jig around all of them, leaving
+# NEST_SPACING_INCHES of stock between neighbouring openings. With
+# NEST_ROTATE, bodies may be turned a quarter turn to fit.
+NEST_SPACING_INCHES = 0.5
+NEST_ROTATE = True
+
+# Machining time estimates. Fusion's estimate uses FEED_SCALE_PERCENT,
+# RAPID_FEED_INCHES_PER_MINUTE and TOOL_CHANGE_SECONDS; the estimate from the
+# posted program also ramps every move with the mill's acceleration limits,
+# in in/s^2.
+FEED_SCALE_PERCENT = 100
+RAPID_FEED_INCHES_PER_MINUTE = 180
+TOOL_CHANGE_SECONDS = 30
+ACCELERATION_XY = 10
+ACCELERATION_Z = 5
+
+# Feeds and speeds are calculated for cutting MATERIAL, and JIG_MATERIAL for
+# the alignment jig (see FeedsAndSpeeds.MATERIALS), within the spindle's
+# speed range and the machine's maximum feed. At light radial engagement
+# feeds rise by up to MAX_CHIP_THINNING to keep the chip load.
+MATERIAL = 'foam'
+JIG_MATERIAL = 'wood'
+SPINDLE_MIN_RPM = 3000
+SPINDLE_MAX_RPM = 18000
+MAX_FEED_INCHES_PER_MINUTE = 600
+MAX_CHIP_THINNING = 2
+
+# With CHAIN_SETUP_STOCK, the bottomUp setup starts from the stock the
+# topDown setup left behind and rest machines it, instead of clearing the
+# whole stock again. This needs bottomUp right after topDown, so request
+# them in that order.
+CHAIN_SETUP_STOCK = True
+
+# A sweepParameters command tries up to SWEEP_MAX_CANDIDATES combinations of
+# stepdown, stepover, tolerance and feed per operation, keeping the fastest
+# that stays within the tolerance and scallop height targets. Choices are
+# reused for parts whose size matches to SWEEP_SIMILARITY_INCHES. The whole
+# command generates at most SWEEP_CANDIDATE_BUDGET candidates and stops
+# trying new ones after SWEEP_TIME_BUDGET_SECONDS.
+SWEEP_MAX_CANDIDATES = 24
+SWEEP_CANDIDATE_BUDGET = 60
+SWEEP_TIME_BUDGET_SECONDS = 900
+SWEEP_TOLERANCE_TARGET_INCHES = 0.01
+SWEEP_SCALLOP_TARGET_INCHES = 0.005
+SWEEP_SIMILARITY_INCHES = 1
+
+# Posted programs are kept in sbpStore/ by the fingerprint of their inputs,
+# up to SBP_STORE_MAX_MB, evicting the least recently used first.
+SBP_STORE_MAX_MB = 512
+
+# Timeouts for a single request to the server. Long polls wait for
+# LONG_POLL_HOLD_SECONDS plus READ_TIMEOUT_SECONDS.
+CONNECT_TIMEOUT_SECONDS = 2
+READ_TIMEOUT_SECONDS = 10
+
+# While the server cannot be reached, retries back off exponentially from
+# BACKOFF_BASE_SECONDS up to BACKOFF_MAX_SECONDS. After
+# BREAKER_FAILURE_THRESHOLD failures in a row the bridge treats the server as
+# down and only probes it when the backoff elapses.
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = 60
+BREAKER_FAILURE_THRESHOLD = 3
@@ -2,19 +2,24 @@ import adsk.core
 import adsk.fusion
 import adsk.cam
 import traceback
-import os, threading, random, time
+import os, threading, time, queue, hashlib, urllib.parse
 
 import json
-import typing
-import urllib.error
-import urllib.parse
-import urllib.request
+from .BridgeClient import *
 from .CreateUserParameter import *
 from .CreateOuter import *
 from .SetupMaker import *
 from . ExportSVG import *
 from . PostProcess import *
-from email.message import Message
+from . import config
+from .EntityIndex import entityIndex
+from .ToolpathProgress import toolpathProgress
+from .SbpReader import readLines, summarizeProgram
+from .MachiningTime import fusionMachiningTime, sbpMachiningTime
+from .ParameterSweep import sweepSetups
+from .DesignTransaction import DesignTransaction
+from .lib import fusion360utils as futil
+from .StockContext import DEFAULT_ARTIFACTS, NESTED_FINGERPRINT, captureStockContext, storeArtifacts, storedFingerprint, storeFingerprint
 
 from typing import Optional
 
@@ -23,181 +28,427 @@ ui = app.userInterface
 handlers = []
 myCustomEvent = 'MyCustomEventId'
 customEvent = app.registerCustomEvent(myCustomEvent)
+myProgressEvent = 'ToolpathProgressEventId'
+progressEvent = app.registerCustomEvent(myProgressEvent)
+progressReports = queue.Queue()
+# (setup name, program path, Fusion's machining time) of posted programs for
+# MyThread to upload.
+programUploads = queue.Queue()
 stopFlag = threading.Event()
+serverBreaker = CircuitBreaker(
+    failureThreshold=config.BREAKER_FAILURE_THRESHOLD,
+    baseDelay=config.BACKOFF_BASE_SECONDS,
+    maxDelay=config.BACKOFF_MAX_SECONDS,
+)
 
-# Response class and request function are copied from Jonathan Bowman's
-# Post on dev.to (https://dev.to/bowmanjd/http-calls-in-python-without-requests-or-other-external-dependencies-5aj1)
-class Response(typing.NamedTuple):
-    body: str
-    headers: Message
-    status: int
-    error_count: int = 0
+class SingleFlight:
+    """
+    Tracks the batch of commands the main thread is working on. MyThread
+    arms it before firing an event and waits for it to go idle, giving up
+    if the event is never handled or the batch runs too long, and firing
+    again. If Fusion delivers that event while the earlier batch is still
+    running, it is coalesced into a single follow-up run instead of being
+    started on top.
+    """
 
-    def json(self) -> typing.Any:
-        try:
-            output = json.loads(self.body)
-        except json.JSONDecodeError:
-            output = ""
-        return output
-
-def request(
-    url: str,
-    data: dict = {},
-    params: dict = {},
-    headers: dict = {},
-    method: str = "GET",
-    data_as_json: bool = True,
-    error_count: int = 0,
-) -> Optional[Response]:
-    if not url.casefold().startswith("http"):
-        raise urllib.error.URLError("Incorrect and possibly insecure protocol in url")
-    method = method.upper()
-    request_data = None
-    headers = headers or {}
-    data = data or {}
-    params = params or {}
-    headers = {"Accept": "application/json", **headers}
-
-    if method == "GET":
-        params = {**params, **data}
-        data = {}
-
-    if params:
-        url += "?" + urllib.parse.urlencode(params, doseq=True, safe="/")
-
-    if data:
-        if data_as_json:
-            request_data = json.dumps(data).encode()
-            headers["Content-Type"] = "application/json; charset=UTF-8"
-        else:
-            request_data = urllib.parse.urlencode(data).encode()
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = False
+        self.pending = []
+        self.idle = threading.Event()
+        self.idle.set()
+        self.started = threading.Event()
 
-    httprequest = urllib.request.Request(
-        url, data=request_data, headers=headers, method=method
-    )
+    def arm(self):
+        self.started.clear()
+        self.idle.clear()
 
-    try:
-        with urllib.request.urlopen(httprequest) as httpresponse:
-            response = Response(
-                headers=httpresponse.headers,
-                status=httpresponse.status,
-                body=httpresponse.read().decode(
-                    httpresponse.headers.get_content_charset("utf-8")
-                ),
-            )
-    except urllib.error.HTTPError as e:
-        response = Response(
-            body=str(e.reason),
-            headers=e.headers,
-            status=e.code,
-            error_count=error_count + 1,
-        )
-    except urllib.error.URLError as e:
-        return None
+    def abandon(self):
+        """Stop waiting for the armed batch. A batch that is still running
+        stays running and ends the flight when it finishes."""
+        with self.lock:
+            if not self.running:
+                self.idle.set()
+
+    def begin(self, commands: list) -> bool:
+        self.started.set()
+        with self.lock:
+            if self.running:
+                self.pending.extend(commands)
+                return False
+            self.running = True
+            return True
 
-    return response
+    def followUp(self) -> list:
+        with self.lock:
+            commands, self.pending = self.pending, []
+            return commands
+
+    def finish(self):
+        with self.lock:
+            self.running = False
+            self.pending = []
+        self.idle.set()
+
+
+commandFlight = SingleFlight()
 
 # The event handler that responds to the custom event being fired.
 class ThreadEventHandler(adsk.core.CustomEventHandler):
     def __init__(self):
         super().__init__()
         self.content = {}
+        # Ids are only unique within one server session.
+        self.session = None
+        self.lastCommandId = 0
         design = adsk.fusion.Design.cast(app.activeProduct)
         self.activeSelection = adsk.fusion.Design.cast(design)
     def notify(self, args):
         try:
-            maybeResponse = request("http://localhost:3000/fusion360/poll")
-            if maybeResponse and maybeResponse.status == 200:  # Check if the request was successful
-                response_json = maybeResponse.json()  # Load JSON data from response
-                new_status = response_json.get('status')
-                new_params = response_json.get('createParam')
-                new_cam_setup = response_json.get('setupCam')
-                new_generate_svg = response_json.get('generate_svg')
-                new_exportSbp = response_json.get('exportSbp')
-                new_create_outer = response_json.get('create_outer')
-
-                if(new_status != 'standby'):
-                    if 'test_connection' in response_json:
-                        ui.messageBox('Notebook Bridge Connected and Running')
-
-                    if self.content.get('create_outer') != new_create_outer:
-                        self.content['create_outer'] = new_create_outer
-                        if new_create_outer and (not recursivelyFindBody("outer")):
-                            bottomface, topface = createOuter()
-                            innerBtmLoopEdgeCount = bottomface.loops.item(0).edges.count
-                            innerLoopEdgeCount = topface.loops.item(0).edges.count
-                            holeFaces = holeDrill(topface)
-                            createTab()
-
-                            self.content['bottomface'] = bottomface
-                            self.content['topface'] = topface
-                            self.content['innerBtmLoopEdgeCount'] = innerBtmLoopEdgeCount
-                            self.content['innerLoopEdgeCount'] = innerLoopEdgeCount
-                            self.content['holeFaces'] = holeFaces
-                            
-                    # Check if 'createParam' is the same, if not, update and execute.
-                    if self.content.get('createParam') != new_params:
-                        self.content['createParam'] = new_params
-                        if new_params:
-                            for param in new_params:
-                                create_user_parameter(param.get("name"), param.get("value"), param.get("unit"))
-
-                    # Check if 'setupCam' is the same, if not, update and execute.
-                    if self.content.get('setupCam') != new_cam_setup:
-                        cam = SetupMaker()
-                        self.content['setupCam'] = new_cam_setup
-                        maybeHoleFaces = self.content['holeFaces'] if 'holeFaces' in self.content else None
-                        if new_cam_setup:
-                            for setup in new_cam_setup:
-                                if setup == "alignmentJig":
-                                    cam.create_alignmentJig(maybeHoleFaces)
-                                elif setup == "reduceThickness":
-                                    cam.create_foam_surface()
-                                elif setup == "mainHoles":
-                                    cam.create_foam_bore(maybeHoleFaces)
-                                elif setup == "topDown":
-                                    cam.create_top_cut()
-                                elif setup == "bottomUp":
-                                    cam.create_bottom_cut(getLoopWithEdgesOnFace(self.content['innerLoopEdgeCount'], self.content['bottomface']))
-
-                    # Check if 'generate_svg' is the same, if not, update and execute.
-                    if self.content.get('generate_svg') != new_generate_svg:
-                        self.content['generate_svg'] = new_generate_svg
-                        if new_generate_svg:
-                            exportSVG()
-                            
-                    if self.content.get('exportSbp') != new_exportSbp:
-                        self.content['exportSbp'] = new_exportSbp
-                        if new_exportSbp:
-                            for setupName in new_exportSbp:
-                                exportSBPWithSetupNamed(setupName)
-                else:
-                    self.content['setupCam'] = None
-                    self.content['generate_svg'] = None
-                    self.content['exportSbp'] = None
-                    self.content['setupCam'] = None
-                    self.content['createParam'] = None
-                    self.content['create_outer'] = None
-
-
+            # The commands were already fetched and decoded by MyThread, so
+            # this handler only has to drive the Fusion API.
+            commands = json.loads(args.additionalInfo)
         except:
             if ui:
                 ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+            commands = []
+        if not commandFlight.begin(commands):
+            # Re-entered while a batch is running; the outer call picks
+            # these up as its follow-up.
+            return
+        try:
+            while commands:
+                self.runBatch(commands)
+                commands = commandFlight.followUp()
+        finally:
+            commandFlight.finish()
+
+    def runBatch(self, commands: list):
+        for entry in commands:
+            if entry.get('session') != self.session:
+                # The server restarted and numbers its commands from 1 again.
+                self.session = entry.get('session')
+                self.lastCommandId = 0
+            # A command can be delivered again if its acknowledgement
+            # was lost, so skip anything we have already run.
+            if entry['id'] <= self.lastCommandId:
+                continue
+            self.lastCommandId = entry['id']
+            try:
+                self.runCommand(entry['command'])
+            except:
+                if ui:
+                    ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+    def rememberOuter(self, stock, bottomface, topface, holeFaces, tabs, fingerprint=None, artifacts=DEFAULT_ARTIFACTS):
+        self.content['tabs'] = tabs
+        self.content['stock'] = stock.withOuter(bottomface, topface, holeFaces)
+        design = adsk.fusion.Design.cast(app.activeProduct)
+        storeFingerprint(design, fingerprint or stock.fingerprint())
+        storeArtifacts(design, artifacts)
+
+    def runCommand(self, response_json: dict):
+        new_params = response_json.get('createParam')
+        new_cam_setup = response_json.get('setupCam')
+        new_generate_svg = response_json.get('generate_svg')
+        new_exportSbp = response_json.get('exportSbp')
+        new_sweepParameters = response_json.get('sweepParameters')
+        new_create_outer = response_json.get('create_outer')
+        new_nestArtifacts = response_json.get('nestArtifacts')
+
+        if 'test_connection' in response_json:
+            ui.messageBox('Notebook Bridge Connected and Running')
+
+        if new_create_outer:
+            stock = captureStockContext()
+            if not recursivelyFindBody("outer"):
+                # Build everything as one unit; a failed step leaves none of
+                # it behind. Each step reads the faces and bodies it adds, so
+                # each is computed as it goes.
+                with DesignTransaction('create_outer') as transaction:
+                    with transaction.step('createOuter', computed=True):
+                        bottomface, topface = createOuter(stock)
+                    with transaction.step('holeDrill', computed=True):
+                        holeFaces = holeDrill(stock, topface)
+                    with transaction.step('createTab', computed=True):
+                        tabs = createTab(stock)
+                self.rememberOuter(stock, bottomface, topface, holeFaces, tabs)
+            elif storedFingerprint(adsk.fusion.Design.cast(app.activeProduct)) not in (stock.fingerprint(), NESTED_FINGERPRINT):
+                # The artifact or the jig parameters changed since the jig
+                # was built: refit the existing features instead of
+                # rebuilding them.
+                with DesignTransaction('update_outer') as transaction:
+                    with transaction.step('updateOuter', computed=True):
+                        bottomface, topface, holeFaces, tabs = updateOuter(stock)
+                self.rememberOuter(stock, bottomface, topface, holeFaces, tabs)
+
+        if new_nestArtifacts and (not recursivelyFindBody("outer")):
+            # One jig around every named body, laid out in the workpiece.
+            stock = captureStockContext()
+            with DesignTransaction('nest_artifacts') as transaction:
+                with transaction.step('layout'):
+                    nested, openings = nestBodies(stock, new_nestArtifacts)
+                with transaction.step('createOuter', computed=True):
+                    bottomface, topface = createOuter(nested, openings)
+                with transaction.step('holeDrill', computed=True):
+                    holeFaces = holeDrill(nested, topface)
+                with transaction.step('createTab', computed=True):
+                    tabs = createTab(nested, openings=openings)
+            self.rememberOuter(nested, bottomface, topface, holeFaces, tabs, NESTED_FINGERPRINT, new_nestArtifacts)
+
+        if new_params:
+            for param in new_params:
+                create_user_parameter(param.get("name"), param.get("value"), param.get("unit"))
+
+        if new_cam_setup:
+            # Parameters may have changed since the outer was built. The
+            # design's named jig features give the faces after a restart.
+            stock = self.content['stock'].refreshed() if 'stock' in self.content else captureStockContext()
+            cam = SetupMaker(batchGeneration=config.BATCH_TOOLPATH_GENERATION, context=stock)
+            maybeHoleFaces = stock.holeFaces()
+            for setup in new_cam_setup:
+                if setup == "alignmentJig":
+                    cam.create_alignmentJig(maybeHoleFaces)
+                elif setup == "reduceThickness":
+                    cam.create_foam_surface()
+                elif setup == "mainHoles":
+                    cam.create_foam_bore(maybeHoleFaces)
+                elif setup == "topDown":
+                    cam.create_top_cut()
+                elif setup == "bottomUp":
+                    bottomface, topface = stock.outerFaces()
+                    if bottomface is None:
+                        # The other setups still get generated.
+                        ui.messageBox('bottomUp needs the outer; run create_outer first')
+                        continue
+                    cam.create_bottom_cut(openingLoops(bottomface))
+            # Generate every requested setup in one go; ProgressThread
+            # reports on it while Fusion stays responsive.
+            future = cam.generateAll()
+            if future:
+                toolpathProgress.track(future, new_cam_setup)
+
+        if new_generate_svg:
+            exportSVG()
+
+        if new_sweepParameters:
+            # Sweeping regenerates the setups' toolpaths one candidate at a time.
+            toolpathProgress.waitUntilDone()
+            sweepSetups(new_sweepParameters)
+            refreshSweptFingerprints(new_sweepParameters)
+
+        if new_exportSbp:
+            # Posting needs finished toolpaths.
+            toolpathProgress.waitUntilDone()
+            cam = adsk.cam.CAM.cast(app.activeDocument.products.itemByProductType('CAMProductType'))
+            for setupName, path in exportSBPForSetups(new_exportSbp):
+                try:
+                    machiningTime = fusionMachiningTime(cam, getSetup(setupName, cam.setups))
+                except:
+                    # The program is sent without Fusion's estimate.
+                    futil.log('Machining time of {} failed:\n{}'.format(setupName, traceback.format_exc()))
+                    machiningTime = None
+                programUploads.put((setupName, path, machiningTime))
 
 
 # The class for the new thread.
 class MyThread(threading.Thread):
     def __init__(self, event):
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, daemon=True)
         self.stopped = event
         # ui.messageBox('Thread created')
 
     def run(self):
         ui.messageBox('Thread start')
-        # Every five seconds fire a custom event, passing a random number.
-        while not self.stopped.wait(5):
-            args = {'Value': random.randint(1000, 10000)/1000}
-            app.fireCustomEvent(myCustomEvent, json.dumps(args)) 
+        session = None
+        lastCommandId = 0
+        while not self.stopped.is_set():
+            polledSession, polled = self.fetchCommands(session, lastCommandId)
+            if polledSession is not None and polledSession != session:
+                # The server restarted and numbers its commands from 1 again.
+                session = polledSession
+                lastCommandId = 0
+            commands = [c for c in polled if c['id'] > lastCommandId]
+            if not commands:
+                continue
+            if self.fireCommands(session, commands):
+                lastCommandId = commands[-1]['id']
+                self.acknowledge(session, lastCommandId)
+
+    def fetchCommands(self, session: str, after: int) -> tuple:
+        """The server's session id and the commands it has after the given
+        id. The session is None when the poll failed."""
+        # While the server is known to be down, skip polls until the breaker
+        # lets a probe through.
+        if not serverBreaker.allowRequest():
+            self.stopped.wait(serverBreaker.secondsUntilRetry())
+            return None, []
+        params = {'after': after}
+        if session is not None:
+            params['session'] = session
+        if config.LONG_POLL:
+            # Hold a poll open until the server has a command for us.
+            hold = config.LONG_POLL_HOLD_SECONDS
+            params['hold'] = int(hold * 1000)
+            timeout = hold + config.READ_TIMEOUT_SECONDS
+        else:
+            if self.stopped.wait(config.POLL_INTERVAL_SECONDS):
+                return None, []
+            timeout = config.READ_TIMEOUT_SECONDS
+        maybeResponse = request(
+            config.SERVER_URL + "/fusion360/poll",
+            params=params,
+            timeout=timeout,
+            connect_timeout=config.CONNECT_TIMEOUT_SECONDS,
+            breaker=serverBreaker,
+        )
+        if not maybeResponse:
+            # The server is unreachable, back off before trying again.
+            self.stopped.wait(serverBreaker.secondsUntilRetry())
+            return None, []
+        if maybeResponse.status != 200:
+            self.stopped.wait(config.POLL_INTERVAL_SECONDS)
+            return None, []
+        response_json = maybeResponse.json()
+        if not isinstance(response_json, dict):
+            return None, []
+        return response_json.get('session'), response_json.get('commands') or []
+
+    def fireCommands(self, session: str, commands: list) -> bool:
+        # Hand the decoded batch to the main thread, then wait for the
+        # handler to finish with it. Commands sent in the meantime stay
+        # queued on the server and arrive together in the next poll, and
+        # the server is told we are busy rather than being polled.
+        commandFlight.arm()
+        # Each command carries its session so the handler knows which ids
+        # it has already run.
+        app.fireCustomEvent(myCustomEvent, json.dumps([dict(c, session=session) for c in commands]))
+        firedAt = time.monotonic()
+        reportedBusy = False
+        while not commandFlight.idle.wait(config.BUSY_REPORT_SECONDS):
+            if self.stopped.is_set():
+                return False
+            waited = time.monotonic() - firedAt
+            if not commandFlight.started.is_set() and waited > config.DISPATCH_TIMEOUT_SECONDS:
+                # The event was dropped; the batch is fetched and fired again.
+                futil.log('Commands up to {} were not picked up after {:.0f}s, firing them again'.format(commands[-1]['id'], waited))
+                commandFlight.abandon()
+                return False
+            if waited > config.COMMAND_TIMEOUT_SECONDS:
+                futil.log('Commands up to {} still running after {:.0f}s'.format(commands[-1]['id'], waited))
+                commandFlight.abandon()
+                return False
+            if not reportedBusy:
+                self.reportStatus('busy', commands[-1]['id'])
+                reportedBusy = True
+            self.uploadPrograms()
+        self.uploadPrograms()
+        if reportedBusy:
+            self.reportStatus('idle', commands[-1]['id'])
+        return True
+
+    def uploadPrograms(self):
+        while not programUploads.empty():
+            setupName, path, machiningTime = programUploads.get_nowait()
+            try:
+                with open(path, 'rb') as f:
+                    program = f.read()
+            except OSError:
+                # The post failed and left no program behind.
+                continue
+            self.reportMachiningTime(setupName, machiningTime, sbpMachiningTime(path))
+            programUrl = config.SERVER_URL + "/fusion360/sbp/" + urllib.parse.quote(setupName)
+            programHash = hashlib.sha256(program).hexdigest()
+            stats = summarizeProgram(readLines(path)).summary()
+            # Skip sending the program if the server already has this content.
+            maybeResponse = request(
+                programUrl + "/ref",
+                data={'hash': programHash, 'stats': stats},
+                method="PUT",
+                connect_timeout=config.CONNECT_TIMEOUT_SECONDS,
+                breaker=serverBreaker,
+            )
+            if maybeResponse and maybeResponse.status == 200:
+                continue
+            request(
+                programUrl,
+                data=program,
+                headers={'X-Content-SHA256': programHash, 'X-Program-Stats': json.dumps(stats)},
+                method="PUT",
+                timeout=config.READ_TIMEOUT_SECONDS,
+                connect_timeout=config.CONNECT_TIMEOUT_SECONDS,
+                breaker=serverBreaker,
+            )
+
+    def reportMachiningTime(self, setupName: str, fusion: dict, sbp: dict):
+        request(
+            config.SERVER_URL + "/fusion360/machining-time",
+            data={'setup': setupName, 'fusion': fusion, 'sbp': sbp},
+            method="PUT",
+            connect_timeout=config.CONNECT_TIMEOUT_SECONDS,
+            breaker=serverBreaker,
+        )
+
+    def reportStatus(self, status: str, commandId: int):
+        request(
+            config.SERVER_URL + "/fusion360/bridge",
+            data={'status': status, 'commandId': commandId},
+            method="PUT",
+            connect_timeout=config.CONNECT_TIMEOUT_SECONDS,
+            breaker=serverBreaker,
+        )
+
+    def acknowledge(self, session: str, commandId: int):
+        request(
+            config.SERVER_URL + "/fusion360/ack",
+            data={'id': commandId, 'session': session},
+            method="PUT",
+            connect_timeout=config.CONNECT_TIMEOUT_SECONDS,
+            breaker=serverBreaker,
+        )
+
+# Reads toolpath progress on the main thread for ProgressThread to send.
+class ProgressEventHandler(adsk.core.CustomEventHandler):
+    def __init__(self):
+        super().__init__()
+    def notify(self, args):
+        try:
+            if toolpathProgress.active.is_set():
+                progressReports.put(toolpathProgress.report())
+        except:
+            if ui:
+                ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+
+# While toolpaths are generating, asks the main thread for their progress
+# and pushes it to the server.
+class ProgressThread(threading.Thread):
+    def __init__(self, event):
+        threading.Thread.__init__(self, daemon=True)
+        self.stopped = event
+
+    def run(self):
+        while not self.stopped.is_set():
+            if not toolpathProgress.active.wait(1):
+                continue
+            app.fireCustomEvent(myProgressEvent, '')
+            if self.stopped.wait(config.PROGRESS_INTERVAL_SECONDS):
+                return
+            self.sendLatestReport()
+
+    def sendLatestReport(self):
+        report = None
+        while not progressReports.empty():
+            report = progressReports.get_nowait()
+        if report is None:
+            return
+        request(
+            config.SERVER_URL + "/fusion360/progress",
+            data=report,
+            method="PUT",
+            connect_timeout=config.CONNECT_TIMEOUT_SECONDS,
+            breaker=serverBreaker,
+        )
 
 def run(context):
     try:
@@ -205,10 +456,15 @@ def run(context):
         onThreadEvent = ThreadEventHandler()
         customEvent.add(onThreadEvent)
         handlers.append(onThreadEvent)
+        onProgressEvent = ProgressEventHandler()
+        progressEvent.add(onProgressEvent)
+        handlers.append(onProgressEvent)
+        entityIndex.connect()
 
         # Create a new thread for the other processing.        
         myThread = MyThread(stopFlag)
         myThread.start()
+        ProgressThread(stopFlag).start()
     except:
         if ui:
             ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
@@ -217,29 +473,32 @@ def stop(context):
     try:
         if handlers.count:
             customEvent.remove(handlers[0])
+        if len(handlers) > 1:
+            progressEvent.remove(handlers[1])
         stopFlag.set() 
+        pool.clear()
+        entityIndex.disconnect()
         app.unregisterCustomEvent(myCustomEvent)
+        app.unregisterCustomEvent(myProgressEvent)
         ui.messageBox('Stop addin')
     except:
         if ui:
             ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
 
-def getLoopWithEdgesOnFace(edgeCount, face):
-    for i in range(face.loops.count):
-        if(face.loops.item(i).edges.count == edgeCount):
-            return face.loops.item(i).edges
+def openingLoops(face) -> list:
+    ''' The edges of each opening through the outer's face: its inner loops,
+    leaving out the dowel holes, which are bounded by circles alone. '''
+    loops = []
+    for loop in face.loops:
+        if loop.isOuter:
+            continue
+        edges = [edge for edge in loop.edges]
+        if all(edge.geometry.curveType == adsk.core.Curve3DTypes.Circle3DCurveType for edge in edges):
+            continue
+        loops.append(edges)
+    return loops
 
 def recursivelyFindBody(name: str):
     design = adsk.fusion.Design.cast(app.activeProduct)
     activeSelection = adsk.fusion.Design.cast(design)
-    rootComponent = activeSelection.rootComponent
-    for occurence in rootComponent.allOccurrences:
-        if(occurence.name == name):
-            return occurence
-        for bBody in occurence.bRepBodies:
-            if(bBody.name == name):
-                return bBody
-    for bBody in rootComponent.bRepBodies:
-        if(bBody.name == name):
-            return bBody
-    return None
\ No newline at end of file
+    return entityIndex.find(activeSelection.rootComponent, name)
\ No newline at end of file
@@ -0,0 +1,18 @@
+"""
+Makes the add-in's modules importable as the bridge package.
+
+The add-in folder's name is not a valid module name, and the modules import
+each other relatively, so the folder is registered as a package here. Only
+modules that do not use the Fusion API can be tested.
+"""
+
+import os
+import sys
+import types
+
+addinFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'bridge' not in sys.modules:
+    package = types.ModuleType('bridge')
+    package.__path__ = [addinFolder]
+    sys.modules['bridge'] = package
@@ -0,0 +1,77 @@
+import math
+
+import pytest
+
+from bridge import config
+from bridge.FeedsAndSpeeds import (
+    MATERIALS, OPERATIONS, OperationProfile,
+    calculateCuts, chipThinning, cutExpressions, materialPreset,
+)
+from bridge.ToolCatalogue import CatalogueTool, CataloguePreset
+
+
+def tool(diameter=0.25, flutes=2, type='flat end mill', presets=()):
+    return CatalogueTool(0, '', type, '', diameter, 1.0, flutes, 2.0, 0.0, tuple(presets))
+
+
+def preset(name, feedPerTooth, surfaceSpeed=0.0):
+    return CataloguePreset(name, 0.0, surfaceSpeed, feedPerTooth, 0.0, 0.0)
+
+
+def cut(tool, operation=OperationProfile(1.0, 1.0), material=MATERIALS['foam']):
+    return calculateCuts([tool], [operation], [material])[0]
+
+
+def test_material_preset():
+    presets = [preset('Foam slow', 0.01), preset('Foam fast', 0.02), preset('Wood', 0.05), preset('Foam', 0)]
+    assert materialPreset(tool(presets=presets), MATERIALS['foam']).name == 'Foam fast'
+    assert materialPreset(tool(), MATERIALS['foam']) is None
+
+
+def test_chip_thinning():
+    assert chipThinning(0.5) == 1.0
+    assert chipThinning(1.0) == 1.0
+    assert chipThinning(0.1) == pytest.approx(1 / (2 * math.sqrt(0.09)))
+    assert chipThinning(0.001) == config.MAX_CHIP_THINNING
+    assert chipThinning(0.0) == config.MAX_CHIP_THINNING
+
+
+def test_spindle_speed_from_surface_speed():
+    result = cut(tool(diameter=1.0))
+    assert result.spindleSpeed == pytest.approx(1000 * 12 / math.pi)
+    assert result.surfaceSpeed == pytest.approx(1000)
+
+
+def test_spindle_speed_within_range():
+    assert cut(tool(diameter=0.01)).spindleSpeed == config.SPINDLE_MAX_RPM
+    assert cut(tool(diameter=10.0)).spindleSpeed == config.SPINDLE_MIN_RPM
+
+
+def test_feed_from_preset():
+    result = cut(tool(diameter=1.0, presets=[preset('foam', 0.001, surfaceSpeed=2000)]))
+    rpm = 2000 * 12 / math.pi
+    assert result.spindleSpeed == pytest.approx(rpm)
+    assert result.feedCutting == pytest.approx(rpm * 2 * 0.001)
+
+
+def test_feed_capped():
+    result = cut(tool(flutes=4, presets=[preset('foam', 1.0)]))
+    assert result.feedCutting == config.MAX_FEED_INCHES_PER_MINUTE
+
+
+def test_thinning_raises_flat_but_not_ball_feeds():
+    light = OPERATIONS['Scallop']
+    flat = cut(tool(diameter=1.0), light)
+    ball = cut(tool(diameter=1.0, type='ball end mill'), light)
+    assert flat.feedCutting == pytest.approx(ball.feedCutting * chipThinning(light.radialEngagement))
+
+
+def test_cut_expressions():
+    # Wood's surface speed needs fewer rpm than the spindle's minimum, so
+    # the surface speed is recalculated from the minimum.
+    expressions = cutExpressions(cut(tool(diameter=1.0), material=MATERIALS['wood']))
+    assert expressions == {
+        'tool_spindleSpeed': '3000.0 rpm',
+        'tool_surfaceSpeed': '785.4 ft/min',
+        'tool_feedCutting': '90.000 in/min',
+    }
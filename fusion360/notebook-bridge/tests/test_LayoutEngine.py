@@ -0,0 +1,57 @@
+import itertools
+
+from bridge.LayoutEngine import Part, packParts
+
+
+def overlap(a, b):
+    return a.x < b.maxX and b.x < a.maxX and a.y < b.maxY and b.y < a.maxY
+
+
+def test_parts_share_a_shelf():
+    layout = packParts([Part('a', 4, 3), Part('b', 4, 2)], 20, 10, spacing=1, margin=1, rotate=False)
+    a, b = layout.placements
+    assert (a.name, a.x, a.y) == ('a', 1, 1)
+    assert (b.name, b.x, b.y) == ('b', 6, 1)
+    assert layout.unplaced == ()
+
+
+def test_new_shelf_above_the_last():
+    layout = packParts([Part('a', 8, 3), Part('b', 8, 2)], 10, 10, spacing=1, margin=1, rotate=False)
+    a, b = layout.placements
+    assert (b.x, b.y) == (1, 5)
+
+
+def test_rotates_long_side_along_x():
+    placement, = packParts([Part('a', 2, 6)], 10, 10).placements
+    assert placement.rotated
+    assert (placement.width, placement.depth) == (6, 2)
+
+
+def test_does_not_rotate_when_it_would_not_fit():
+    placement, = packParts([Part('a', 2, 6)], 4, 10).placements
+    assert not placement.rotated
+
+
+def test_parts_that_do_not_fit():
+    layout = packParts([Part('a', 5, 5), Part('b', 9, 9)], 10, 10, margin=1)
+    assert [placement.name for placement in layout.placements] == ['a']
+    assert layout.unplaced == ('b',)
+
+
+def test_placements_stay_apart_and_inside():
+    parts = [Part(str(n), 1 + n % 3, 1 + n % 4) for n in range(12)]
+    layout = packParts(parts, 30, 30, spacing=0.5, margin=1)
+    assert not layout.unplaced
+    for a, b in itertools.combinations(layout.placements, 2):
+        assert not overlap(a, b)
+    minX, minY, maxX, maxY = layout.extent()
+    assert minX >= 1 and minY >= 1 and maxX <= 29 and maxY <= 29
+
+
+def test_extent_and_utilization():
+    layout = packParts([Part('a', 5, 5)], 10, 10)
+    assert layout.extent() == (0, 0, 5, 5)
+    assert layout.utilization == 0.25
+    empty = packParts([], 10, 10)
+    assert empty.extent() is None
+    assert empty.utilization == 0
@@ -0,0 +1,71 @@
+from bridge.SbpOptimizer import optimizeLines, optimizeProgram
+
+
+def optimize(lines, toolRadius=0.0):
+    written = []
+    report = optimizeLines(lines, written.append, toolRadius)
+    return written, report
+
+
+def islands(xs):
+    """A program cutting a short slot at each x, at the same depth, with
+    a retract to the safe height between them."""
+    lines = ['J3,0,0,1', 'MS,1,1']
+    for x in xs:
+        lines += ['J2,{},0'.format(x), 'M3,{},0,-0.1'.format(x), 'M2,{},0'.format(x + 0.2), 'JZ,1']
+    lines.append('J2,0,0')
+    return lines
+
+
+def cuts(lines):
+    return [line for line in lines if line[:2] in ('M2', 'M3', 'MX', 'MY', 'MZ')]
+
+
+def test_drops_empty_moves():
+    written, report = optimize(['J3,0,0,1', 'MS,1,1', 'M2,0,0', 'M2,1,0'])
+    assert written == ['J3,0,0,1', 'MS,1,1', 'M2,1,0']
+    assert report.droppedMoves == 1
+
+
+def test_merges_collinear_feeds():
+    written, report = optimize(['J3,0,0,0', 'MS,1,1', 'M2,1,0', 'M2,2,0', 'M2,3,0', 'M2,3,1'])
+    assert written == ['J3,0,0,0', 'MS,1,1', 'M2,3,0', 'M2,3,1']
+    assert report.droppedMoves == 2
+    assert report.savedSeconds == 0
+
+
+def test_keeps_feeds_at_different_speeds():
+    written, _ = optimize(['J3,0,0,0', 'MS,1,1', 'M2,1,0', 'MS,2,1', 'M2,2,0'])
+    assert cuts(written) == ['M2,1,0', 'M2,2,0']
+
+
+def test_collapses_vertical_jogs():
+    written, _ = optimize(['J3,0,0,0', 'MS,1,1', 'JZ,0.5', 'JZ,1', 'J2,2,2'])
+    assert written == ['J3,0,0,0', 'MS,1,1', 'JZ,1', 'J2,2,2']
+
+
+def test_reorders_islands():
+    lines = islands([10, 0, 5])
+    written, report = optimize(lines)
+    assert report.reorderedIslands > 0
+    assert report.optimizedSeconds < report.originalSeconds
+    assert sorted(cuts(written)) == sorted(cuts(lines))
+    assert cuts(written)[0] == 'M3,0,0,-0.1'
+
+
+def test_keeps_overlapping_islands_in_order():
+    lines = islands([10, 0, 5])
+    written, report = optimize(lines, toolRadius=6)
+    assert report.reorderedIslands == 0
+    assert cuts(written) == cuts(lines)
+
+
+def test_optimize_program(tmp_path):
+    path = tmp_path / 'program.sbp'
+    path.write_bytes('\r\n'.join(islands([10, 0, 5])).encode() + b'\r\n')
+    report = optimizeProgram(str(path))
+    text = path.read_bytes().decode()
+    assert report.savedSeconds > 0
+    assert text.endswith('\r\n')
+    assert '\n' not in text.replace('\r\n', '')
+    assert text.splitlines()[-1].startswith("'Optimized: ")
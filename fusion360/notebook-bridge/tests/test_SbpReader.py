@@ -0,0 +1,126 @@
+import math
+
+import pytest
+
+from bridge.SbpReader import (
+    DEFAULT_JOG_SPEED, DEFAULT_MOVE_SPEED, ARC, FEED, RAPID,
+    Move, MoveArray, moveLength, moveSeconds, parseMove, readProgram, summarizeProgram,
+)
+
+
+def moves(lines):
+    return [item for item in readProgram(lines) if isinstance(item, Move)]
+
+
+def arc(line, position=(1.0, 0.0, 0.0)):
+    return parseMove(line, position, DEFAULT_MOVE_SPEED, DEFAULT_JOG_SPEED)
+
+
+def test_counterclockwise_arc():
+    move = arc('CG,,0,1,-1,0,T,-1')
+    assert move.arc == (0.0, 0.0, False)
+    assert move.end == (0.0, 1.0, 0.0)
+    assert moveLength(move)[0] == pytest.approx(math.pi / 2, abs=1e-3)
+
+
+def test_clockwise_arc():
+    move = arc('CG,,0,1,-1,0,T,1')
+    assert move.arc == (0.0, 0.0, True)
+    assert moveLength(move)[0] == pytest.approx(3 * math.pi / 2, abs=1e-3)
+
+
+def test_arc_without_direction_is_clockwise():
+    assert arc('CG,,0,1,-1,0').arc[2] is True
+
+
+def test_closed_arc_is_a_full_circle():
+    move = arc('CG,,1,0,-1,0,T,-1')
+    assert moveLength(move)[0] == pytest.approx(2 * math.pi)
+
+
+def test_repeated_arc_ends_unknown():
+    move = arc('CG,,0,1,-1,0,T,-1,0,3')
+    assert move.end == (None, None, None)
+    assert moveLength(move) == (0.0, 0.0)
+
+
+def test_arc_kind():
+    assert arc('CG,,0,1,-1,0,T,-1').kind == ARC
+
+
+def test_linear_axes():
+    position = (1.0, 2.0, 3.0)
+    expected = {
+        'J2,4,5': (4.0, 5.0, 3.0),
+        'J3,4,5,6': (4.0, 5.0, 6.0),
+        'JX,4': (4.0, 2.0, 3.0),
+        'JY,4': (1.0, 4.0, 3.0),
+        'JZ,4': (1.0, 2.0, 4.0),
+        'M2,4,5': (4.0, 5.0, 3.0),
+        'M3,4,5,6': (4.0, 5.0, 6.0),
+        'MX,4': (4.0, 2.0, 3.0),
+        'MY,4': (1.0, 4.0, 3.0),
+        'MZ,4': (1.0, 2.0, 4.0),
+        'M3,,5,': (1.0, 5.0, 3.0),
+    }
+    for line, end in expected.items():
+        move = parseMove(line, position, DEFAULT_MOVE_SPEED, DEFAULT_JOG_SPEED)
+        assert move.end == end, line
+        assert move.rapid == line.startswith('J'), line
+        assert move.kind == (RAPID if move.rapid else FEED)
+
+
+def test_lowercase_commands():
+    move = parseMove('m2, 4, 5', (0.0, 0.0, 0.0), DEFAULT_MOVE_SPEED, DEFAULT_JOG_SPEED)
+    assert move.end == (4.0, 5.0, 0.0)
+
+
+def test_other_lines_are_not_moves():
+    for line in ("'comment", 'MS,1,1', '&Tool = 2', 'C6', ''):
+        assert parseMove(line, (0.0, 0.0, 0.0), DEFAULT_MOVE_SPEED, DEFAULT_JOG_SPEED) is None
+
+
+def test_move_and_jog_speeds():
+    program = moves(['J3,0,0,1', 'M2,1,0', 'MS,2,0.5', 'M2,2,0', 'JS,4', 'J2,0,0', 'MS,,0.25', 'MZ,0'])
+    assert program[0].speed == DEFAULT_JOG_SPEED
+    assert program[1].speed == DEFAULT_MOVE_SPEED
+    assert program[2].speed == (2.0, 0.5)
+    assert program[3].speed == (4.0, DEFAULT_JOG_SPEED[1])
+    assert program[4].speed == (2.0, 0.25)
+
+
+def test_move_seconds():
+    first, second, third = moves(['J3,0,0,1', 'MS,2,0.5', 'M2,4,0', 'MZ,0'])
+    assert moveSeconds(second) == pytest.approx(2.0)
+    assert moveSeconds(third) == pytest.approx(2.0)
+    assert moveSeconds(first) == 0.0
+
+
+def test_unknown_start():
+    first, = moves(['M2,1,1'])
+    assert first.end == (1.0, 1.0, None)
+    assert moveLength(first) == (0.0, 0.0)
+
+
+def test_summary():
+    stats = summarizeProgram([
+        "'header", '&Tool = 3', 'J3,0,0,1', 'MS,2,1', 'MZ,0', 'M2,4,0', 'JZ,1',
+    ]).summary()
+    assert stats['lines'] == 7
+    assert stats['moves'] == 4
+    assert stats['bounds'] == {'min': [0.0, 0.0, 0.0], 'max': [4.0, 0.0, 1.0]}
+    assert stats['cutLength'] == pytest.approx(5.0)
+    assert stats['rapidLength'] == pytest.approx(1.0)
+    assert stats['cutSeconds'] == pytest.approx(3.0)
+    assert stats['feed']['mean'] == pytest.approx(2.0)
+    assert set(stats['toolSeconds']) == {'3'}
+
+
+def test_move_array():
+    collected = MoveArray()
+    summarizeProgram(['M2,1,1', 'J3,0,0,1'], collected)
+    assert len(collected) == 2
+    kind, x, y, z, feed = collected[0]
+    assert (kind, x, y) == (FEED, 1.0, 1.0)
+    assert math.isnan(z)
+    assert collected[1][:4] == (RAPID, 0.0, 0.0, 1.0)
@@ -0,0 +1,61 @@
+import math
+
+import pytest
+
+from bridge.SbpReader import ARC, FEED, RAPID
+from bridge.ToolpathFile import ToolpathFile, toolpathPath, writeToolpath
+
+PROGRAM = [
+    "'header",
+    'M2,1,1',
+    'J3,0,0,1',
+    'MS,2,1',
+    'MZ,0',
+    'M2,1,0',
+    'CG,,1,0,-0.5,0,T,1',
+    'JZ,1',
+]
+
+
+@pytest.fixture
+def program(tmp_path):
+    path = tmp_path / 'program.sbp'
+    path.write_text('\n'.join(PROGRAM) + '\n')
+    return str(path)
+
+
+def test_records(program):
+    path = writeToolpath(program)
+    assert path == toolpathPath(program)
+    with ToolpathFile(path) as toolpath:
+        assert len(toolpath) == 6
+        first = toolpath[0]
+        assert (first.line, first.kind, first.x, first.y) == (1, FEED, 1.0, 1.0)
+        assert math.isnan(first.z)
+        assert [record.kind for record in toolpath] == [FEED, RAPID, FEED, FEED, ARC, RAPID]
+        assert toolpath[4].feed == 2.0
+        assert toolpath[-1] == toolpath[5]
+        with pytest.raises(IndexError):
+            toolpath[6]
+
+
+def test_line_range(program):
+    with ToolpathFile(writeToolpath(program)) as toolpath:
+        assert toolpath.lineRange(0, 0) == (0, 0)
+        assert toolpath.lineRange(3, 5) == (2, 4)
+        assert toolpath.lineRange(0, 100) == (0, 6)
+
+
+def test_slices(program):
+    with ToolpathFile(writeToolpath(program)) as toolpath:
+        recordSize = len(toolpath.records(0, 1))
+        assert len(toolpath.records(2, 5)) == 3 * recordSize
+        assert len(toolpath.records(5, 2)) == 0
+        assert [len(chunk) // recordSize for chunk in toolpath.chunks(4)] == [4, 2]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.sbpt'
+    path.write_bytes(b'\0' * 32)
+    with pytest.raises(ValueError):
+        ToolpathFile(str(path))
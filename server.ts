@@ -4,6 +4,7 @@ import * as express from 'express';
 import { Request, Response } from 'express';
 import * as cors from 'cors';
 import * as fs from 'fs';
+import * as crypto from 'crypto';
 import { exec } from 'child_process'
 import { WebSocket } from 'ws';
 
@@ -351,50 +352,361 @@ app.put('/overlay/homography', (req, res) => {
     }
 });
 
-let latestCommand: any = null;
+interface FusionCommand {
+    id: number;
+    command: any;
+}
+
+// Commands from the notebook, in arrival order. A command stays queued
+// until the notebook bridge acknowledges its id.
+let fusionCommandQueue: FusionCommand[] = [];
+let nextFusionCommandId = 1;
+// Command ids start over at 1 whenever the server restarts. Every poll
+// answer carries this id so the bridge can tell a restart happened and
+// drop the high-water mark it kept from the previous run.
+const fusionSessionId = crypto.randomBytes(8).toString('hex');
 let latestSbp: string | null = null;
 
+// Upper bound on how long a long-poll from the notebook bridge is held open
+// before we answer with standby and let the bridge re-arm.
+const maxFusionPollHoldMs = 30000;
+let fusionPollWaiters: (() => void)[] = [];
+
+function wakeFusionPollWaiters() {
+    let waiters = fusionPollWaiters;
+    fusionPollWaiters = [];
+    waiters.forEach(wake => wake());
+}
+
+// Answers with every queued command whose id is greater than ?after=<id>.
+// An ?after from another ?session=<id> refers to ids this server never
+// issued, so it is ignored and the whole queue is sent. With ?hold=<ms>,
+// the request is held open until a command arrives or the hold elapses.
 app.get('/fusion360/poll', (req, res) => {
-    if (!latestCommand) {
+    let holdMs = Math.min(Number(req.query.hold) || 0, maxFusionPollHoldMs);
+    let after = req.query.session === fusionSessionId ? Number(req.query.after) || 0 : 0;
+    let pendingCommands = () => {
+        return fusionCommandQueue.filter(c => c.id > after);
+    };
+    let respond = () => {
+        let commands = pendingCommands();
+        if (commands.length === 0) {
+            res.status(200).send({
+                status: 'standby',
+                session: fusionSessionId
+            });
+        }
+        else {
+            res.status(200).send({
+                status: 'commands',
+                session: fusionSessionId,
+                commands: commands
+            });
+        }
+    };
+    if (pendingCommands().length > 0 || holdMs <= 0) {
+        respond();
+        return;
+    }
+    let wake = () => {
+        clearTimeout(timer);
+        respond();
+    };
+    let timer = setTimeout(() => {
+        fusionPollWaiters = fusionPollWaiters.filter(w => w !== wake);
+        respond();
+    }, holdMs);
+    fusionPollWaiters.push(wake);
+    res.on('close', () => {
+        if (!res.writableEnded) {
+            clearTimeout(timer);
+            fusionPollWaiters = fusionPollWaiters.filter(w => w !== wake);
+        }
+    });
+});
+
+app.put('/fusion360/command', (req, res) => {
+    let id = nextFusionCommandId;
+    nextFusionCommandId += 1;
+    fusionCommandQueue.push({
+        id: id,
+        command: req.body
+    });
+    wakeFusionPollWaiters();
+    res.status(200).send({
+        message: "Saved the command.",
+        id: id
+    })
+});
+
+// The bridge acknowledges every command up to and including body.id.
+// An acknowledgement for another body.session is for ids this server never
+// issued and must not drop the commands now queued under them.
+app.put('/fusion360/ack', (req, res) => {
+    let id = Number(req.body && req.body.id);
+    if (!Number.isInteger(id)) {
+        res.status(400).send({
+            message: `Invalid acknowledgement: ${JSON.stringify(req.body)}`
+        });
+    }
+    else if (req.body.session !== fusionSessionId) {
+        res.status(409).send({
+            message: `Acknowledgement is for session ${req.body.session}, not ${fusionSessionId}.`,
+            remaining: fusionCommandQueue.length
+        });
+    }
+    else {
+        fusionCommandQueue = fusionCommandQueue.filter(c => c.id > id);
         res.status(200).send({
-            status: 'standby',
+            message: `Acknowledged commands up to ${id}.`,
+            remaining: fusionCommandQueue.length
+        });
+    }
+});
+
+type BridgeStatus = 'idle' | 'busy';
+
+interface BridgeState {
+    status: BridgeStatus;
+    commandId: number | null;
+    since: number;
+}
+
+let bridgeState: BridgeState = {
+    status: 'idle',
+    commandId: null,
+    since: Date.now()
+};
+
+// The bridge reports busy while it works through a long batch of commands,
+// instead of polling for more.
+app.get('/fusion360/bridge', (req, res) => {
+    res.status(200).send({
+        ...bridgeState,
+        queuedCommands: fusionCommandQueue.length
+    });
+});
+
+app.put('/fusion360/bridge', (req, res) => {
+    let status = req.body && req.body.status;
+    if (status !== 'idle' && status !== 'busy') {
+        res.status(400).send({
+            message: `Invalid bridge status: ${JSON.stringify(req.body)}`
         });
     }
     else {
-        res.status(200).send(latestCommand);
-        latestCommand = null;
+        bridgeState = {
+            status: status,
+            commandId: Number(req.body.commandId) || null,
+            since: Date.now()
+        };
+        res.status(200).send({
+            message: `Bridge is ${status}.`
+        });
     }
 });
 
-app.put('/fusion360/command', (req, res) => {
-    latestCommand = req.body;
+interface ToolpathProgress {
+    setups: string[];
+    completed: number;
+    total: number;
+    percent: number;
+    done: boolean;
+}
+
+let latestToolpathProgress: ToolpathProgress | null = null;
+
+app.get('/fusion360/progress', (req, res) => {
+    if (!latestToolpathProgress) {
+        res.status(200).send({
+            status: 'standby'
+        });
+    }
+    else {
+        res.status(200).send(latestToolpathProgress);
+    }
+});
+
+app.put('/fusion360/progress', (req, res) => {
+    latestToolpathProgress = req.body;
     res.status(200).send({
-        message: "Saved the command."
-    })
+        message: 'Saved toolpath progress.'
+    });
+});
+
+interface MachiningTime {
+    seconds: number;
+    feedSeconds: number;
+    rapidSeconds: number;
+    toolChanges: number;
+}
+
+interface SetupMachiningTime {
+    // Fusion's CAM estimate, with a breakdown per operation.
+    fusion: MachiningTime & { operations: Record<string, MachiningTime> };
+    // Estimate from the posted program with acceleration limits, per tool.
+    sbp: MachiningTime & { tools: Record<string, number> };
+    reportedAt: number;
+}
+
+// Machining time of each posted setup, by setup name.
+let machiningTimes: Record<string, SetupMachiningTime> = {};
+
+app.get('/fusion360/machining-time', (req, res) => {
+    res.status(200).send(machiningTimes);
+});
+
+app.put('/fusion360/machining-time', (req, res) => {
+    let { setup, fusion, sbp } = req.body;
+    if (typeof setup !== 'string') {
+        res.status(400).send({
+            message: 'Expected the name of the setup the machining time is for.'
+        });
+        return;
+    }
+    machiningTimes[setup] = { fusion, sbp, reportedAt: Date.now() };
+    res.status(200).send({
+        message: `Saved the machining time of ${setup}.`
+    });
+});
+
+interface UploadedSbp {
+    hash: string;
+    uploadedAt: number;
+    // Summary of the program computed by the bridge: bounds, cut and
+    // rapid length, estimated seconds per tool and feed statistics.
+    stats?: object;
+}
+
+function parseSbpStats(stats: string | undefined): object | undefined {
+    try {
+        return stats ? JSON.parse(stats) : undefined;
+    }
+    catch {
+        return undefined;
+    }
+}
+
+// Programs uploaded by the notebook bridge, by the sha256 of their content.
+// Map iteration order doubles as recency: the least recently used program
+// comes first and is evicted once the total size is over the limit.
+let sbpPrograms: Map<string, string> = new Map();
+let sbpProgramBytes = 0;
+const maxSbpProgramBytes = 512 * 1024 * 1024;
+
+// The program each name was last posted as.
+let uploadedSbps: Record<string, UploadedSbp> = {};
+
+function touchSbpProgram(hash: string): string | undefined {
+    let program = sbpPrograms.get(hash);
+    if (program !== undefined) {
+        sbpPrograms.delete(hash);
+        sbpPrograms.set(hash, program);
+    }
+    return program;
+}
+
+function storeSbpProgram(hash: string, program: string) {
+    if (touchSbpProgram(hash) !== undefined) {
+        return;
+    }
+    sbpPrograms.set(hash, program);
+    sbpProgramBytes += program.length;
+    // Always keep the newest program, even if it alone is over the limit.
+    for (let [oldHash, oldProgram] of sbpPrograms) {
+        if (sbpProgramBytes <= maxSbpProgramBytes || oldHash === hash) {
+            break;
+        }
+        sbpPrograms.delete(oldHash);
+        sbpProgramBytes -= oldProgram.length;
+    }
+}
+
+app.put('/fusion360/sbp/:filename',
+        express.raw({ type: 'application/octet-stream', limit: '200mb' }),
+        (req, res) => {
+    if (!Buffer.isBuffer(req.body)) {
+        res.status(400).send({
+            message: 'Expected the SBP program as an application/octet-stream body.'
+        });
+        return;
+    }
+    let hash = crypto.createHash('sha256').update(req.body).digest('hex');
+    let claimedHash = req.header('X-Content-SHA256');
+    if (claimedHash && claimedHash !== hash) {
+        res.status(400).send({
+            message: `SBP upload for ${req.params.filename} is corrupt: expected`
+                      + ` hash ${claimedHash}, got ${hash}.`
+        });
+        return;
+    }
+    storeSbpProgram(hash, req.body.toString());
+    uploadedSbps[req.params.filename] = {
+        hash: hash,
+        uploadedAt: Date.now(),
+        stats: parseSbpStats(req.header('X-Program-Stats'))
+    };
+    res.status(200).send({
+        message: `Saved ${req.params.filename}.sbp.`,
+        hash: hash
+    });
+});
+
+// Lets the bridge re-post a program the server already holds by its hash
+// alone. Answers 404 when the content is unknown so the bridge uploads it.
+app.put('/fusion360/sbp/:filename/ref', (req, res) => {
+    let hash = req.body && req.body.hash;
+    if (typeof hash !== 'string' || touchSbpProgram(hash) === undefined) {
+        res.status(404).send({
+            message: `No SBP program with hash ${hash}, please upload it.`
+        });
+        return;
+    }
+    uploadedSbps[req.params.filename] = {
+        hash: hash,
+        uploadedAt: Date.now(),
+        stats: req.body.stats
+    };
+    res.status(200).send({
+        message: `Saved ${req.params.filename}.sbp.`,
+        hash: hash
+    });
 });
 
+// Programs uploaded by the bridge are posted again, by hash, on every export,
+// so the latest upload under a name is current however old it is. Only a
+// program read from disk, which nothing keeps current, is refused by age.
+function sendSbp(res: Response, program: string, generatedAt: number, hash?: string, stats?: object, checkAge = true) {
+    let msToHours = 2.77778e-7;
+    let ageInHours = (Date.now() - generatedAt) * msToHours;
+    let maxHourThreshold = 1;
+    if (checkAge && ageInHours > maxHourThreshold) {
+        res.status(500).send({
+            message: `The toolpath is ${ageInHours} hour(s) old, over the limit`
+                      + ` of ${maxHourThreshold} hour(s) old. Please regenerate.`
+        });
+    }
+    else {
+        let instructions = program.split('\r\n');
+        res.status(200).send({
+            instructions, ageInHours, hash, stats
+        });
+    }
+}
+
 app.get('/fusion360/sbp/:filename', (req, res) => {
+    let uploaded = uploadedSbps[req.params.filename];
+    let program = uploaded && touchSbpProgram(uploaded.hash);
+    if (uploaded && program !== undefined) {
+        sendSbp(res, program, uploaded.uploadedAt, uploaded.hash, uploaded.stats, false);
+        return;
+    }
     try {
         let path = `./fusion360/${req.params.filename}.sbp`;
         let sbpFile = fs.readFileSync(path);
         let stats = fs.statSync(path);
         if (sbpFile) {
-            let generatedAt = stats.ctimeMs;
-            let msToHours = 2.77778e-7;
-            let ageInHours = (Date.now() - generatedAt) * msToHours;
-            let maxHourThreshold = 1;
-            if (ageInHours > maxHourThreshold) {
-                res.status(500).send({
-                    message: `The toolpath is ${ageInHours} hour(s) old, over the limit`
-                              + ` of ${maxHourThreshold} hour(s) old. Please regenerate.`
-                });
-            }
-            else {
-                let instructions = sbpFile.toString().split('\r\n');
-                res.status(200).send({
-                    instructions, ageInHours
-                });
-            }
+            sendSbp(res, sbpFile.toString(), stats.ctimeMs);
         }
     }
     catch {
@@ -555,8 +867,12 @@ function generateGCodes() {
     });
 }
 
-app.listen(port, () => {
+const server = app.listen(port, () => {
     console.log(`Exprimer Server listening on port ${port}`);
     //watchKicadPcbFile(pcbPath());
     //compilePCB();
 });
+// The notebook bridge keeps its connection open between polls; keep idle
+// sockets around longer than its poll interval so they can be reused.
+server.keepAliveTimeout = 65000;
+server.headersTimeout = 66000;